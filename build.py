@@ -1,4 +1,16 @@
-from pybuilder.core import use_plugin, init
+import os
+import sys
+import imp
+import time
+import struct
+import marshal
+import pkgutil
+import zipfile
+import subprocess
+from distutils import sysconfig
+from modulefinder import ModuleFinder
+
+from pybuilder.core import use_plugin, init, task, depends, description
 
 use_plugin("python.core")
 use_plugin("python.unittest")
@@ -15,6 +27,9 @@ summary = 'Icinga plugin for sending alarming tickets to Jira'
 
 default_task = ["analyze", "publish"]
 
+PLUGIN_MODULE = 'icinga2jira'
+METADATA_FILES = ['METADATA', 'PKG-INFO', 'top_level.txt']
+
 
 @init
 def set_properties(project):
@@ -26,6 +41,11 @@ def set_properties(project):
     project.set_property('copy_resources_target', '$dir_dist')
     project.get_property('copy_resources_glob').extend(['setup.cfg'])
     project.install_file('/usr/lib64/icinga/plugins', 'icinga2jira.py')
+    project.set_property('zipapp_file', '$dir_target/icinga2jira.pyz')
+    project.set_property('zipapp_interpreter', '/usr/bin/python -S')
+    project.set_property('zipapp_dynamic_packages', ['pkg_resources._vendor'])
+    project.set_property('startup_benchmark_script', '/usr/lib64/icinga/plugins/icinga2jira.py')
+    project.set_property('startup_benchmark_runs', 20)
 
 
 @init(environments='teamcity')
@@ -33,3 +53,128 @@ def set_properties_for_teamcity_builds(project):
     import os
     project.version = '%s-%s' % (project.version, os.environ.get('BUILD_NUMBER', 0))
     project.default_task = ['install_dependencies', 'publish']
+
+
+class PluginModuleFinder(ModuleFinder):
+
+    def load_module(self, fqname, fp, pathname, file_info):
+        try:
+            return ModuleFinder.load_module(self, fqname, fp, pathname, file_info)
+        except SyntaxError:
+            # Python 3 only modules (e.g. jinja2.asyncsupport) are imported conditionally
+            return None
+
+
+def find_plugin_modules(source_dir, dynamic_packages):
+    finder = PluginModuleFinder(path=[source_dir] + sys.path)
+    finder.run_script(os.path.join(source_dir, PLUGIN_MODULE + '.py'))
+    for package in dynamic_packages:
+        finder.import_hook(package)
+        for _, module_name, _ in pkgutil.walk_packages(finder.modules[package].__path__,
+                                                       package + '.'):
+            try:
+                finder.import_hook(module_name)
+            except ImportError:
+                pass
+
+    standard_lib = tuple(os.path.realpath(sysconfig.get_python_lib(plat_specific=plat_specific,
+                                                                   standard_lib=True))
+                         for plat_specific in (False, True))
+    site_packages = tuple(os.path.realpath(sysconfig.get_python_lib(plat_specific=plat_specific))
+                          for plat_specific in (False, True))
+    modules = []
+    for module_name, module in sorted(finder.modules.items()):
+        if not module.__file__:
+            continue
+        path = os.path.realpath(module.__file__)
+        if path.startswith(standard_lib) and not path.startswith(site_packages):
+            continue
+        if module_name == '__main__':
+            module_name = PLUGIN_MODULE
+        modules.append((module_name, path, module.__path__ is not None))
+    return modules
+
+
+def compile_module(path, archive_path):
+    with open(path, 'rU') as source_file:
+        code = compile(source_file.read() + '\n', archive_path, 'exec')
+    return imp.get_magic() + struct.pack('<I', int(os.stat(path).st_mtime)) + marshal.dumps(code)
+
+
+def distribution_metadata(top_level_names):
+    import pkg_resources
+    for distribution in pkg_resources.working_set:
+        if distribution.has_metadata('top_level.txt'):
+            provided = set(distribution.get_metadata_lines('top_level.txt'))
+        else:
+            provided = set([distribution.project_name])
+        if not provided.intersection(top_level_names) or not distribution.egg_info:
+            continue
+        for file_name in METADATA_FILES:
+            path = os.path.join(distribution.egg_info, file_name)
+            if os.path.isfile(path):
+                yield path, '%s/%s' % (os.path.basename(distribution.egg_info), file_name)
+
+
+@task
+@description('Builds icinga2jira.pyz, an executable zip archive with the precompiled plugin '
+             'and its dependencies')
+def zipapp(project, logger):
+    archive = project.expand_path(project.get_property('zipapp_file'))
+    modules = find_plugin_modules(project.expand_path('$dir_source_main_python'),
+                                  project.get_property('zipapp_dynamic_packages'))
+    top_level_names = set()
+    if not os.path.isdir(os.path.dirname(archive)):
+        os.makedirs(os.path.dirname(archive))
+    with open(archive, 'wb') as archive_file:
+        archive_file.write('#!%s\n' % project.get_property('zipapp_interpreter'))
+        zip_file = zipfile.ZipFile(archive_file, 'w', zipfile.ZIP_DEFLATED)
+        for module_name, path, is_package in modules:
+            if not path.endswith('.py'):
+                logger.warn('Skipping extension module %s, it cannot be imported from a zip '
+                            'archive' % module_name)
+                continue
+            archive_name = (module_name.replace('.', '/') + ('/__init__' if is_package else '') +
+                            '.pyc')
+            zip_file.writestr(archive_name,
+                              compile_module(path, os.path.join(archive, archive_name[:-1])))
+            top_level_names.add(module_name.split('.')[0])
+        for path, archive_name in distribution_metadata(top_level_names):
+            zip_file.write(path, archive_name)
+        zip_file.writestr('__main__.py', 'import %s\n%s.main()\n' % (PLUGIN_MODULE, PLUGIN_MODULE))
+        zip_file.close()
+    os.chmod(archive, 0o755)
+    logger.info('Wrote %s with %d modules from %d packages (%d bytes)' %
+                (archive, len(modules), len(top_level_names), os.path.getsize(archive)))
+
+
+def measure_startup(command, runs):
+    timings = []
+    with open(os.devnull, 'w') as devnull:
+        for _ in range(runs):
+            started_at = time.time()
+            subprocess.call(command, stdout=devnull, stderr=devnull)
+            timings.append(time.time() - started_at)
+    timings.sort()
+    return timings[0], timings[len(timings) // 2]
+
+
+@task
+@depends('zipapp')
+@description('Compares the startup time of icinga2jira.pyz with the plugin installed as a loose '
+             'script')
+def benchmark_startup(project, logger):
+    runs = int(project.get_property('startup_benchmark_runs'))
+    script = project.get_property('startup_benchmark_script')
+    if not os.path.exists(script):
+        script = project.expand_path('$dir_source_main_python', PLUGIN_MODULE + '.py')
+    archive = project.expand_path(project.get_property('zipapp_file'))
+    interpreter_options = project.get_property('zipapp_interpreter').split()[1:]
+    results = [('script %s' % script, measure_startup([sys.executable, script, '--help'], runs)),
+               ('archive %s' % archive,
+                measure_startup([sys.executable] + interpreter_options + [archive, '--help'],
+                                runs))]
+    for label, (fastest, median) in results:
+        logger.info('%s: fastest %.3fs, median %.3fs over %d runs' % (label, fastest, median, runs))
+    logger.info('Archive starts %.0f%% faster (median)' %
+                (100 * (1 - results[1][1][1] / results[0][1][1])))
@@ -1,20 +1,50 @@
 """
 Usage:
   icinga2jira.py ( -c config )
+  icinga2jira.py reconcile -c config --status-file STATUS
+  icinga2jira.py stats -c config
+  icinga2jira.py sync -c config
+  icinga2jira.py stream -c config
+  icinga2jira.py audit -c config (--label LABEL | --host HOST)
+  icinga2jira.py audit -c config --mttr [--host HOST]
+  icinga2jira.py audit -c config --reindex
 
 Options:
   -h --help                         Show this screen.
   -c, --config CONFIG               config file for plugin
+  --status-file STATUS              Icinga status file describing the current problems
+  --label LABEL                     show the audit log entries of an ICI# label
+  --host HOST                       show the audit log entries of a host
+  --mttr                            report the mean time to recovery from the audit log
+  --reindex                         rebuild the label and host indexes of the audit log
 
 """
 from __future__ import print_function
 
 import os
+import re
 import sys
+import json
+import time
+import socket
+import sqlite3
+import threading
 import ConfigParser
+import fcntl
+import mmap
+import struct
+import heapq
+import hashlib
 import textwrap
 from abc import ABCMeta, abstractmethod
-
+from array import array
+from collections import namedtuple
+from itertools import izip
+from contextlib import contextmanager
+from Queue import Queue, Empty, Full
+
+import requests
+from requests.adapters import HTTPAdapter
 from docopt import docopt
 from jira.client import JIRA
 from jira.exceptions import JIRAError
@@ -24,6 +54,48 @@ from jinja2 import Template
 MANDATORY_CONFIG_ENTRIES = [
     'url', 'username', 'password', 'jira_project_key', 'jira_issue_type']
 
+OPTIONAL_CONFIG_DEFAULTS = {
+    'metadata_cache_file': '',
+    'metadata_cache_ttl': '86400',
+    'state_db': '',
+    'host_correlation': 'false',
+    'correlation_delay': '10',
+    'comment_buffer_delay': '5',
+    'host_recovery_cascade': 'false',
+    'cascade_concurrency': '4',
+    'reconcile_page_size': '100',
+    'claim_store': '',
+    'claim_lease': '60',
+    'claim_retention': '3600',
+    'node_name': '',
+    'storm_threshold': '0',
+    'storm_window': '60',
+    'storm_flush_interval': '10',
+    'cache_dir': '',
+    'cache_max_entries': '1000',
+    'cache_max_bytes': '4194304',
+    'icinga_api_url': '',
+    'icinga_api_username': '',
+    'icinga_api_password': '',
+    'stream_workers': '4',
+    'stream_queue_size': '1000',
+    'sync_interval': '60',
+    'audit_log': '',
+    'jira_pool_size': '10',
+    'jira_rate_limit': '0',
+    'jira_max_failures': '5',
+    'jira_failure_cooldown': '30',
+}
+
+TRANSITION_CACHE_TTL = 3600
+LABEL_CACHE_TTL = 300
+
+TRUE_VALUES = ['1', 'yes', 'true', 'on']
+
+ROUTE_SECTION_PREFIX = 'route:'
+JIRA_SECTION_PREFIX = 'jira:'
+DEFAULT_JIRA_TARGET = 'default'
+
 
 class CantCloseTicketException(Exception):
     pass
@@ -33,7 +105,52 @@ class UnknownIssueException(Exception):
     pass
 
 
-class IcingaEnvironment(object):
+class JiraTargetUnavailable(Exception):
+    pass
+
+
+class IssueReference(namedtuple('IssueReference', 'key')):
+    __slots__ = ()
+
+    def __str__(self):
+        return self.key
+
+
+def run_concurrently(function, items, concurrency):
+    items = list(items)
+    if concurrency <= 1 or len(items) <= 1:
+        return [function(item) for item in items]
+
+    results = [None] * len(items)
+    errors = []
+    work = Queue()
+    for index, item in enumerate(items):
+        work.put((index, item))
+
+    def worker():
+        while True:
+            try:
+                index, item = work.get_nowait()
+            except Empty:
+                return
+            try:
+                results[index] = function(item)
+            except Exception as e:
+                errors.append(e)
+
+    threads = [threading.Thread(target=worker) for _ in range(min(concurrency, len(items)))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    if errors:
+        raise errors[0]
+    return results
+
+
+class IcingaEvent(object):
+    __slots__ = ()
+
     MAPPING = {'host_address': 'ICINGA_HOSTADDRESS',
                'host_name': 'ICINGA_HOSTNAME',
                'host_output': 'ICINGA_HOSTOUTPUT',
@@ -53,6 +170,49 @@ class IcingaEnvironment(object):
                }
 
     ICINGA_PREFIX = "ICI"
+    COMMENT_NOTIFICATION_TYPES = ['ACKNOWLEDGEMENT',
+                                  'FLAPPINGSTART', 'FLAPPINGSTOP', 'FLAPPINGDISABLED',
+                                  'DOWNTIMESTART', 'DOWNTIMEEND', 'DOWNTIMECANCELLED']
+
+    def has_new_problem(self):
+        return self.notification_type == 'PROBLEM'
+
+    def is_recovered(self):
+        return self.notification_type == 'RECOVERY'
+
+    def is_comment_notification(self):
+        return self.notification_type in self.COMMENT_NOTIFICATION_TYPES
+
+    def is_service_issue(self):
+        return self.service_problem_id or self.last_service_problem_id
+
+    def is_host_issue(self):
+        return not self.is_service_issue()
+
+    def get_recovery_last_problem_id(self):
+        if not self.is_recovered():
+            raise TypeError(
+                "Ticket does not act in recovery mode, but %s" % self.notification_type)
+        if self.is_service_issue():
+            return self.last_service_problem_id
+        return self.last_host_problem_id
+
+    def _create_icinga_label(self, icinga_id):
+        return "%s#%s#%s" % (self.ICINGA_PREFIX, icinga_id, self.host_name)
+
+    def get_jira_recovery_label(self):
+        return self._create_icinga_label(self.get_recovery_last_problem_id())
+
+    def create_labels_list(self):
+        labels = []
+        if self.is_service_issue():
+            labels.append(self._create_icinga_label(self.service_problem_id))
+        else:
+            labels.append(self._create_icinga_label(self.host_problem_id))
+        return labels
+
+
+class IcingaEnvironment(IcingaEvent):
 
     def __init__(self, environment):
         for attribute_name, argument_name in self.MAPPING.iteritems():
@@ -106,47 +266,1593 @@ class IcingaEnvironment(object):
         else:
             pass
 
-    def has_new_problem(self):
-        return self.notification_type == 'PROBLEM'
 
-    def is_recovered(self):
-        return self.notification_type == 'RECOVERY'
+class IcingaEventRow(IcingaEvent):
+    __slots__ = ('batch', 'index')
+
+    def __init__(self, batch, index):
+        self.batch = batch
+        self.index = index
+
+    def __getattr__(self, name):
+        if name not in self.MAPPING:
+            raise AttributeError(name)
+        return self.batch.value(name, self.index)
+
+    @property
+    def __dict__(self):
+        return self.batch.row_values(self.index)
+
+
+class IcingaEventBatch(object):
+    VALIDATED_FIELDS = ['host_name', 'service_state', 'service_problem_id',
+                        'host_state', 'host_problem_id',
+                        'last_service_problem_id', 'last_host_problem_id']
+
+    def __init__(self, environments=()):
+        self.values = [None]
+        self.value_ids = {None: 0}
+        self.columns = dict((field, array('I')) for field in IcingaEvent.MAPPING)
+        self.size = 0
+        self.errors = None
+        self.extend(environments)
+
+    def __len__(self):
+        return self.size
+
+    def append(self, environment):
+        self.extend([environment])
+
+    def extend(self, environments):
+        environments = list(environments)
+        value_ids = self.value_ids
+        for field, argument_name in IcingaEvent.MAPPING.iteritems():
+            values = [environment.get(argument_name) or None for environment in environments]
+            for value in set(values).difference(value_ids):
+                value_ids[value] = len(self.values)
+                self.values.append(value)
+            self.columns[field].extend([value_ids[value] for value in values])
+        self.size += len(environments)
+        self.errors = None
+
+    def value(self, field, index):
+        return self.values[self.columns[field][index]]
+
+    def row_values(self, index):
+        return dict((field, self.values[column[index]])
+                    for field, column in self.columns.iteritems())
+
+    def row(self, index):
+        if not 0 <= index < self.size:
+            raise IndexError(index)
+        return IcingaEventRow(self, index)
+
+    def rows(self):
+        errors = self.validate()
+        for index in xrange(self.size):
+            if index not in errors:
+                yield IcingaEventRow(self, index)
+
+    def validate(self):
+        if self.errors is None:
+            patterns = list(self.columns['notification_type'])
+            for field in self.VALIDATED_FIELDS:
+                patterns = [pattern * 2 + (value_id == 0) for pattern, value_id in
+                            izip(patterns, self.columns[field])]
+            messages = {}
+            for pattern in set(patterns):
+                messages[pattern] = self._pattern_error(pattern)
+            self.errors = dict((index, messages[pattern]) for index, pattern in enumerate(patterns)
+                               if messages[pattern] is not None)
+        return self.errors
+
+    def _pattern_error(self, pattern):
+        environment = {}
+        for field in reversed(self.VALIDATED_FIELDS):
+            if not pattern % 2:
+                environment[IcingaEvent.MAPPING[field]] = field
+            pattern //= 2
+        environment[IcingaEvent.MAPPING['notification_type']] = self.values[pattern]
+        try:
+            IcingaEnvironment(environment)
+        except ValueError as e:
+            return str(e)
+        return None
+
+
+def _estimate_size(value):
+    if isinstance(value, dict):
+        return sys.getsizeof(value) + sum(_estimate_size(key) + _estimate_size(item)
+                                          for key, item in value.iteritems())
+    if isinstance(value, (list, tuple, set, frozenset)):
+        return sys.getsizeof(value) + sum(_estimate_size(item) for item in value)
+    return sys.getsizeof(value)
+
+
+class Cache(object):
+    PREVIOUS, NEXT, KEY, VALUE, SIZE, EXPIRES_AT = range(6)
+    COUNTERS = ['hits', 'misses', 'evictions', 'expirations']
+
+    def __init__(self, name, max_entries=1000, max_bytes=0, ttl=0, persist_file=None,
+                 clock=time.time, persist_entries=True):
+        self.name = name
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.persist_file = persist_file
+        self.persist_entries = persist_entries
+        self.clock = clock
+        self.lock = threading.RLock()
+        self.clear()
+        self.counters = dict((counter, 0) for counter in self.COUNTERS)
+        self.load()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def clear(self):
+        with self.lock:
+            self.entries = {}
+            self.bytes = 0
+            self.root = []
+            self.root[:] = [self.root, self.root, None, None, 0, 0]
+
+    def get(self, key, default=None):
+        with self.lock:
+            node = self.entries.get(key)
+            if node is not None and node[self.EXPIRES_AT] and node[self.EXPIRES_AT] <= self.clock():
+                self._remove(node)
+                self.counters['expirations'] += 1
+                node = None
+            if node is None:
+                self.counters['misses'] += 1
+                return default
+            self._unlink(node)
+            self._append(node)
+            self.counters['hits'] += 1
+            return node[self.VALUE]
+
+    def set(self, key, value, ttl=None):
+        ttl = self.ttl if ttl is None else ttl
+        with self.lock:
+            if key in self.entries:
+                self._remove(self.entries[key])
+            node = [None, None, key, value, _estimate_size(key) + _estimate_size(value),
+                    self.clock() + ttl if ttl else 0]
+            self._append(node)
+            self.entries[key] = node
+            self.bytes += node[self.SIZE]
+            while self.entries and (len(self.entries) > self.max_entries or
+                                    (self.max_bytes and self.bytes > self.max_bytes)):
+                self._remove(self.root[self.NEXT])
+                self.counters['evictions'] += 1
+
+    def get_or_load(self, key, loader):
+        missing = object()
+        value = self.get(key, missing)
+        if value is missing:
+            value = loader()
+            self.set(key, value)
+        return value
+
+    def invalidate(self, key):
+        with self.lock:
+            if key in self.entries:
+                self._remove(self.entries[key])
+
+    def stats(self):
+        with self.lock:
+            stats = dict(self.counters)
+            stats.update({'name': self.name, 'entries': len(self.entries), 'bytes': self.bytes})
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_rate'] = float(stats['hits']) / lookups if lookups else 0.0
+        return stats
+
+    def format_stats(self):
+        return ("%(name)s: %(entries)d entries, %(bytes)d bytes, %(hits)d hits, %(misses)d misses, "
+                "%(evictions)d evictions, %(expirations)d expirations, hit rate %(hit_rate).1f%%" %
+                dict(self.stats(), hit_rate=100 * self.stats()['hit_rate']))
+
+    def load(self):
+        if not self.persist_file:
+            return
+        try:
+            with open(self.persist_file) as file_pointer:
+                data = json.load(file_pointer)
+            now = self.clock()
+            for key, value, expires_at in data['entries'] if self.persist_entries else []:
+                if not expires_at or expires_at > now:
+                    self.set(key, value, expires_at - now if expires_at else 0)
+            for counter in self.COUNTERS:
+                self.counters[counter] = int(data['stats'].get(counter, 0))
+        except (IOError, ValueError, KeyError, TypeError):
+            self.clear()
+
+    def save(self):
+        if not self.persist_file:
+            return
+        with self.lock:
+            entries = []
+            node = self.root[self.NEXT] if self.persist_entries else self.root
+            while node is not self.root:
+                entries.append([node[self.KEY], node[self.VALUE], node[self.EXPIRES_AT]])
+                node = node[self.NEXT]
+            data = {'entries': entries, 'stats': dict(self.counters)}
+        temporary_file = "%s.%d" % (self.persist_file, os.getpid())
+        try:
+            with open(temporary_file, 'w') as file_pointer:
+                json.dump(data, file_pointer)
+            os.rename(temporary_file, self.persist_file)
+        except (IOError, OSError, TypeError, ValueError) as e:
+            print("WARNING: could not write %s cache %s: %s" % (self.name, self.persist_file, e))
 
-    def is_service_issue(self):
-        return self.service_problem_id or self.last_service_problem_id
+    def _append(self, node):
+        last = self.root[self.PREVIOUS]
+        node[self.PREVIOUS], node[self.NEXT] = last, self.root
+        last[self.NEXT] = self.root[self.PREVIOUS] = node
 
-    def is_host_issue(self):
-        return not self.is_service_issue()
+    def _unlink(self, node):
+        node[self.PREVIOUS][self.NEXT] = node[self.NEXT]
+        node[self.NEXT][self.PREVIOUS] = node[self.PREVIOUS]
 
-    def get_recovery_last_problem_id(self):
-        if not self.is_recovered():
-            raise TypeError(
-                "Ticket does not act in recovery mode, but %s" % self.notification_type)
-        if self.is_service_issue():
-            return self.last_service_problem_id
-        return self.last_host_problem_id
+    def _remove(self, node):
+        self._unlink(node)
+        del self.entries[node[self.KEY]]
+        self.bytes -= node[self.SIZE]
 
-    def _create_icinga_label(self, icinga_id):
-        return "%s#%s#%s" % (self.ICINGA_PREFIX, icinga_id, self.host_name)
 
-    def get_jira_recovery_label(self):
-        return self._create_icinga_label(self.get_recovery_last_problem_id())
+class CacheRegistry(object):
 
-    def create_labels_list(self):
-        labels = []
-        if self.is_service_issue():
-            labels.append(self._create_icinga_label(self.service_problem_id))
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.caches = {}
+        self.configure()
+
+    def configure(self, cache_dir=None, max_entries=1000, max_bytes=0):
+        self.cache_dir = cache_dir
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+
+    def get(self, name, ttl=0, persist=False):
+        with self.lock:
+            if name not in self.caches:
+                persist_file = None
+                if self.cache_dir:
+                    persist_file = os.path.join(self.cache_dir, '%s.json' % name)
+                self.caches[name] = Cache(name, self.max_entries, self.max_bytes, ttl, persist_file,
+                                          persist_entries=persist)
+            return self.caches[name]
+
+    def register(self, cache):
+        with self.lock:
+            self.caches[cache.name] = cache
+        return cache
+
+    def clear(self):
+        with self.lock:
+            self.caches = {}
+
+    def save_all(self):
+        for cache in self.caches.values():
+            cache.save()
+
+    def format_stats(self):
+        return [self.caches[name].format_stats() for name in sorted(self.caches)]
+
+
+CACHES = CacheRegistry()
+
+
+def namespaced_cache_key(namespace, key):
+    if not namespace:
+        return key
+    return "%s|%s" % (namespace, key)
+
+
+class JiraMetadataCache(object):
+
+    def __init__(self, jira, cache_file=None, ttl=86400, clock=time.time, namespace=None):
+        self.jira = jira
+        self.namespace = namespace
+        self.cache = CACHES.register(Cache('metadata', CACHES.max_entries, CACHES.max_bytes, ttl,
+                                           cache_file, clock))
+
+    def resolve(self, project_key, issue_type):
+        cache_key = namespaced_cache_key(self.namespace, "%s/%s" % (project_key, issue_type))
+        entry = self.cache.get(cache_key)
+        if entry is None:
+            entry = self._fetch(project_key, issue_type)
+            self.cache.set(cache_key, entry)
+            self.cache.save()
+        return entry
+
+    def _fetch(self, project_key, issue_type):
+        metadata = self.jira.createmeta(projectKeys=project_key,
+                                        issuetypeNames=issue_type,
+                                        expand='projects.issuetypes.fields')
+        for project in metadata.get('projects', []):
+            if project['key'] != project_key:
+                continue
+            for project_issue_type in project.get('issuetypes', []):
+                if project_issue_type['name'] != issue_type:
+                    continue
+                priority_field = project_issue_type.get('fields', {}).get('priority', {})
+                return {'project_id': project['id'],
+                        'issuetype_id': project_issue_type['id'],
+                        'priority_ids': [priority['id'] for priority
+                                         in priority_field.get('allowedValues', [])]}
+            raise ValueError("JIRA project %s does not have issue type '%s'" %
+                             (project_key, issue_type))
+        raise ValueError("JIRA project %s does not exist or is not accessible" % project_key)
+
+
+class Route(object):
+    GLOB_CHARACTERS = '*?['
+
+    def __init__(self, name, host, service=None, project_key=None, issue_type=None,
+                 labels=None, template=None, target=None):
+        self.name = name
+        self.host = host
+        self.service = service
+        self.project_key = project_key
+        self.issue_type = issue_type
+        self.labels = labels or []
+        self.template = template
+        self.target = target
+        self.service_regex = None
+        if service:
+            self.service_regex = re.compile(self.pattern_to_regex(service) + r'\Z')
+
+    @classmethod
+    def pattern_to_regex(cls, pattern):
+        if pattern.startswith('re:'):
+            return '(?:%s)' % pattern[3:]
+        regex = []
+        index = 0
+        while index < len(pattern):
+            character = pattern[index]
+            if character == '*':
+                regex.append('.*')
+            elif character == '?':
+                regex.append('.')
+            elif character == '[' and ']' in pattern[index + 2:]:
+                end = pattern.index(']', index + 2)
+                character_class = pattern[index + 1:end].replace('\\', '\\\\')
+                if character_class.startswith('!'):
+                    character_class = '^' + character_class[1:]
+                regex.append('[%s]' % character_class)
+                index = end
+            else:
+                regex.append(re.escape(character))
+            index += 1
+        return '(?:%s)' % ''.join(regex)
+
+    def is_exact_host(self):
+        return not self.host.startswith('re:') and not self._has_glob(self.host)
+
+    def is_host_prefix(self):
+        return (not self.host.startswith('re:') and self.host.endswith('*') and
+                not self._has_glob(self.host[:-1]))
+
+    def matches_service(self, service_description):
+        if self.service_regex is None:
+            return True
+        return self.service_regex.match(service_description or '') is not None
+
+    def _has_glob(self, pattern):
+        for character in self.GLOB_CHARACTERS:
+            if character in pattern:
+                return True
+        return False
+
+
+class Router(object):
+    REGEX_CHUNK_SIZE = 40
+
+    def __init__(self, routes):
+        self.routes = list(routes)
+        self._exact_hosts = {}
+        self._prefix_trie = {}
+        self._regex_chunks = []
+
+        regex_rules = []
+        for index, route in enumerate(self.routes):
+            if route.is_exact_host():
+                self._exact_hosts.setdefault(route.host, []).append(index)
+            elif route.is_host_prefix():
+                node = self._prefix_trie
+                for character in route.host[:-1]:
+                    node = node.setdefault(character, {})
+                node.setdefault(None, []).append(index)
+            else:
+                regex_rules.append(index)
+
+        for start in range(0, len(regex_rules), self.REGEX_CHUNK_SIZE):
+            chunk = regex_rules[start:start + self.REGEX_CHUNK_SIZE]
+            alternatives = []
+            for index in chunk:
+                route = self.routes[index]
+                service_regex = '.*'
+                if route.service:
+                    service_regex = Route.pattern_to_regex(route.service)
+                alternatives.append(r'(?P<r%d>%s\n%s\Z)' %
+                                    (index, Route.pattern_to_regex(route.host), service_regex))
+            self._regex_chunks.append((chunk[0], re.compile('|'.join(alternatives), re.M)))
+
+    def route(self, host_name, service_description=None):
+        host_name = host_name or ''
+        best = self._first_matching(self._exact_hosts.get(host_name, ()), service_description, None)
+
+        node = self._prefix_trie
+        best = self._first_matching(node.get(None, ()), service_description, best)
+        for character in host_name:
+            node = node.get(character)
+            if node is None:
+                break
+            best = self._first_matching(node.get(None, ()), service_description, best)
+
+        key = '%s\n%s' % (host_name, service_description or '')
+        for first_index, regex in self._regex_chunks:
+            if best is not None and first_index >= best:
+                break
+            match = regex.match(key)
+            if match:
+                index = int(match.lastgroup[1:])
+                if best is None or index < best:
+                    best = index
+                break
+
+        if best is None:
+            return None
+        return self.routes[best]
+
+    def _first_matching(self, candidates, service_description, best):
+        for index in candidates:
+            if best is not None and index >= best:
+                break
+            if self.routes[index].matches_service(service_description):
+                return index
+        return best
+
+
+def _connect_sqlite(path):
+    return sqlite3.connect(path, timeout=30, isolation_level=None, check_same_thread=False)
+
+
+@contextmanager
+def _immediate_transaction(connection):
+    connection.execute("BEGIN IMMEDIATE")
+    try:
+        yield connection
+    except Exception:
+        connection.execute("ROLLBACK")
+        raise
+    connection.execute("COMMIT")
+
+
+def _add_missing_column(connection, table, column, definition):
+    if column not in [row[1] for row in connection.execute("PRAGMA table_info(%s)" % table)]:
+        connection.execute("ALTER TABLE %s ADD COLUMN %s %s" % (table, column, definition))
+
+
+class JiraTargetAdapter(HTTPAdapter):
+
+    def __init__(self, target, **kwargs):
+        self.target = target
+        super(JiraTargetAdapter, self).__init__(**kwargs)
+
+    def send(self, request, **kwargs):
+        self.target.before_request()
+        try:
+            response = super(JiraTargetAdapter, self).send(request, **kwargs)
+        except (requests.ConnectionError, requests.Timeout):
+            self.target.record_failure()
+            raise
+        if response.status_code >= 500:
+            self.target.record_failure()
         else:
-            labels.append(self._create_icinga_label(self.host_problem_id))
-        return labels
+            self.target.record_success()
+        return response
+
+
+class JiraTarget(object):
+
+    def __init__(self, name, config, clock=time.time, sleep=time.sleep):
+        self.name = name
+        self.config = config
+        self.pool_size = int(config['jira_pool_size'])
+        self.rate_limit = float(config['jira_rate_limit'])
+        self.max_failures = int(config['jira_max_failures'])
+        self.failure_cooldown = float(config['jira_failure_cooldown'])
+        self.clock = clock
+        self.sleep = sleep
+        self.lock = threading.Lock()
+        self.session_lock = threading.Lock()
+        self.jira = None
+        self.failures = 0
+        self.unavailable_until = 0.0
+        self.next_request_at = 0.0
+
+    def session(self):
+        with self.session_lock:
+            if self.jira is None:
+                jira = open_jira_session(self.config['url'], self.config['username'],
+                                         self.config['password'])
+                adapter = JiraTargetAdapter(self, pool_connections=1, pool_maxsize=self.pool_size)
+                jira._session.mount('http://', adapter)
+                jira._session.mount('https://', adapter)
+                self.jira = jira
+            return self.jira
+
+    def before_request(self):
+        with self.lock:
+            now = self.clock()
+            if now < self.unavailable_until:
+                raise JiraTargetUnavailable("JIRA target %s is unavailable for another %.0fs" %
+                                            (self.name, self.unavailable_until - now))
+            wait = 0
+            if self.rate_limit > 0:
+                slot = max(now, self.next_request_at)
+                self.next_request_at = slot + 1.0 / self.rate_limit
+                wait = slot - now
+        if wait > 0:
+            self.sleep(wait)
+
+    def record_success(self):
+        with self.lock:
+            self.failures = 0
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            if self.max_failures > 0 and self.failures >= self.max_failures:
+                self.unavailable_until = self.clock() + self.failure_cooldown
+                self.failures = self.max_failures - 1
+
+    def is_available(self):
+        with self.lock:
+            return self.clock() >= self.unavailable_until
+
+
+class JiraTargets(object):
+
+    def __init__(self, targets, router):
+        self.targets = dict((target.name, target) for target in targets)
+        self.router = router
+        for route in router.routes:
+            if route.target and route.target not in self.targets:
+                raise ValueError('routing rule %s uses unknown JIRA target: %s' %
+                                 (route.name, route.target))
+
+    def names(self):
+        return sorted(self.targets)
+
+    def target(self, name):
+        return self.targets[name]
+
+    def target_for(self, icinga_environment):
+        route = self.router.route(icinga_environment.host_name,
+                                  icinga_environment.service_description)
+        if route is not None and route.target:
+            return route.target
+        return DEFAULT_JIRA_TARGET
+
+    def project_keys(self, name):
+        project_keys = [self.targets[name].config['jira_project_key']]
+        for route in self.router.routes:
+            if route.project_key and (route.target or DEFAULT_JIRA_TARGET) == name:
+                project_keys.append(route.project_key)
+        return project_keys
+
+
+class TicketIndex(object):
+
+    def __init__(self, path, target=DEFAULT_JIRA_TARGET, connection=None, lock=None):
+        self.path = path
+        self.target = target
+        self.lock = lock or threading.Lock()
+        self.connection = connection
+        if connection is not None:
+            return
+        self.connection = _connect_sqlite(path)
+        self.connection.execute("CREATE TABLE IF NOT EXISTS tickets ("
+                                "label TEXT PRIMARY KEY, host TEXT, issue_key TEXT, "
+                                "is_host INTEGER, correlated INTEGER, opened_at REAL)")
+        _add_missing_column(self.connection, 'tickets', 'storm', 'INTEGER DEFAULT 0')
+        _add_missing_column(self.connection, 'tickets', 'target',
+                            "TEXT DEFAULT '%s'" % DEFAULT_JIRA_TARGET)
+        self.connection.execute("CREATE INDEX IF NOT EXISTS tickets_by_host ON tickets (host)")
+        self.connection.execute("CREATE INDEX IF NOT EXISTS tickets_by_issue "
+                                "ON tickets (issue_key)")
+
+    def for_target(self, target):
+        return TicketIndex(self.path, target, self.connection, self.lock)
+
+    def add(self, label, host_name, issue_key, is_host=False, correlated=False, opened_at=None,
+            storm=False):
+        with self.lock:
+            self.connection.execute("INSERT OR REPLACE INTO tickets "
+                                    "(label, host, issue_key, is_host, correlated, opened_at, "
+                                    "storm, target) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                                    (label, host_name, issue_key, int(bool(is_host)),
+                                     int(bool(correlated)), opened_at or time.time(),
+                                     int(bool(storm)), self.target))
+
+    def find(self, label):
+        return self._select_keys("SELECT issue_key FROM tickets WHERE target = ? AND label = ? "
+                                 "AND correlated = 0", label)
+
+    def find_correlated(self, label):
+        keys = self._select_keys("SELECT issue_key FROM tickets WHERE target = ? AND label = ? "
+                                 "AND correlated = 1", label)
+        return keys[0] if keys else None
+
+    def find_open_host_issue(self, host_name):
+        keys = self._select_keys("SELECT issue_key FROM tickets "
+                                 "WHERE target = ? AND host = ? AND is_host = 1 "
+                                 "AND correlated = 0 AND storm = 0 ORDER BY opened_at DESC LIMIT 1",
+                                 host_name)
+        return keys[0] if keys else None
+
+    def find_by_host(self, host_name):
+        return self._select_keys("SELECT DISTINCT issue_key FROM tickets "
+                                 "WHERE target = ? AND host = ? "
+                                 "AND correlated = 0 AND storm = 0", host_name)
+
+    def remove(self, label):
+        with self.lock:
+            self.connection.execute("DELETE FROM tickets WHERE label = ? AND target = ?",
+                                    (label, self.target))
+
+    def remove_issue(self, issue_key):
+        with self.lock:
+            self.connection.execute("DELETE FROM tickets WHERE issue_key = ? AND target = ?",
+                                    (issue_key, self.target))
+
+    def _select_keys(self, query, *parameters):
+        with self.lock:
+            return [row[0] for row in self.connection.execute(query, (self.target,) + parameters)]
+
+
+def iter_issues(jira, jql, page_size=100, fields='labels'):
+    start_at = 0
+    while True:
+        page = jira.search_issues(jql, startAt=start_at, maxResults=page_size, fields=fields)
+        for issue in page:
+            yield issue
+        if len(page) < page_size:
+            return
+        start_at += len(page)
+
+
+class TicketIndexSync(object):
+    OVERLAP_MINUTES = 1
+
+    def __init__(self, jira, ticket_index, project_keys, page_size=100, clock=time.time):
+        self.jira = jira
+        self.ticket_index = ticket_index
+        self.project_keys = sorted(set(project_keys))
+        self.page_size = page_size
+        self.clock = clock
+        self.stopped = threading.Event()
+        self.thread = None
+        with ticket_index.lock:
+            ticket_index.connection.execute("CREATE TABLE IF NOT EXISTS ticket_index_sync "
+                                            "(last_sync REAL)")
+            _add_missing_column(ticket_index.connection, 'ticket_index_sync', 'target',
+                                "TEXT DEFAULT '%s'" % DEFAULT_JIRA_TARGET)
+
+    def warm_up(self):
+        if self.last_sync() is None:
+            return self.full_sync()
+        return self.incremental_sync()
+
+    def full_sync(self):
+        started_at = self.clock()
+        jql = ("%s AND resolution = Unresolved AND labels is not EMPTY ORDER BY key ASC" %
+               self._project_clause())
+        count = 0
+        for issue in iter_issues(self.jira, jql, self.page_size, 'labels,summary'):
+            count += self._index(issue)
+        self._set_last_sync(started_at)
+        return count
+
+    def incremental_sync(self):
+        started_at = self.clock()
+        minutes = int((started_at - self.last_sync()) / 60) + 1 + self.OVERLAP_MINUTES
+        jql = "%s AND updated >= -%dm ORDER BY updated ASC" % (self._project_clause(), minutes)
+        count = 0
+        for issue in iter_issues(self.jira, jql, self.page_size, 'labels,summary,resolution'):
+            if getattr(issue.fields, 'resolution', None):
+                self.ticket_index.remove_issue(issue.key)
+            else:
+                count += self._index(issue)
+        self._set_last_sync(started_at)
+        return count
+
+    def start(self, interval):
+        def run():
+            while True:
+                self.stopped.wait(interval)
+                if self.stopped.is_set():
+                    break
+                try:
+                    self.incremental_sync()
+                except Exception as e:
+                    print("WARNING: ticket index sync failed: %s" % e)
+        self.thread = threading.Thread(target=run)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def stop(self):
+        self.stopped.set()
+        if self.thread is not None:
+            self.thread.join()
+
+    def last_sync(self):
+        with self.ticket_index.lock:
+            row = self.ticket_index.connection.execute("SELECT last_sync FROM ticket_index_sync "
+                                                       "WHERE target = ?",
+                                                       (self.ticket_index.target,)).fetchone()
+        return row[0] if row else None
+
+    def _set_last_sync(self, last_sync):
+        with self.ticket_index.lock:
+            with _immediate_transaction(self.ticket_index.connection):
+                self.ticket_index.connection.execute("DELETE FROM ticket_index_sync "
+                                                     "WHERE target = ?",
+                                                     (self.ticket_index.target,))
+                self.ticket_index.connection.execute("INSERT INTO ticket_index_sync "
+                                                     "(last_sync, target) VALUES (?, ?)",
+                                                     (last_sync, self.ticket_index.target))
+
+    def _project_clause(self):
+        return "project in (%s)" % ', '.join('"%s"' % key for key in self.project_keys)
+
+    def _index(self, issue):
+        indexed = 0
+        summary = getattr(issue.fields, 'summary', None) or ''
+        storm = StormMode.STORM_LABEL in issue.fields.labels
+        for label in issue.fields.labels:
+            parts = label.split('#', 2)
+            if len(parts) != 3 or parts[0] != IcingaEnvironment.ICINGA_PREFIX:
+                continue
+            is_host = not storm and summary.startswith('ICINGA: %s is ' % parts[2])
+            self.ticket_index.add(label, parts[2], issue.key, is_host=is_host, storm=storm)
+            indexed += 1
+        return indexed
+
+
+class CommentBuffer(object):
+
+    def __init__(self, path, delay=5, sleep=time.sleep, scheduled=False, clock=time.time,
+                 target=DEFAULT_JIRA_TARGET):
+        self.delay = delay
+        self.sleep = sleep
+        self.scheduled = scheduled
+        self.clock = clock
+        self.target = target
+        self.pending = {}
+        self.lock = threading.Lock()
+        self.connection = _connect_sqlite(path)
+        self.connection.execute("CREATE TABLE IF NOT EXISTS pending_comments ("
+                                "id INTEGER PRIMARY KEY AUTOINCREMENT, issue_key TEXT, "
+                                "header TEXT, line TEXT)")
+        _add_missing_column(self.connection, 'pending_comments', 'target',
+                            "TEXT DEFAULT '%s'" % DEFAULT_JIRA_TARGET)
+        self.connection.execute("CREATE INDEX IF NOT EXISTS pending_comments_by_issue "
+                                "ON pending_comments (issue_key)")
+
+    def append(self, jira, issue_key, line, header=''):
+        with self.lock:
+            self.connection.execute("INSERT INTO pending_comments "
+                                    "(issue_key, header, line, target) VALUES (?, ?, ?, ?)",
+                                    (issue_key, header, line, self.target))
+            if self.scheduled:
+                self.pending.setdefault(issue_key, self.clock())
+                return False
+        self.sleep(self.delay)
+        return self.flush(jira, issue_key)
+
+    def flush_pending(self, jira):
+        now = self.clock()
+        with self.lock:
+            issue_keys = sorted(issue_key for issue_key, appended_at in self.pending.items()
+                                if appended_at + self.delay <= now)
+            for issue_key in issue_keys:
+                del self.pending[issue_key]
+        flushed = 0
+        for issue_key in issue_keys:
+            try:
+                if self.flush(jira, issue_key):
+                    flushed += 1
+            except Exception as e:
+                print("WARNING: could not add buffered comment to %s: %s" % (issue_key, e))
+                with self.lock:
+                    self.pending.setdefault(issue_key, now)
+        return flushed
+
+    def flush(self, jira, issue_key):
+        with self.lock:
+            with _immediate_transaction(self.connection):
+                rows = self.connection.execute("SELECT id, header, line FROM pending_comments "
+                                               "WHERE target = ? AND issue_key = ? ORDER BY id",
+                                               (self.target, issue_key)).fetchall()
+                self.connection.execute("DELETE FROM pending_comments "
+                                        "WHERE target = ? AND issue_key = ? AND id <= ?",
+                                        (self.target, issue_key, rows[-1][0] if rows else 0))
+        if not rows:
+            return False
+        try:
+            jira.add_comment(issue_key, self._format_comment(rows))
+        except Exception:
+            with self.lock:
+                self.connection.executemany("INSERT INTO pending_comments "
+                                            "(issue_key, header, line, target) VALUES (?, ?, ?, ?)",
+                                            [(issue_key, header, line, self.target)
+                                             for _, header, line in rows])
+            raise
+        return True
+
+    def _format_comment(self, rows):
+        lines = []
+        header = None
+        for _, row_header, line in rows:
+            if row_header and row_header != header:
+                header = row_header
+                lines.append(header)
+            lines.append(line)
+        return '\n'.join(lines)
+
+
+class HostCorrelator(object):
+    COMMENT_HEADER = ('{color:#3b0b0b}*Icinga service alerts correlated with this host problem*'
+                      '{color}')
+    HOST_UP_STATES = [None, '', 'UP']
+
+    def __init__(self, ticket_index, comment_buffer, delay=10, clock=time.time, sleep=time.sleep):
+        self.ticket_index = ticket_index
+        self.comment_buffer = comment_buffer
+        self.delay = delay
+        self.clock = clock
+        self.sleep = sleep
+
+    def find_parent_issue(self, icinga_environment):
+        if icinga_environment.is_recovered():
+            return self.ticket_index.find_correlated(icinga_environment.get_jira_recovery_label())
+        if (not icinga_environment.is_service_issue() or
+                icinga_environment.host_state in self.HOST_UP_STATES):
+            return None
+        deadline = self.clock() + self.delay
+        while True:
+            issue_key = self.ticket_index.find_open_host_issue(icinga_environment.host_name)
+            remaining = deadline - self.clock()
+            if issue_key or remaining <= 0:
+                return issue_key
+            self.sleep(min(1, remaining))
+
+
+class StormMode(object):
+    STORM_LABEL = 'ICINGA-STORM'
+    MAX_LISTED_MEMBERS = 300
+
+    def __init__(self, path, threshold, window=60, flush_interval=10, clock=time.time,
+                 sleep=time.sleep, scheduled=False, scope=DEFAULT_JIRA_TARGET, connection=None,
+                 lock=None):
+        self.path = path
+        self.threshold = threshold
+        self.window = window
+        self.flush_interval = flush_interval
+        self.scheduled = scheduled
+        self.scope = scope
+        self.clock = clock
+        self.sleep = sleep
+        self.lock = lock or threading.Lock()
+        self.connection = connection
+        if connection is not None:
+            return
+        self.connection = _connect_sqlite(path)
+        default_scope = "TEXT DEFAULT '%s'" % DEFAULT_JIRA_TARGET
+        self.connection.execute("CREATE TABLE IF NOT EXISTS storm_events (occurred_at REAL)")
+        _add_missing_column(self.connection, 'storm_events', 'scope', default_scope)
+        self.connection.execute("CREATE TABLE IF NOT EXISTS storm_members ("
+                                "id INTEGER PRIMARY KEY AUTOINCREMENT, label TEXT UNIQUE, "
+                                "host TEXT, service TEXT, state TEXT, flushed INTEGER)")
+        _add_missing_column(self.connection, 'storm_members', 'scope', default_scope)
+        with _immediate_transaction(self.connection):
+            self.connection.execute("CREATE TABLE IF NOT EXISTS storm_state ("
+                                    "scope TEXT, name TEXT, value TEXT, PRIMARY KEY (scope, name))")
+            if 'scope' not in [row[1] for row
+                               in self.connection.execute("PRAGMA table_info(storm_state)")]:
+                self.connection.execute("ALTER TABLE storm_state RENAME TO storm_state_unscoped")
+                self.connection.execute("CREATE TABLE storm_state (scope TEXT, name TEXT, "
+                                        "value TEXT, PRIMARY KEY (scope, name))")
+                self.connection.execute("INSERT INTO storm_state "
+                                        "SELECT ?, name, value FROM storm_state_unscoped",
+                                        (DEFAULT_JIRA_TARGET,))
+                self.connection.execute("DROP TABLE storm_state_unscoped")
+
+    def for_scope(self, scope):
+        return StormMode(self.path, self.threshold, self.window, self.flush_interval, self.clock,
+                         self.sleep, self.scheduled, scope, self.connection, self.lock)
+
+    def for_route(self, route):
+        if route is None:
+            return self
+        return self.for_scope("%s/%s" % (self.scope, route.name))
+
+    def route_storms(self):
+        prefix = self.scope + '/'
+        with self.lock:
+            scopes = set(row[0] for row in self.connection.execute(
+                "SELECT scope FROM storm_members WHERE substr(scope, 1, ?) = ? "
+                "UNION SELECT scope FROM storm_state WHERE substr(scope, 1, ?) = ?",
+                (len(prefix), prefix, len(prefix), prefix)))
+        return [self] + [self.for_scope(scope) for scope in sorted(scopes)]
+
+    def record_problem(self):
+        now = self.clock()
+        with self.lock:
+            with _immediate_transaction(self.connection):
+                self.connection.execute("INSERT INTO storm_events (occurred_at, scope) "
+                                        "VALUES (?, ?)", (now, self.scope))
+                self.connection.execute("DELETE FROM storm_events "
+                                        "WHERE scope = ? AND occurred_at < ?",
+                                        (self.scope, now - self.window))
+                count = self.connection.execute("SELECT COUNT(*) FROM storm_events WHERE scope = ?",
+                                                (self.scope,)).fetchone()[0]
+                in_storm = count >= self.threshold
+                if not in_storm:
+                    self._end_storm()
+        return in_storm
+
+    def summary_issue_key(self, create_summary_issue):
+        with self.lock:
+            with _immediate_transaction(self.connection):
+                summary_key = self._get_state('summary_key')
+                if summary_key is None:
+                    summary_key = create_summary_issue()
+                    self._set_state('summary_key', summary_key)
+        return summary_key
+
+    def add_member(self, label, host_name, service_description, state):
+        now = self.clock()
+        with self.lock:
+            with _immediate_transaction(self.connection):
+                self.connection.execute("INSERT OR REPLACE INTO storm_members "
+                                        "(label, host, service, state, flushed, scope) "
+                                        "VALUES (?, ?, ?, ?, 0, ?)",
+                                        (label, host_name, service_description, state, self.scope))
+                is_leader = not self._flush_lease_held(now)
+                if is_leader:
+                    self._take_flush_lease(now)
+        return is_leader
+
+    def flush_overdue(self, jira):
+        now = self.clock()
+        with self.lock:
+            with _immediate_transaction(self.connection):
+                pending = self._count_pending()
+                summary_key = self._get_state('summary_key')
+                if not pending or summary_key is None or self._flush_lease_held(now):
+                    return False
+                self._take_flush_lease(now)
+        return self.flush(jira, summary_key)
+
+    def flush_due(self, jira):
+        now = self.clock()
+        with self.lock:
+            pending = self._count_pending()
+            summary_key = self._get_state('summary_key')
+            due = self._get_state('flush_due')
+        if not pending or summary_key is None or (due is not None and float(due) > now):
+            return False
+        return self.flush(jira, summary_key)
+
+    def flush(self, jira, summary_key):
+        with self.lock:
+            with _immediate_transaction(self.connection):
+                new_labels = [row[0] for row in
+                              self.connection.execute("SELECT label FROM storm_members "
+                                                      "WHERE scope = ? AND flushed = 0 ORDER BY id",
+                                                      (self.scope,))]
+                self.connection.execute("UPDATE storm_members SET flushed = 1 "
+                                        "WHERE scope = ? AND flushed = 0", (self.scope,))
+                self.connection.execute("DELETE FROM storm_state "
+                                        "WHERE scope = ? AND name = 'flush_due'", (self.scope,))
+                members = self.connection.execute("SELECT host, service, state FROM storm_members "
+                                                  "WHERE scope = ? ORDER BY host, service",
+                                                  (self.scope,)).fetchall()
+        if not new_labels:
+            return False
+        try:
+            jira.issue(summary_key, fields='labels').update(
+                fields={'description': self._create_description(members)},
+                update={'labels': [{'add': label} for label in new_labels]})
+        except Exception:
+            with self.lock:
+                with _immediate_transaction(self.connection):
+                    self.connection.executemany("UPDATE storm_members SET flushed = 0 "
+                                                "WHERE label = ?",
+                                                [(label,) for label in new_labels])
+            raise
+        return True
+
+    def _count_pending(self):
+        return self.connection.execute("SELECT COUNT(*) FROM storm_members "
+                                       "WHERE scope = ? AND flushed = 0",
+                                       (self.scope,)).fetchone()[0]
+
+    def _get_state(self, name):
+        row = self.connection.execute("SELECT value FROM storm_state WHERE scope = ? AND name = ?",
+                                      (self.scope, name)).fetchone()
+        return row[0] if row else None
+
+    def _set_state(self, name, value):
+        self.connection.execute("INSERT OR REPLACE INTO storm_state VALUES (?, ?, ?)",
+                                (self.scope, name, value))
+
+    def _flush_lease_held(self, now):
+        due = self._get_state('flush_due')
+        return due is not None and float(due) + self.flush_interval >= now
+
+    def _take_flush_lease(self, now):
+        self._set_state('flush_due', now + self.flush_interval)
+
+    def _create_description(self, members):
+        lines = ["{color:#3b0b0b}*Icinga alert storm*{color}", "",
+                 "More than %d problems within %d seconds, affected hosts and services:" %
+                 (self.threshold, self.window)]
+        for host_name, service_description, state in members[:self.MAX_LISTED_MEMBERS]:
+            if service_description:
+                lines.append("* %s on %s is %s" % (service_description, host_name, state))
+            else:
+                lines.append("* %s is %s" % (host_name, state))
+        if len(members) > self.MAX_LISTED_MEMBERS:
+            lines.append("* ... and %d more" % (len(members) - self.MAX_LISTED_MEMBERS))
+        return '\n'.join(lines)
+
+    def _end_storm(self):
+        if self._count_pending() == 0:
+            self.connection.execute("DELETE FROM storm_state "
+                                    "WHERE scope = ? AND name IN ('summary_key', 'flush_due')",
+                                    (self.scope,))
+            self.connection.execute("DELETE FROM storm_members WHERE scope = ?", (self.scope,))
+
+
+class SqliteClaimStore(object):
+
+    def __init__(self, path, clock=time.time):
+        self.clock = clock
+        self.lock = threading.Lock()
+        self.connection = _connect_sqlite(path)
+        self.connection.execute("CREATE TABLE IF NOT EXISTS claims ("
+                                "claim_key TEXT PRIMARY KEY, owner TEXT, state TEXT, "
+                                "expires_at REAL)")
+
+    def acquire(self, key, owner, lease):
+        now = self.clock()
+        with self.lock:
+            with _immediate_transaction(self.connection):
+                row = self.connection.execute("SELECT owner, state, expires_at FROM claims "
+                                              "WHERE claim_key = ?", (key,)).fetchone()
+                acquired = row is None or row[2] <= now or (row[0] == owner and row[1] == 'claimed')
+                if acquired:
+                    self.connection.execute("INSERT OR REPLACE INTO claims "
+                                            "VALUES (?, ?, 'claimed', ?)",
+                                            (key, owner, now + lease))
+                    self.connection.execute("DELETE FROM claims WHERE expires_at <= ?", (now,))
+        return acquired
+
+    def complete(self, key, owner, retention):
+        with self.lock:
+            self.connection.execute("UPDATE claims SET state = 'done', expires_at = ? "
+                                    "WHERE claim_key = ? AND owner = ?",
+                                    (self.clock() + retention, key, owner))
+
+    def release(self, key, owner):
+        with self.lock:
+            self.connection.execute("DELETE FROM claims WHERE claim_key = ? AND owner = ?",
+                                    (key, owner))
+
+
+class MemoryClaimStore(object):
+
+    def __init__(self, clock=time.time):
+        self.clock = clock
+        self.lock = threading.Lock()
+        self.claims = {}
+
+    def acquire(self, key, owner, lease):
+        now = self.clock()
+        with self.lock:
+            claim = self.claims.get(key)
+            if (claim is not None and claim[2] > now and
+                    (claim[0] != owner or claim[1] != 'claimed')):
+                return False
+            self.claims[key] = (owner, 'claimed', now + lease)
+            return True
+
+    def complete(self, key, owner, retention):
+        with self.lock:
+            if self.claims.get(key, (None,))[0] == owner:
+                self.claims[key] = (owner, 'done', self.clock() + retention)
+
+    def release(self, key, owner):
+        with self.lock:
+            if self.claims.get(key, (None,))[0] == owner:
+                del self.claims[key]
+
+
+def create_claim_store(location):
+    if location == 'memory:':
+        return MemoryClaimStore()
+    if location.startswith('sqlite:'):
+        return SqliteClaimStore(location[len('sqlite:'):])
+    raise ValueError("Unknown claim store '%s', use sqlite:<path> or memory:" % location)
+
+
+class EventClaims(object):
+
+    def __init__(self, store, node_name=None, lease=60, retention=3600):
+        self.store = store
+        self.node_name = node_name or socket.gethostname()
+        self.lease = lease
+        self.retention = retention
+
+    def claim(self, icinga_environment):
+        return self.store.acquire(self.claim_key(icinga_environment), self.node_name, self.lease)
+
+    def complete(self, icinga_environment):
+        self.store.complete(self.claim_key(icinga_environment), self.node_name, self.retention)
+
+    def release(self, icinga_environment):
+        self.store.release(self.claim_key(icinga_environment), self.node_name)
+
+    def claim_key(self, icinga_environment):
+        if icinga_environment.is_recovered():
+            label = icinga_environment.get_jira_recovery_label()
+        else:
+            label = icinga_environment.create_labels_list()[0]
+        key = "%s %s" % (icinga_environment.notification_type, label)
+        if not icinga_environment.has_new_problem() and not icinga_environment.is_recovered():
+            key += " %s %s %s" % (icinga_environment.short_date_time or '',
+                                  icinga_environment.notification_author or '',
+                                  icinga_environment.notification_comment or '')
+        return key
+
+
+class PriorityEventQueue(object):
+    STATE_CLASSES = {'CRITICAL': ('critical', 0), 'DOWN': ('critical', 0),
+                     'WARNING': ('warning', 1), 'UNREACHABLE': ('warning', 1),
+                     'UNKNOWN': ('unknown', 2)}
+    PROBLEM_CLASS = ('problem', 2)
+    RECOVERY_CLASS = ('recovery', 3)
+    OTHER_CLASS = ('other', 4)
+    DEFAULT_JIRA_PRIORITY = 3
+
+    def __init__(self, maxsize=0, aging_rate=0.05, clock=time.time):
+        self.maxsize = maxsize
+        self.aging_rate = aging_rate
+        self.clock = clock
+        self.started_at = clock()
+        self.condition = threading.Condition()
+        self.heap = []
+        self.sequence = 0
+        self.wait_stats = {}
+        self.pending_keys = {}
+
+    def __len__(self):
+        with self.condition:
+            return len(self.heap)
+
+    def priority_class(self, icinga_environment):
+        if icinga_environment.has_new_problem():
+            if icinga_environment.is_service_issue():
+                state = icinga_environment.service_state
+            else:
+                state = icinga_environment.host_state
+            name, rank = self.STATE_CLASSES.get(state, self.PROBLEM_CLASS)
+        elif icinga_environment.is_recovered():
+            name, rank = self.RECOVERY_CLASS
+        else:
+            name, rank = self.OTHER_CLASS
+        return name, rank + self._jira_priority_offset(icinga_environment.service_priority_id)
+
+    @staticmethod
+    def ordering_key(icinga_environment):
+        return icinga_environment.host_name, icinga_environment.service_description
+
+    def put(self, icinga_environment, item=None, block=True, timeout=None):
+        name, rank = self.priority_class(icinga_environment)
+        ordering_key = self.ordering_key(icinga_environment)
+        with self.condition:
+            if self.maxsize > 0:
+                deadline = None if timeout is None else self.clock() + timeout
+                while len(self.heap) >= self.maxsize:
+                    if not block:
+                        raise Full()
+                    remaining = None if deadline is None else deadline - self.clock()
+                    if remaining is not None and remaining <= 0:
+                        raise Full()
+                    self.condition.wait(remaining)
+            enqueued_at = self.clock()
+            key = rank + self.aging_rate * (enqueued_at - self.started_at)
+            pending = self.pending_keys.get(ordering_key)
+            if pending is not None:
+                key = max(key, pending[0])
+            self.pending_keys[ordering_key] = [key, pending[1] + 1 if pending else 1]
+            self.sequence += 1
+            heapq.heappush(self.heap, (key, self.sequence, name, enqueued_at, ordering_key,
+                                       icinga_environment if item is None else item))
+            self.condition.notify_all()
+
+    def get(self, block=True, timeout=None):
+        with self.condition:
+            deadline = None if timeout is None else self.clock() + timeout
+            while not self.heap:
+                if not block:
+                    raise Empty()
+                remaining = None if deadline is None else deadline - self.clock()
+                if remaining is not None and remaining <= 0:
+                    raise Empty()
+                self.condition.wait(remaining)
+            _, _, name, enqueued_at, ordering_key, item = heapq.heappop(self.heap)
+            pending = self.pending_keys[ordering_key]
+            pending[1] -= 1
+            if not pending[1]:
+                del self.pending_keys[ordering_key]
+            self._record_wait(name, self.clock() - enqueued_at)
+            self.condition.notify_all()
+            return item
+
+    def stats(self):
+        with self.condition:
+            return dict((name, dict(stats)) for name, stats in self.wait_stats.items())
+
+    def format_stats(self):
+        lines = []
+        for name, stats in sorted(self.stats().items()):
+            lines.append("%s: %d events, queue wait avg %.3fs max %.3fs" %
+                         (name, stats['count'], stats['total_wait'] / stats['count'],
+                          stats['max_wait']))
+        return lines
+
+    def _record_wait(self, name, wait):
+        stats = self.wait_stats.setdefault(name, {'count': 0, 'total_wait': 0.0, 'max_wait': 0.0})
+        stats['count'] += 1
+        stats['total_wait'] += wait
+        stats['max_wait'] = max(stats['max_wait'], wait)
+
+    def _jira_priority_offset(self, priority_id):
+        try:
+            priority = int(priority_id)
+        except (TypeError, ValueError):
+            return 0
+        return max(-0.4, min(0.4, (priority - self.DEFAULT_JIRA_PRIORITY) * 0.1))
+
+
+class AuditLog(object):
+    INDEX_HEADER = struct.Struct('>QQ')
+    INDEX_ENTRY = struct.Struct('>QQ')
+    INDEXED_FIELDS = ('labels', 'host')
+
+    def __init__(self, path, clock=time.time):
+        self.path = path
+        self.clock = clock
+        self.lock = threading.Lock()
+
+    def record(self, icinga_environment, issues=None, started_at=None, outcome='ok', error=None):
+        finished_at = self.clock()
+        started_at = finished_at if started_at is None else started_at
+        entry = {'timestamp': started_at,
+                 'duration': round(finished_at - started_at, 6),
+                 'notification_type': icinga_environment.notification_type,
+                 'host': icinga_environment.host_name,
+                 'service': icinga_environment.service_description,
+                 'labels': self._labels(icinga_environment),
+                 'issues': [str(issue.key) for issue in issues or []],
+                 'outcome': outcome}
+        if error is not None:
+            entry['error'] = str(error)
+        self.append(entry)
+        return entry
+
+    def append(self, entry):
+        line = json.dumps(entry, sort_keys=True) + '\n'
+        with self.lock:
+            with open(self.path, 'a') as log_file:
+                fcntl.flock(log_file, fcntl.LOCK_EX)
+                try:
+                    offset = os.fstat(log_file.fileno()).st_size
+                    log_file.write(line)
+                    log_file.flush()
+                    for field in self.INDEXED_FIELDS:
+                        self._extend_index(field, entry, offset, offset + len(line))
+                finally:
+                    fcntl.flock(log_file, fcntl.LOCK_UN)
+
+    def entries(self, start=0):
+        for _, _, entry in self._read_from(start):
+            yield entry
+
+    def find_by_label(self, label):
+        return self._find('labels', label)
+
+    def find_by_host(self, host_name):
+        return self._find('host', host_name)
+
+    def build_index(self):
+        keys = dict((field, []) for field in self.INDEXED_FIELDS)
+        indexed_size = 0
+        for offset, indexed_size, entry in self._read_from(0):
+            for field in self.INDEXED_FIELDS:
+                for value in self._field_values(entry, field):
+                    keys[field].append((self._hash(value), offset))
+        for field in self.INDEXED_FIELDS:
+            index_path = self._index_path(field)
+            with open(index_path + '.tmp', 'wb') as index_file:
+                index_file.write(self.INDEX_HEADER.pack(indexed_size, len(keys[field])))
+                for key_hash, offset in sorted(keys[field]):
+                    index_file.write(self.INDEX_ENTRY.pack(key_hash, offset))
+            os.rename(index_path + '.tmp', index_path)
+        return indexed_size
+
+    def mttr(self, host_name=None):
+        entries = self.entries() if host_name is None else self.find_by_host(host_name)
+        opened_at = {}
+        durations = []
+        for entry in entries:
+            if entry.get('outcome') != 'ok':
+                continue
+            if entry['notification_type'] == 'PROBLEM':
+                for label in entry['labels']:
+                    opened_at.setdefault(label, entry['timestamp'])
+            elif entry['notification_type'] == 'RECOVERY':
+                for label in entry['labels']:
+                    if label in opened_at:
+                        durations.append(entry['timestamp'] - opened_at.pop(label))
+        report = {'resolved': len(durations), 'open': len(opened_at),
+                  'mean': 0.0, 'median': 0.0, 'max': 0.0}
+        if durations:
+            durations.sort()
+            report['mean'] = sum(durations) / len(durations)
+            report['median'] = durations[len(durations) // 2]
+            report['max'] = durations[-1]
+        return report
+
+    def _find(self, field, value):
+        offsets, indexed_size = self._indexed_offsets(field, self._hash(value))
+        matches = []
+        if not os.path.exists(self.path):
+            return matches
+        with open(self.path, 'rb') as log_file:
+            for offset in sorted(offsets):
+                log_file.seek(offset)
+                entry = json.loads(log_file.readline())
+                if value in self._field_values(entry, field):
+                    matches.append(entry)
+            for _, _, entry in self._read_lines(log_file, indexed_size):
+                if value in self._field_values(entry, field):
+                    matches.append(entry)
+        return matches
+
+    def _extend_index(self, field, entry, offset, end):
+        index_path = self._index_path(field)
+        if not os.path.exists(index_path):
+            return
+        with open(index_path, 'r+b') as index_file:
+            header = index_file.read(self.INDEX_HEADER.size)
+            if len(header) < self.INDEX_HEADER.size:
+                return
+            indexed_size, sorted_count = self.INDEX_HEADER.unpack(header)
+            if indexed_size != offset:
+                return
+            index_file.seek(0, os.SEEK_END)
+            for value in self._field_values(entry, field):
+                index_file.write(self.INDEX_ENTRY.pack(self._hash(value), offset))
+            index_file.seek(0)
+            index_file.write(self.INDEX_HEADER.pack(end, sorted_count))
+
+    def _indexed_offsets(self, field, key_hash):
+        index_path = self._index_path(field)
+        if not os.path.exists(index_path) or os.path.getsize(index_path) < self.INDEX_HEADER.size:
+            return [], 0
+        with open(index_path, 'rb') as index_file:
+            index = mmap.mmap(index_file.fileno(), 0, access=mmap.ACCESS_READ)
+            try:
+                indexed_size, sorted_count = self.INDEX_HEADER.unpack_from(index, 0)
+                count = (len(index) - self.INDEX_HEADER.size) // self.INDEX_ENTRY.size
+                sorted_count = min(sorted_count, count)
+                low, high = 0, sorted_count
+                while low < high:
+                    middle = (low + high) // 2
+                    if self._index_entry(index, middle)[0] < key_hash:
+                        low = middle + 1
+                    else:
+                        high = middle
+                offsets = []
+                while low < sorted_count:
+                    entry_hash, offset = self._index_entry(index, low)
+                    if entry_hash != key_hash:
+                        break
+                    offsets.append(offset)
+                    low += 1
+                for position in range(sorted_count, count):
+                    entry_hash, offset = self._index_entry(index, position)
+                    if entry_hash == key_hash:
+                        offsets.append(offset)
+            finally:
+                index.close()
+        return offsets, indexed_size
+
+    def _index_entry(self, index, position):
+        return self.INDEX_ENTRY.unpack_from(index, self.INDEX_HEADER.size +
+                                            position * self.INDEX_ENTRY.size)
+
+    def _read_from(self, start):
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, 'rb') as log_file:
+            for read in self._read_lines(log_file, start):
+                yield read
+
+    def _read_lines(self, log_file, start):
+        log_file.seek(start)
+        offset = start
+        for line in iter(log_file.readline, ''):
+            if not line.endswith('\n'):
+                break
+            yield offset, offset + len(line), json.loads(line)
+            offset += len(line)
+
+    def _field_values(self, entry, field):
+        value = entry.get(field)
+        if isinstance(value, list):
+            return value
+        return [value] if value else []
+
+    def _labels(self, icinga_environment):
+        if icinga_environment.is_recovered():
+            return [icinga_environment.get_jira_recovery_label()]
+        if icinga_environment.service_problem_id or icinga_environment.host_problem_id:
+            return icinga_environment.create_labels_list()
+        return []
+
+    def _index_path(self, field):
+        return "%s.%s.idx" % (self.path, field)
+
+    def _hash(self, value):
+        if isinstance(value, unicode):
+            value = value.encode('utf-8')
+        return struct.unpack('>Q', hashlib.md5(value).digest()[:8])[0]
+
+
+def read_icinga_status_labels(file_pointer):
+    return read_icinga_status(file_pointer)[0]
+
+
+def read_icinga_status(file_pointer):
+    labels = set()
+    problems = set()
+    block = None
+    has_info = False
+    host_blocks = 0
+    for line in file_pointer:
+        line = line.strip()
+        if line == 'info {':
+            has_info = True
+        elif line in ('hoststatus {', 'servicestatus {'):
+            block = {}
+            if line == 'hoststatus {':
+                host_blocks += 1
+        elif line == '}':
+            if block and block.get('current_problem_id', '0') != '0' and block.get('host_name'):
+                labels.add("%s#%s#%s" % (IcingaEnvironment.ICINGA_PREFIX,
+                                         block['current_problem_id'], block['host_name']))
+                problems.add((block['host_name'], block.get('service_description')))
+            block = None
+        elif block is not None and '=' in line:
+            key, value = line.split('=', 1)
+            if key in ('host_name', 'service_description', 'current_problem_id'):
+                block[key] = value
+    if not has_info or host_blocks == 0:
+        raise ValueError("Status file contains no Icinga host status, refusing to reconcile")
+    if block is not None:
+        raise ValueError("Status file is truncated, refusing to reconcile")
+    return labels, problems
+
+
+class Reconciler(object):
+    RECOVERY_OUTPUT = 'Problem is no longer reported by Icinga, closed by reconciliation'
+
+    def __init__(self, jira, active_labels, project_keys, ticket_index=None, page_size=100,
+                 concurrency=4, cache_namespace=None):
+        self.jira = jira
+        self.active_labels = active_labels
+        self.project_keys = sorted(set(project_keys))
+        self.ticket_index = ticket_index
+        self.page_size = page_size
+        self.concurrency = concurrency
+        self.cache_namespace = cache_namespace
+
+    def run(self):
+        seen = closed = 0
+        start_at = 0
+        while True:
+            page = self.jira.search_issues(self._create_jql(), startAt=start_at,
+                                           maxResults=self.page_size, fields='labels')
+            stale_issues = [issue for issue in page if self._is_stale(issue)]
+            closed_in_page = len([issue for issue
+                                  in run_concurrently(self._close, stale_issues, self.concurrency)
+                                  if issue is not None])
+            seen += len(page)
+            closed += closed_in_page
+            if len(page) < self.page_size:
+                return seen, closed
+            start_at += len(page) - closed_in_page
+
+    def _create_jql(self):
+        return ("project in (%s) AND resolution = Unresolved AND labels is not EMPTY "
+                "ORDER BY key ASC" % ', '.join('"%s"' % key for key in self.project_keys))
+
+    def _icinga_labels(self, issue):
+        return [label for label in issue.fields.labels
+                if label.startswith(IcingaEnvironment.ICINGA_PREFIX + '#') and
+                label.count('#') >= 2]
+
+    def _is_stale(self, issue):
+        labels = self._icinga_labels(issue)
+        if not labels:
+            return False
+        for label in labels:
+            if label in self.active_labels:
+                return False
+        return True
 
+    def _close(self, issue):
+        _, problem_id, host_name = self._icinga_labels(issue)[0].split('#', 2)
+        environment = IcingaEnvironment({'ICINGA_NOTIFICATIONTYPE': 'RECOVERY',
+                                         'ICINGA_HOSTNAME': host_name,
+                                         'ICINGA_HOSTOUTPUT': self.RECOVERY_OUTPUT,
+                                         'ICINGA_LASTHOSTPROBLEMID': problem_id,
+                                         'ICINGA_SHORTDATETIME':
+                                             time.strftime('%m-%d-%Y %H:%M:%S')})
+        closed = CloseIssue(self.jira, environment, self.ticket_index,
+                            cache_namespace=self.cache_namespace).close_issues([issue])
+        return closed[0] if closed else None
+
+
+def issue_factory(jira, icinga_environment, config, metadata=None, router=None,
+                  ticket_index=None, correlator=None, storm=None, comment_buffer=None):
+    if storm is not None and icinga_environment.has_new_problem():
+        route = None
+        if router is not None:
+            route = router.route(icinga_environment.host_name,
+                                 icinga_environment.service_description)
+        storm = storm.for_route(route)
+        if storm.record_problem():
+            return StormIssue(jira, config, icinga_environment, storm, ticket_index, route)
+
+    if correlator is not None and (icinga_environment.has_new_problem() or
+                                   icinga_environment.is_recovered()):
+        parent_issue_key = correlator.find_parent_issue(icinga_environment)
+        if parent_issue_key:
+            return CorrelatedIssue(jira, icinga_environment, correlator, parent_issue_key)
 
-def issue_factory(jira, icinga_environment, config):
     if icinga_environment.has_new_problem():
-        return OpenIssue(jira, config, icinga_environment)
+        return OpenIssue(jira, config, icinga_environment, metadata, router, ticket_index)
 
     elif icinga_environment.is_recovered():
-        return CloseIssue(jira, icinga_environment)
+        return CloseIssue(jira, icinga_environment, ticket_index,
+                          config_flag(config, 'host_recovery_cascade'),
+                          int(config.get('cascade_concurrency',
+                                         OPTIONAL_CONFIG_DEFAULTS['cascade_concurrency'])),
+                          config.get('url'))
+
+    elif icinga_environment.is_comment_notification():
+        return CommentIssue(jira, icinga_environment, ticket_index, comment_buffer,
+                            config.get('url'))
 
     else:
         raise UnknownIssueException("Unknown icinga alert")
@@ -155,6 +1861,9 @@ def issue_factory(jira, icinga_environment, config):
 class Issue(object):
     __metaclass__ = ABCMeta
 
+    description_template = None
+    cache_namespace = None
+
     @abstractmethod
     def execute(self):
         pass
@@ -191,30 +1900,75 @@ class Issue(object):
             This ticket was closed automatically.
             {% endif %}
         """)
-        template = Template(DESCRIPTION_TEMPLATE, trim_blocks=True)
+        template_source = self.description_template or DESCRIPTION_TEMPLATE
+        template = CACHES.get('templates').get_or_load(
+            hashlib.sha1(template_source.encode('utf-8')).hexdigest(),
+            lambda: Template(template_source, trim_blocks=True))
         return str(template.render(self.icinga_environment.__dict__)).strip()
 
+    def _cache_key(self, key):
+        return namespaced_cache_key(self.cache_namespace, key)
+
 
 class OpenIssue(Issue):
 
-    def __init__(self, jira, config, icinga_environment):
+    def __init__(self, jira, config, icinga_environment, metadata=None, router=None,
+                 ticket_index=None):
         self.jira = jira
 
         self.project_key = config['jira_project_key']
         self.issue_type = config['jira_issue_type']
+        self.extra_labels = []
+        self.cache_namespace = config.get('url')
 
         self.icinga_environment = icinga_environment
+        self.metadata = metadata
+        self.ticket_index = ticket_index
+
+        if router is not None:
+            self._apply_route(router.route(icinga_environment.host_name,
+                                           icinga_environment.service_description))
 
     def execute(self):
-        return [self.jira.create_issue(fields=self._create_issue_dict())]
+        issue = self.jira.create_issue(fields=self._create_issue_dict())
+        labels_cache = CACHES.get('labels', LABEL_CACHE_TTL, persist=True)
+        for label in self.icinga_environment.create_labels_list():
+            labels_cache.set(self._cache_key(label), [issue.key])
+        if self.ticket_index is not None:
+            for label in self.icinga_environment.create_labels_list():
+                self.ticket_index.add(label, self.icinga_environment.host_name, issue.key,
+                                      is_host=self.icinga_environment.is_host_issue())
+        return [issue]
 
     def _create_issue_dict(self):
-        return {'project': {'key': self.project_key},
-                'summary': self._create_summary(),
-                'description': self.create_description(),
-                'issuetype': {'name': self.issue_type},
-                'labels': self.icinga_environment.create_labels_list()
-                }
+        issue_dict = {'project': {'key': self.project_key},
+                      'summary': self._create_summary(),
+                      'description': self.create_description(),
+                      'issuetype': {'name': self.issue_type},
+                      'labels': self.icinga_environment.create_labels_list()
+                      }
+        if self.extra_labels:
+            issue_dict['labels'] = issue_dict['labels'] + self.extra_labels
+        priority_id = self.icinga_environment.service_priority_id
+        if self.metadata is not None:
+            resolved = self.metadata.resolve(self.project_key, self.issue_type)
+            issue_dict['project'] = {'id': resolved['project_id']}
+            issue_dict['issuetype'] = {'id': resolved['issuetype_id']}
+            if priority_id and priority_id not in resolved['priority_ids']:
+                print("WARNING: priority %s is not available for %s/%s, using default priority" %
+                      (priority_id, self.project_key, self.issue_type))
+                priority_id = None
+        if priority_id:
+            issue_dict['priority'] = {'id': priority_id}
+        return issue_dict
+
+    def _apply_route(self, route):
+        if route is None:
+            return
+        self.project_key = route.project_key or self.project_key
+        self.issue_type = route.issue_type or self.issue_type
+        self.extra_labels = list(route.labels)
+        self.description_template = route.template
 
     def _create_summary(self):
         if self.icinga_environment.is_service_issue():
@@ -227,27 +1981,220 @@ class OpenIssue(Issue):
                                          self.icinga_environment.host_state)
 
 
+class CorrelatedIssue(Issue):
+
+    def __init__(self, jira, icinga_environment, correlator, parent_issue_key):
+        self.jira = jira
+        self.icinga_environment = icinga_environment
+        self.correlator = correlator
+        self.parent_issue_key = parent_issue_key
+
+    def execute(self):
+        if self.icinga_environment.is_recovered():
+            self.correlator.ticket_index.remove(self.icinga_environment.get_jira_recovery_label())
+        else:
+            for label in self.icinga_environment.create_labels_list():
+                self.correlator.ticket_index.add(label, self.icinga_environment.host_name,
+                                                 self.parent_issue_key, correlated=True)
+        self.correlator.comment_buffer.append(self.jira, self.parent_issue_key,
+                                              self._create_comment_line(),
+                                              self.correlator.COMMENT_HEADER)
+        return [IssueReference(self.parent_issue_key)]
+
+    def _create_comment_line(self):
+        environment = self.icinga_environment
+        return "* %s %s: %s is %s - %s" % (environment.short_date_time or '',
+                                          environment.notification_type,
+                                          environment.service_description,
+                                          environment.service_state,
+                                          environment.service_output or '')
+
+
+class StormIssue(Issue):
+
+    def __init__(self, jira, config, icinga_environment, storm, ticket_index=None, route=None):
+        self.jira = jira
+        self.project_key = config['jira_project_key']
+        self.issue_type = config['jira_issue_type']
+        self.extra_labels = []
+        self.icinga_environment = icinga_environment
+        self.storm = storm
+        self.ticket_index = ticket_index
+        if route is not None:
+            self.project_key = route.project_key or self.project_key
+            self.issue_type = route.issue_type or self.issue_type
+            self.extra_labels = list(route.labels)
+
+    def execute(self):
+        summary_key = self.storm.summary_issue_key(self._create_summary_issue)
+        environment = self.icinga_environment
+        if environment.is_service_issue():
+            state = environment.service_state
+        else:
+            state = environment.host_state
+        is_flush_leader = False
+        for label in environment.create_labels_list():
+            is_flush_leader = self.storm.add_member(label, environment.host_name,
+                                                    environment.service_description,
+                                                    state) or is_flush_leader
+            if self.ticket_index is not None:
+                self.ticket_index.add(label, environment.host_name, summary_key, storm=True)
+        if is_flush_leader and not self.storm.scheduled:
+            self.storm.sleep(self.storm.flush_interval)
+            self.storm.flush(self.jira, summary_key)
+        return [IssueReference(summary_key)]
+
+    def _create_summary_issue(self):
+        issue = self.jira.create_issue(fields={
+            'project': {'key': self.project_key},
+            'summary': "ICINGA: alert storm since %s" % (self.icinga_environment.short_date_time or
+                                                         time.strftime('%m-%d-%Y %H:%M:%S')),
+            'description': "Icinga alert storm detected, affected hosts and services will follow.",
+            'issuetype': {'name': self.issue_type},
+            'labels': [StormMode.STORM_LABEL] + self.extra_labels})
+        return issue.key
+
+
+class CommentIssue(Issue):
+    COMMENT_HEADER = '{color:#0f5d94}*Icinga notifications*{color}'
+
+    def __init__(self, jira, icinga_environment, ticket_index=None, comment_buffer=None,
+                 cache_namespace=None):
+        self.jira = jira
+        self.icinga_environment = icinga_environment
+        self.ticket_index = ticket_index
+        self.comment_buffer = comment_buffer
+        self.cache_namespace = cache_namespace
+
+    def execute(self):
+        issue_keys = self._find_issue_keys()
+        if not issue_keys:
+            print("WARNING: no open ticket found for %s event" %
+                  self.icinga_environment.notification_type)
+        line = self._create_comment_line()
+        for issue_key in issue_keys:
+            if self.comment_buffer is not None:
+                self.comment_buffer.append(self.jira, issue_key, line, self.COMMENT_HEADER)
+            else:
+                self.jira.add_comment(issue_key, "%s\n%s" % (self.COMMENT_HEADER, line))
+        return [IssueReference(issue_key) for issue_key in issue_keys]
+
+    def _find_issue_keys(self):
+        environment = self.icinga_environment
+        if not environment.host_name or not (environment.service_problem_id or
+                                             environment.host_problem_id):
+            return []
+        label = environment.create_labels_list()[0]
+        if self.ticket_index is not None:
+            issue_keys = self.ticket_index.find(label)
+            parent_issue_key = self.ticket_index.find_correlated(label)
+            if parent_issue_key:
+                issue_keys.append(parent_issue_key)
+            if issue_keys:
+                return issue_keys
+        labels_cache = CACHES.get('labels', LABEL_CACHE_TTL, persist=True)
+        issue_keys = labels_cache.get(self._cache_key(label))
+        if not issue_keys:
+            issue_keys = [issue.key for issue in
+                          self.jira.search_issues("labels='%s' AND resolution = Unresolved" % label,
+                                                  fields='labels')]
+            if issue_keys:
+                labels_cache.set(self._cache_key(label), issue_keys)
+        return issue_keys
+
+    def _create_comment_line(self):
+        environment = self.icinga_environment
+        line = "* %s %s" % (environment.short_date_time or '', environment.notification_type)
+        if environment.notification_author:
+            line += " by %s" % environment.notification_author
+        if environment.notification_comment:
+            line += ": %s" % environment.notification_comment
+        return line
+
+
 class CloseIssue(Issue):
 
-    def __init__(self, jira, icinga_environment):
+    def __init__(self, jira, icinga_environment, ticket_index=None, cascade=False, concurrency=1,
+                 cache_namespace=None):
         self.jira = jira
         self.icinga_environment = icinga_environment
+        self.ticket_index = ticket_index
+        self.cascade = cascade
+        self.concurrency = concurrency
+        self.cache_namespace = cache_namespace
 
     def execute(self):
         issues = self._find_jira_issues_by_label()
-        handled_issues = []
-        for issue in issues:
-            try:
-                self._close(issue)
-                self._set_comment(issue)
-                handled_issues.append(issue)
-            except CantCloseTicketException as e:
-                print("WARNING: %s could not be closed, reason: %s" %
-                      (issue.key, str(e)))
-        return handled_issues
+        if self.cascade and self.icinga_environment.is_host_issue():
+            issues = self._merge_issues(issues, self._find_open_host_issues())
+        return self.close_issues(issues)
+
+    def close_issues(self, issues):
+        return [issue for issue
+                in run_concurrently(self._close_and_comment, issues, self.concurrency)
+                if issue is not None]
+
+    def _close_and_comment(self, issue):
+        if self._detach_from_storm_summary(issue):
+            return issue
+        try:
+            self._close(issue)
+            self._set_comment(issue)
+        except CantCloseTicketException as e:
+            print("WARNING: %s could not be closed, reason: %s" %
+                  (issue.key, str(e)))
+            return None
+        if self.ticket_index is not None:
+            self.ticket_index.remove_issue(issue.key)
+        CACHES.get('labels', LABEL_CACHE_TTL, persist=True).invalidate(
+            self._cache_key(self.icinga_environment.get_jira_recovery_label()))
+        return issue
+
+    def _detach_from_storm_summary(self, issue):
+        labels = getattr(getattr(issue, 'fields', None), 'labels', None)
+        if not isinstance(labels, list) or StormMode.STORM_LABEL not in labels:
+            return False
+        recovery_label = self.icinga_environment.get_jira_recovery_label()
+        open_labels = [label for label in labels
+                       if label.startswith(IcingaEnvironment.ICINGA_PREFIX + '#') and
+                       label != recovery_label]
+        if not open_labels:
+            return False
+        issue.update(update={'labels': [{'remove': recovery_label}]})
+        if self.ticket_index is not None:
+            self.ticket_index.remove(recovery_label)
+        return True
 
     def _find_jira_issues_by_label(self):
-        return self.jira.search_issues("labels='%s'" % self.icinga_environment.get_jira_recovery_label())
+        label = self.icinga_environment.get_jira_recovery_label()
+        if self.ticket_index is not None:
+            issue_keys = self.ticket_index.find(label)
+            if issue_keys:
+                return [self.jira.issue(issue_key, fields='labels,project,issuetype,status')
+                        for issue_key in issue_keys]
+        return self.jira.search_issues("labels='%s'" % label)
+
+    def _find_open_host_issues(self):
+        host_name = self.icinga_environment.host_name
+        if self.ticket_index is not None:
+            return [IssueReference(key) for key in self.ticket_index.find_by_host(host_name)]
+        label_suffix = "#%s" % host_name
+        jql = 'summary ~ "\\"%s\\"" AND resolution = Unresolved AND labels is not EMPTY' % \
+            host_name.replace('"', '')
+        return [IssueReference(issue.key)
+                for issue in self.jira.search_issues(jql, maxResults=1000, fields='labels')
+                if [label for label in issue.fields.labels
+                    if label.startswith(IcingaEnvironment.ICINGA_PREFIX + '#') and
+                    label.endswith(label_suffix)]]
+
+    def _merge_issues(self, issues, other_issues):
+        known_keys = set(str(issue.key) for issue in issues)
+        merged = list(issues)
+        for issue in other_issues:
+            if str(issue.key) not in known_keys:
+                known_keys.add(str(issue.key))
+                merged.append(issue)
+        return merged
 
     def _set_comment(self, issue):
         self.jira.add_comment(issue, self.create_description())
@@ -258,15 +2205,38 @@ class CloseIssue(Issue):
             if close_transition_id:
                 self.jira.transition_issue(issue, close_transition_id)
         except JIRAError as jira_error:
+            workflow_key = self._workflow_key(issue)
+            if workflow_key:
+                CACHES.get('transitions', TRANSITION_CACHE_TTL, persist=True).invalidate(
+                    self._cache_key(workflow_key))
             raise CantCloseTicketException(jira_error)
 
     def _get_close_transition(self, issue):
-        for transition in self.jira.transitions(issue):
+        for transition in self._get_transitions(issue):
             if transition['name'] == 'Close':
                 return int(transition['id'])
         raise CantCloseTicketException(
             "Ticket does not have 'Close' transition; maybe it's already closed")
 
+    def _get_transitions(self, issue):
+        workflow_key = self._workflow_key(issue)
+        if workflow_key is None:
+            return self.jira.transitions(issue)
+        return CACHES.get('transitions', TRANSITION_CACHE_TTL, persist=True).get_or_load(
+            self._cache_key(workflow_key),
+            lambda: [{'id': transition['id'], 'name': transition['name']}
+                     for transition in self.jira.transitions(issue)])
+
+    def _workflow_key(self, issue):
+        fields = getattr(issue, 'fields', None)
+        parts = [getattr(getattr(fields, 'project', None), 'key', None),
+                 getattr(getattr(fields, 'issuetype', None), 'name', None),
+                 getattr(getattr(fields, 'status', None), 'name', None)]
+        for part in parts:
+            if not isinstance(part, basestring):
+                return None
+        return '/'.join(parts)
+
 
 def open_jira_session(server, username, password, verify=False):
     return JIRA(options={'server': server, 'verify': verify},
@@ -280,9 +2250,69 @@ def parse_and_validate_config_file(file_pointer):
     for key in MANDATORY_CONFIG_ENTRIES:
         if key not in config:
             raise ValueError('config file is missing: %s' % key)
+    for key, value in OPTIONAL_CONFIG_DEFAULTS.iteritems():
+        config.setdefault(key, value)
     return config
 
 
+def parse_jira_targets(file_pointer, config):
+    config_parser = ConfigParser.ConfigParser()
+    config_parser.readfp(file_pointer)
+    targets = [JiraTarget(DEFAULT_JIRA_TARGET, config)]
+    for section in config_parser.sections():
+        if not section.startswith(JIRA_SECTION_PREFIX):
+            continue
+        section_config = dict(config_parser.items(section))
+        for key in ('url', 'username', 'password'):
+            if key not in section_config:
+                raise ValueError('JIRA target %s is missing: %s' % (section, key))
+        target_config = dict(config)
+        name = section[len(JIRA_SECTION_PREFIX):]
+        if config['metadata_cache_file'] and 'metadata_cache_file' not in section_config:
+            root, extension = os.path.splitext(config['metadata_cache_file'])
+            target_config['metadata_cache_file'] = "%s.%s%s" % (root, name, extension)
+        target_config.update(section_config)
+        targets.append(JiraTarget(name, target_config))
+    return targets
+
+
+def config_flag(config, key):
+    return str(config.get(key, '')).strip().lower() in TRUE_VALUES
+
+
+def parse_routing_rules(file_pointer):
+    config_parser = ConfigParser.ConfigParser()
+    config_parser.readfp(file_pointer)
+    routes = []
+    for section in config_parser.sections():
+        if not section.startswith(ROUTE_SECTION_PREFIX):
+            continue
+        route_config = dict(config_parser.items(section))
+        if 'host' not in route_config:
+            raise ValueError('routing rule %s is missing: host' % section)
+        template = None
+        if route_config.get('template'):
+            with open(route_config['template']) as template_file:
+                template = template_file.read()
+        labels = [label.strip() for label in route_config.get('labels', '').split(',')
+                  if label.strip()]
+        try:
+            routes.append(Route(section[len(ROUTE_SECTION_PREFIX):],
+                                route_config['host'],
+                                route_config.get('service'),
+                                route_config.get('project'),
+                                route_config.get('issue_type'),
+                                labels,
+                                template,
+                                route_config.get('target')))
+        except re.error as e:
+            raise ValueError('routing rule %s has an invalid pattern: %s' % (section, e))
+    try:
+        return Router(routes)
+    except re.error as e:
+        raise ValueError('routing rules have an invalid pattern: %s' % e)
+
+
 def print_usage_and_exit(arguments):
     print(arguments)
     sys.exit(1)
@@ -298,14 +2328,615 @@ def read_configuration_file(args):
         return parse_and_validate_config_file(file_pointer)
 
 
+def read_routing_rules(args):
+    with open(args['--config']) as file_pointer:
+        return parse_routing_rules(file_pointer)
+
+
+def read_jira_targets(args, config, router):
+    with open(args['--config']) as file_pointer:
+        return JiraTargets(parse_jira_targets(file_pointer, config), router)
+
+
 def create_ticket_list(config, issues):
     return ["%s/browse/%s" % (config['url'], issue.key) for issue in issues]
 
-if __name__ == '__main__':
-    args = parse_arguments()
+
+def read_status_file(args):
+    with open(args['--status-file']) as file_pointer:
+        return read_icinga_status(file_pointer)
+
+
+class EventHandler(object):
+
+    def __init__(self, jira, config, router=None, ticket_index=None, claims=None, scheduled=False,
+                 target=DEFAULT_JIRA_TARGET):
+        self.jira = jira
+        self.config = config
+        self.router = router
+        self.ticket_index = ticket_index
+        if ticket_index is not None:
+            self.ticket_index = ticket_index = ticket_index.for_target(target)
+        self.claims = claims
+
+        self.audit_log = None
+        if config['audit_log']:
+            self.audit_log = AuditLog(config['audit_log'])
+        self.metadata = None
+        if config['metadata_cache_file']:
+            self.metadata = JiraMetadataCache(jira, config['metadata_cache_file'],
+                                              int(config['metadata_cache_ttl']),
+                                              namespace=config['url'])
+        self.correlator = self.storm = self.comment_buffer = None
+        if config['state_db']:
+            self.comment_buffer = CommentBuffer(config['state_db'],
+                                                int(config['comment_buffer_delay']),
+                                                scheduled=scheduled, target=target)
+        if ticket_index is not None and config_flag(config, 'host_correlation'):
+            self.correlator = HostCorrelator(ticket_index, self.comment_buffer,
+                                             0 if scheduled else int(config['correlation_delay']))
+        if config['state_db'] and int(config['storm_threshold']) > 0:
+            self.storm = StormMode(config['state_db'], int(config['storm_threshold']),
+                                   int(config['storm_window']), int(config['storm_flush_interval']),
+                                   scheduled=scheduled, scope=target)
+
+    def handle(self, icinga_environment):
+        started_at = time.time()
+        if self.claims is not None and not self.claims.claim(icinga_environment):
+            self._audit(icinga_environment, None, started_at, 'duplicate')
+            return None
+        if self.storm is not None:
+            self._flush_overdue_storm()
+        try:
+            issues = issue_factory(self.jira, icinga_environment, self.config, self.metadata,
+                                   self.router, self.ticket_index, self.correlator, self.storm,
+                                   self.comment_buffer).execute()
+        except Exception as e:
+            if self.claims is not None:
+                self.claims.release(icinga_environment)
+            self._audit(icinga_environment, None, started_at, 'error', e)
+            raise
+        if self.claims is not None:
+            self.claims.complete(icinga_environment)
+        self._audit(icinga_environment, issues, started_at, 'ok')
+        return issues
+
+    def flush_scheduled(self):
+        if self.comment_buffer is not None:
+            self.comment_buffer.flush_pending(self.jira)
+        if self.storm is not None:
+            for storm in self.storm.route_storms():
+                try:
+                    storm.flush_due(self.jira)
+                except Exception as e:
+                    print("WARNING: could not update the storm summary ticket: %s" % e)
+
+    def _flush_overdue_storm(self):
+        for storm in self.storm.route_storms():
+            try:
+                storm.flush_overdue(self.jira)
+            except Exception as e:
+                print("WARNING: could not update the storm summary ticket: %s" % e)
+
+    def _audit(self, icinga_environment, issues, started_at, outcome, error=None):
+        if self.audit_log is None:
+            return
+        try:
+            self.audit_log.record(icinga_environment, issues, started_at, outcome, error)
+        except (IOError, OSError) as e:
+            print("WARNING: could not write audit log: %s" % e)
+
+
+def handle_event(jira, config, router, ticket_index, icinga_environment, claims=None,
+                 target=DEFAULT_JIRA_TARGET):
+    try:
+        issues = EventHandler(jira, config, router, ticket_index, claims,
+                              target=target).handle(icinga_environment)
+        if issues is None:
+            print("Event %s is already handled by another node" %
+                  icinga_environment.notification_type)
+            return
+        issue_url_list_as_string = ",".join(create_ticket_list(config, issues))
+        print("Event %s has been successfully handled: %s" %
+              (icinga_environment.notification_type, issue_url_list_as_string))
+    except Exception as e:
+        print("An error occurred while handling event %s: %s" %
+              (icinga_environment.notification_type, e))
+        sys.exit(1)
+
+
+class StreamProblems(object):
+    RECOVERED_RETENTION = 3600
+    STALE_AFTER = 3600
+
+    def __init__(self, path=':memory:', clock=time.time):
+        self.clock = clock
+        self.lock = threading.Lock()
+        self.connection = _connect_sqlite(path)
+        self.connection.text_factory = str
+        self.connection.execute("CREATE TABLE IF NOT EXISTS stream_problems ("
+                                "host TEXT, service TEXT, problem_id TEXT, opened_at REAL, "
+                                "recovered_at REAL, PRIMARY KEY (host, service))")
+        self.connection.execute("CREATE TABLE IF NOT EXISTS stream_problem_sequence "
+                                "(last_problem_id INTEGER)")
+
+    def open(self, host_name, service, timestamp):
+        with self.lock:
+            with _immediate_transaction(self.connection):
+                row = self.connection.execute("SELECT problem_id FROM stream_problems "
+                                              "WHERE host = ? AND service = ? "
+                                              "AND recovered_at IS NULL",
+                                              (host_name, service or '')).fetchone()
+                if row is not None:
+                    return row[0]
+                problem_id = self._next_problem_id(timestamp)
+                self.connection.execute("INSERT OR REPLACE INTO stream_problems "
+                                        "VALUES (?, ?, ?, ?, NULL)",
+                                        (host_name, service or '', problem_id, self.clock()))
+        return problem_id
+
+    def recover(self, host_name, service):
+        now = self.clock()
+        with self.lock:
+            with _immediate_transaction(self.connection):
+                self.connection.execute("UPDATE stream_problems SET recovered_at = ? "
+                                        "WHERE host = ? AND service = ? AND recovered_at IS NULL",
+                                        (now, host_name, service or ''))
+                self.connection.execute("DELETE FROM stream_problems WHERE recovered_at < ?",
+                                        (now - self.RECOVERED_RETENTION,))
+
+    def get(self, host_name, service):
+        with self.lock:
+            row = self.connection.execute("SELECT problem_id FROM stream_problems "
+                                          "WHERE host = ? AND service = ?",
+                                          (host_name, service or '')).fetchone()
+        return row[0] if row else None
+
+    def close(self, host_name, service):
+        with self.lock:
+            with _immediate_transaction(self.connection):
+                row = self.connection.execute("SELECT problem_id FROM stream_problems "
+                                              "WHERE host = ? AND service = ?",
+                                              (host_name, service or '')).fetchone()
+                self.connection.execute("DELETE FROM stream_problems "
+                                        "WHERE host = ? AND service = ?",
+                                        (host_name, service or ''))
+        return row[0] if row else None
+
+    def active_labels(self, problems):
+        opened_before = self.clock() - self.STALE_AFTER
+        with self.lock:
+            rows = self.connection.execute("SELECT host, service, problem_id, opened_at "
+                                           "FROM stream_problems "
+                                           "WHERE recovered_at IS NULL").fetchall()
+        return set("%s#%s#%s" % (IcingaEnvironment.ICINGA_PREFIX, problem_id, host_name)
+                   for host_name, service, problem_id, opened_at in rows
+                   if (host_name, service or None) in problems or opened_at >= opened_before)
+
+    def forget_stale(self, problems):
+        opened_before = self.clock() - self.STALE_AFTER
+        with self.lock:
+            with _immediate_transaction(self.connection):
+                rows = self.connection.execute("SELECT host, service FROM stream_problems "
+                                               "WHERE opened_at < ?", (opened_before,)).fetchall()
+                stale = [row for row in rows if (row[0], row[1] or None) not in problems]
+                self.connection.executemany("DELETE FROM stream_problems "
+                                            "WHERE host = ? AND service = ?", stale)
+        return len(stale)
+
+    def _next_problem_id(self, timestamp):
+        row = self.connection.execute("SELECT last_problem_id "
+                                      "FROM stream_problem_sequence").fetchone()
+        problem_id = max(int(timestamp * 1000), row[0] + 1 if row else 0)
+        self.connection.execute("DELETE FROM stream_problem_sequence")
+        self.connection.execute("INSERT INTO stream_problem_sequence VALUES (?)", (problem_id,))
+        return str(problem_id)
+
+
+class Icinga2EventMapper(object):
+    SERVICE_STATES = ['OK', 'WARNING', 'CRITICAL', 'UNKNOWN']
+    HOST_STATES = ['UP', 'DOWN']
+    HOST_CHECK_STATES = ['UP', 'UP', 'DOWN', 'DOWN']
+    NOTIFICATION_TYPES = {'FLAPPINGEND': 'FLAPPINGSTOP',
+                          'DOWNTIMEREMOVED': 'DOWNTIMECANCELLED'}
+
+    def __init__(self, clock=time.time, problems=None):
+        self.clock = clock
+        self.lock = threading.Lock()
+        self.problems = problems or StreamProblems(clock=clock)
+        self.host_states = {}
+
+    def map(self, event):
+        if event.get('type') == 'StateChange':
+            self._track_state_change(event)
+            return None
+        if event.get('type') != 'Notification':
+            return None
+        return IcingaEnvironment(self.environment(event))
+
+    def environment(self, event):
+        host_name = self._text(event.get('host'))
+        service = self._text(event.get('service')) or None
+        notification_type = self._text(event.get('notification_type')).upper()
+        notification_type = self.NOTIFICATION_TYPES.get(notification_type, notification_type)
+        check_result = event.get('check_result') or {}
+        timestamp = event.get('timestamp') or self.clock()
+        environment = {'ICINGA_NOTIFICATIONTYPE': notification_type,
+                       'ICINGA_HOSTNAME': host_name,
+                       'ICINGA_NOTIFICATIONAUTHOR': self._text(event.get('author')),
+                       'ICINGA_NOTIFICATIONCOMMENT': self._text(event.get('text')),
+                       'ICINGA_SHORTDATETIME': time.strftime('%Y-%m-%d %H:%M:%S',
+                                                             time.localtime(timestamp))}
+        state = self._state_name(check_result.get('state'), service, from_check_result=True)
+        output = self._text(check_result.get('output'))
+        with self.lock:
+            if service:
+                environment.update({'ICINGA_SERVICEDESC': service,
+                                    'ICINGA_SERVICESTATE': state,
+                                    'ICINGA_SERVICEOUTPUT': output,
+                                    'ICINGA_HOSTSTATE': self.host_states.get(host_name, 'UP')})
+                prefix = 'ICINGA_SERVICE'
+            else:
+                environment.update({'ICINGA_HOSTSTATE': state,
+                                    'ICINGA_HOSTOUTPUT': output})
+                prefix = 'ICINGA_HOST'
+            if notification_type == 'RECOVERY':
+                problem_id = self.problems.close(host_name, service)
+                if problem_id is None:
+                    raise ValueError("No open problem known for %s" %
+                                     self._describe(host_name, service))
+                environment['ICINGA_LAST%sPROBLEMID' % prefix[len('ICINGA_'):]] = problem_id
+            elif notification_type == 'PROBLEM':
+                environment[prefix + 'PROBLEMID'] = self.problems.open(host_name, service,
+                                                                       timestamp)
+            else:
+                environment[prefix + 'PROBLEMID'] = self.problems.get(host_name, service)
+        return environment
+
+    def _track_state_change(self, event):
+        host_name = self._text(event.get('host'))
+        service = self._text(event.get('service')) or None
+        if event.get('state') is None:
+            state = self._state_name((event.get('check_result') or {}).get('state'), service,
+                                     from_check_result=True)
+        else:
+            state = self._state_name(event.get('state'), service)
+        with self.lock:
+            if not service:
+                self.host_states[host_name] = state
+            if event.get('state_type') != 1:
+                return
+            if state in ('OK', 'UP'):
+                self.problems.recover(host_name, service)
+            elif state is not None:
+                self.problems.open(host_name, service, event.get('timestamp') or self.clock())
+
+    def _state_name(self, state, service, from_check_result=False):
+        if service:
+            states = self.SERVICE_STATES
+        elif from_check_result:
+            states = self.HOST_CHECK_STATES
+        else:
+            states = self.HOST_STATES
+        try:
+            return states[int(state)]
+        except (TypeError, ValueError, IndexError):
+            return None
+
+    def _describe(self, host_name, service):
+        if service:
+            return "%s on %s" % (service, host_name)
+        return host_name
+
+    def _text(self, value):
+        if value is None:
+            return ''
+        if isinstance(value, unicode):
+            return value.encode('utf-8')
+        return str(value)
+
+
+class Icinga2EventStream(object):
+
+    def __init__(self, url, username, password, queue_name='icinga2jira',
+                 types=('Notification', 'StateChange'), verify=False, connect_timeout=10):
+        self.url = url.rstrip('/') + '/v1/events'
+        self.auth = (username, password)
+        self.queue_name = queue_name
+        self.types = list(types)
+        self.verify = verify
+        self.connect_timeout = connect_timeout
+
+    def events(self):
+        response = requests.post(self.url, params={'queue': self.queue_name, 'types': self.types},
+                                 auth=self.auth, headers={'Accept': 'application/json'},
+                                 verify=self.verify, stream=True,
+                                 timeout=(self.connect_timeout, None))
+        try:
+            response.raise_for_status()
+            for line in response.iter_lines():
+                if line.strip():
+                    yield json.loads(line)
+        finally:
+            response.close()
+
+
+class EventStreamPipeline(object):
+
+    def __init__(self, stream, mapper, handlers, workers=4, queue_size=1000, reconnect_delay=5,
+                 sleep=time.sleep, target_for=None, flush_interval=1):
+        self.stream = stream
+        self.mapper = mapper
+        if not isinstance(handlers, dict):
+            handlers = {DEFAULT_JIRA_TARGET: handlers}
+        self.handlers = handlers
+        self.target_for = target_for or (lambda icinga_environment: DEFAULT_JIRA_TARGET)
+        self.workers = workers
+        self.queues = dict((name, PriorityEventQueue(queue_size)) for name in handlers)
+        self.reconnect_delay = reconnect_delay
+        self.sleep = sleep
+        self.flush_interval = flush_interval
+        self.stopped = threading.Event()
+        self.flusher_stopped = threading.Event()
+        self.threads = []
+        self.flusher = None
+        self.lock = threading.Lock()
+        self.in_flight = {}
+        self.counters = {'handled': 0, 'duplicate': 0, 'failed': 0, 'skipped': 0}
+
+    def start(self):
+        for name in sorted(self.handlers):
+            for _ in range(self.workers):
+                thread = threading.Thread(target=self._work, args=(name,))
+                thread.daemon = True
+                thread.start()
+                self.threads.append(thread)
+        self.flusher = threading.Thread(target=self._flush)
+        self.flusher.daemon = True
+        self.flusher.start()
+
+    def submit(self, event):
+        try:
+            icinga_environment = self.mapper.map(event)
+        except ValueError as e:
+            print("Skipping Icinga event: %s" % e)
+            self._count('skipped')
+            return False
+        if icinga_environment is None:
+            return False
+        queue = self.queues[self.target_for(icinga_environment)]
+        while not self.stopped.is_set():
+            try:
+                queue.put(icinga_environment, timeout=1)
+                return True
+            except Full:
+                continue
+        return False
+
+    def run(self):
+        if not self.threads:
+            self.start()
+        try:
+            while not self.stopped.is_set():
+                try:
+                    for event in self.stream.events():
+                        self.submit(event)
+                        if self.stopped.is_set():
+                            break
+                except (IOError, ValueError) as e:
+                    print("Icinga event stream interrupted: %s" % e)
+                if not self.stopped.is_set():
+                    self.sleep(self.reconnect_delay)
+        finally:
+            self.stop()
+
+    def stop(self):
+        self.stopped.set()
+        for thread in self.threads:
+            if thread is not threading.current_thread():
+                thread.join()
+        self.flusher_stopped.set()
+        if self.flusher is not None and self.flusher is not threading.current_thread():
+            self.flusher.join()
+
+    def stats(self):
+        with self.lock:
+            return dict(self.counters)
+
+    def format_stats(self):
+        lines = []
+        for name in sorted(self.queues):
+            for line in self.queues[name].format_stats():
+                lines.append(line if len(self.queues) == 1 else "%s %s" % (name, line))
+        return lines
+
+    def _work(self, name):
+        queue = self.queues[name]
+        while not self.stopped.is_set() or len(queue):
+            try:
+                icinga_environment = queue.get(timeout=0.2)
+            except Empty:
+                continue
+            ordering_key = (name, queue.ordering_key(icinga_environment))
+            with self.lock:
+                if ordering_key in self.in_flight:
+                    self.in_flight[ordering_key].append(icinga_environment)
+                    continue
+                self.in_flight[ordering_key] = []
+            while icinga_environment is not None:
+                self._handle(name, icinga_environment)
+                with self.lock:
+                    if self.in_flight[ordering_key]:
+                        icinga_environment = self.in_flight[ordering_key].pop(0)
+                    else:
+                        del self.in_flight[ordering_key]
+                        icinga_environment = None
+
+    def _handle(self, name, icinga_environment):
+        try:
+            if self.handlers[name].handle(icinga_environment) is None:
+                self._count('duplicate')
+            else:
+                self._count('handled')
+        except Exception as e:
+            print("An error occurred while handling event %s: %s" %
+                  (icinga_environment.notification_type, e))
+            self._count('failed')
+
+    def _flush(self):
+        while True:
+            self.flusher_stopped.wait(self.flush_interval)
+            for name in sorted(self.handlers):
+                try:
+                    self.handlers[name].flush_scheduled()
+                except Exception as e:
+                    print("WARNING: scheduled flush for JIRA target %s failed: %s" % (name, e))
+            if self.flusher_stopped.is_set():
+                break
+
+    def _count(self, name):
+        with self.lock:
+            self.counters[name] += 1
+
+
+def sync_ticket_index(targets, ticket_index):
+    if ticket_index is None:
+        print("The sync command needs state_db to be configured")
+        sys.exit(1)
+    failed = False
+    for name in targets.names():
+        try:
+            count = TicketIndexSync(targets.target(name).session(), ticket_index.for_target(name),
+                                    targets.project_keys(name)).warm_up()
+            print("Ticket index synchronized with JIRA target %s, %d labels updated" %
+                  (name, count))
+        except Exception as e:
+            print("An error occurred while synchronizing the ticket index with JIRA target %s: %s" %
+                  (name, e))
+            failed = True
+    if failed:
+        sys.exit(1)
+
+
+def reconcile(targets, ticket_index, active_labels):
+    failed = False
+    for name in targets.names():
+        config = targets.target(name).config
+        try:
+            reconciler = Reconciler(targets.target(name).session(), active_labels,
+                                    targets.project_keys(name),
+                                    ticket_index and ticket_index.for_target(name),
+                                    int(config['reconcile_page_size']),
+                                    int(config['cascade_concurrency']), config['url'])
+            seen, closed = reconciler.run()
+            print("Reconciliation of JIRA target %s checked %d open tickets and closed %d "
+                  "stale tickets" % (name, seen, closed))
+        except Exception as e:
+            print("An error occurred during reconciliation of JIRA target %s: %s" % (name, e))
+            failed = True
+    if failed:
+        sys.exit(1)
+
+
+def stream_events(targets, config, router, ticket_index, claims=None):
+    if not config['icinga_api_url']:
+        print("The stream command needs icinga_api_url to be configured")
+        sys.exit(1)
+    handlers = {}
+    ticket_index_syncs = []
+    for name in targets.names():
+        target = targets.target(name)
+        handlers[name] = EventHandler(target.session(), target.config, router, ticket_index, claims,
+                                      scheduled=True, target=name)
+        if ticket_index is not None:
+            ticket_index_sync = TicketIndexSync(target.session(), ticket_index.for_target(name),
+                                                targets.project_keys(name))
+            ticket_index_sync.warm_up()
+            ticket_index_sync.start(int(config['sync_interval']))
+            ticket_index_syncs.append(ticket_index_sync)
+    stream = Icinga2EventStream(config['icinga_api_url'], config['icinga_api_username'],
+                                config['icinga_api_password'])
+    problems = StreamProblems(config['state_db']) if config['state_db'] else None
+    pipeline = EventStreamPipeline(stream, Icinga2EventMapper(problems=problems), handlers,
+                                   int(config['stream_workers']), int(config['stream_queue_size']),
+                                   target_for=targets.target_for)
+    try:
+        pipeline.run()
+    except KeyboardInterrupt:
+        pipeline.stop()
+    finally:
+        for ticket_index_sync in ticket_index_syncs:
+            ticket_index_sync.stop()
+    print("Event stream stopped: %(handled)d handled, %(duplicate)d handled by other nodes, "
+          "%(failed)d failed, %(skipped)d skipped" % pipeline.stats())
+    for line in pipeline.format_stats():
+        print(line)
+
+
+def format_audit_entry(entry):
+    return "%s %-17s %s%s -> %s (%s, %.3fs)" % (
+        time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(entry['timestamp'])),
+        entry['notification_type'],
+        entry['host'], " / %s" % entry['service'] if entry.get('service') else '',
+        ",".join(entry['issues']) or '-', entry['outcome'], entry['duration'])
+
+
+def audit(config, args):
+    if not config['audit_log']:
+        print("The audit command needs audit_log to be configured")
+        sys.exit(1)
+    audit_log = AuditLog(config['audit_log'])
+    if args['--reindex']:
+        print("Audit log index covers %d bytes" % audit_log.build_index())
+    elif args['--mttr']:
+        report = audit_log.mttr(args['--host'])
+        print("%(resolved)d problems recovered, %(open)d still open; time to recovery "
+              "mean %(mean).0fs, median %(median).0fs, max %(max).0fs" % report)
+    else:
+        if args['--label']:
+            entries = audit_log.find_by_label(args['--label'])
+        else:
+            entries = audit_log.find_by_host(args['--host'])
+        for entry in entries:
+            print(format_audit_entry(entry))
+
+
+def print_cache_stats(config, targets=None):
+    cache_files = []
+    if config['cache_dir'] and os.path.isdir(config['cache_dir']):
+        cache_files = [os.path.join(config['cache_dir'], file_name)
+                       for file_name in sorted(os.listdir(config['cache_dir']))
+                       if file_name.endswith('.json')]
+    metadata_cache_files = [config['metadata_cache_file']]
+    if targets is not None:
+        metadata_cache_files = [targets.target(name).config['metadata_cache_file']
+                                for name in targets.names()]
+    for metadata_cache_file in reversed(metadata_cache_files):
+        if (metadata_cache_file and os.path.exists(metadata_cache_file) and
+                metadata_cache_file not in cache_files):
+            cache_files.insert(0, metadata_cache_file)
+    if not cache_files:
+        print("No persisted caches found, configure cache_dir to collect cache statistics")
+    for cache_file in cache_files:
+        name = os.path.splitext(os.path.basename(cache_file))[0]
+        print(Cache(name, max_entries=sys.maxint, persist_file=cache_file).format_stats())
+
+
+def main(argv=None):
+    args = parse_arguments(argv)
     try:
         config = read_configuration_file(args)
-        icinga_environment = IcingaEnvironment(os.environ)
+        router = read_routing_rules(args)
+        targets = read_jira_targets(args, config, router)
+        CACHES.configure(config['cache_dir'] or None, int(config['cache_max_entries']),
+                         int(config['cache_max_bytes']))
+        claims = None
+        if config['claim_store']:
+            claims = EventClaims(create_claim_store(config['claim_store']), config['node_name'],
+                                 int(config['claim_lease']), int(config['claim_retention']))
+        if not (args['reconcile'] or args['stats'] or args['sync'] or args['stream'] or
+                args['audit']):
+            icinga_environment = IcingaEnvironment(os.environ)
     except IOError as e:
         print("Could not find configuration file: %s" % e)
         print_usage_and_exit(args)
@@ -316,16 +2947,42 @@ if __name__ == '__main__':
         print("Configuration file is corrupt: %s" % e)
         print_usage_and_exit(args)
 
-    jira = open_jira_session(config['url'],
-                             config['username'],
-                             config['password'])
+    if args['stats']:
+        print_cache_stats(config, targets)
+        return
+
+    if args['audit']:
+        audit(config, args)
+        return
+
+    if args['reconcile']:
+        try:
+            active_labels, problems = read_status_file(args)
+        except (IOError, ValueError) as e:
+            print("Could not read Icinga status file: %s" % e)
+            print_usage_and_exit(args)
+
+    ticket_index = None
+    if config['state_db']:
+        ticket_index = TicketIndex(config['state_db'])
 
     try:
-        issues = issue_factory(jira, icinga_environment, config).execute()
-        issue_url_list_as_string = ",".join(create_ticket_list(config, issues))
-        print("Event %s has been successfully handled: %s" %
-              (icinga_environment.notification_type, issue_url_list_as_string))
-    except Exception as e:
-        print("An error occurred while handling event %s: %s" %
-              (icinga_environment.notification_type, e))
-        sys.exit(1)
+        if args['reconcile']:
+            if config['state_db']:
+                stream_problems = StreamProblems(config['state_db'])
+                stream_problems.forget_stale(problems)
+                active_labels |= stream_problems.active_labels(problems)
+            reconcile(targets, ticket_index, active_labels)
+        elif args['sync']:
+            sync_ticket_index(targets, ticket_index)
+        elif args['stream']:
+            stream_events(targets, config, router, ticket_index, claims)
+        else:
+            target = targets.target(targets.target_for(icinga_environment))
+            handle_event(target.session(), target.config, router, ticket_index, icinga_environment,
+                         claims, target.name)
+    finally:
+        CACHES.save_all()
+
+if __name__ == '__main__':
+    main()
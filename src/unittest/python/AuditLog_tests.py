@@ -0,0 +1,136 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from icinga2jira import AuditLog, IcingaEnvironment, IssueReference
+
+
+def problem(problem_id, host_name='myserver1', service='disk'):
+    return IcingaEnvironment({'ICINGA_NOTIFICATIONTYPE': 'PROBLEM', 'ICINGA_HOSTNAME': host_name,
+                              'ICINGA_SERVICEDESC': service, 'ICINGA_SERVICESTATE': 'CRITICAL',
+                              'ICINGA_SERVICEPROBLEMID': problem_id})
+
+
+def recovery(problem_id, host_name='myserver1', service='disk'):
+    return IcingaEnvironment({'ICINGA_NOTIFICATIONTYPE': 'RECOVERY', 'ICINGA_HOSTNAME': host_name,
+                              'ICINGA_SERVICEDESC': service, 'ICINGA_SERVICESTATE': 'OK',
+                              'ICINGA_LASTSERVICEPROBLEMID': problem_id})
+
+
+class TestAuditLog(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.now = 1000.0
+        self.audit_log = AuditLog(os.path.join(self.temp_dir, 'audit.jsonl'),
+                                  clock=lambda: self.now)
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def test_record_writes_one_json_line_per_event(self):
+        self.audit_log.record(problem('1'), [IssueReference('MON-1')], started_at=999.5)
+
+        entries = list(self.audit_log.entries())
+        self.assertEqual(1, len(entries))
+        self.assertEqual({'timestamp': 999.5, 'duration': 0.5, 'notification_type': 'PROBLEM',
+                          'host': 'myserver1', 'service': 'disk', 'labels': ['ICI#1#myserver1'],
+                          'issues': ['MON-1'], 'outcome': 'ok'}, entries[0])
+
+    def test_failed_event_records_error(self):
+        entry = self.audit_log.record(problem('1'), outcome='error',
+                                      error=ValueError('JIRA is down'))
+
+        self.assertEqual('error', entry['outcome'])
+        self.assertEqual('JIRA is down', entry['error'])
+        self.assertEqual([], entry['issues'])
+
+    def test_recovery_is_recorded_under_recovery_label(self):
+        entry = self.audit_log.record(recovery('1'), [IssueReference('MON-1')])
+
+        self.assertEqual(['ICI#1#myserver1'], entry['labels'])
+
+    def test_find_without_index_scans_log(self):
+        self.audit_log.record(problem('1'), [IssueReference('MON-1')])
+        self.audit_log.record(problem('2', 'otherserver'), [IssueReference('MON-2')])
+
+        self.assertEqual(['MON-1'], [entry['issues'][0] for entry in
+                                     self.audit_log.find_by_label('ICI#1#myserver1')])
+        self.assertEqual(['MON-2'], [entry['issues'][0] for entry in
+                                     self.audit_log.find_by_host('otherserver')])
+
+    def test_find_uses_index_and_unindexed_tail(self):
+        for problem_id in range(50):
+            self.audit_log.record(problem(str(problem_id), 'server%d' % (problem_id % 5)),
+                                  [IssueReference('MON-%d' % problem_id)])
+        self.audit_log.build_index()
+        self.audit_log.record(recovery('7', 'server2'), [IssueReference('MON-7')])
+
+        entries = self.audit_log.find_by_label('ICI#7#server2')
+
+        self.assertEqual(['PROBLEM', 'RECOVERY'], [entry['notification_type'] for entry in entries])
+        self.assertEqual(11, len(self.audit_log.find_by_host('server2')))
+        self.assertEqual([], self.audit_log.find_by_host('unknown'))
+
+    def test_index_files_are_sorted_fixed_size_records(self):
+        self.audit_log.record(problem('1'))
+        self.audit_log.record(problem('2'))
+
+        indexed_size = self.audit_log.build_index()
+
+        self.assertEqual(os.path.getsize(self.audit_log.path), indexed_size)
+        label_index = self.audit_log.path + '.labels.idx'
+        self.assertEqual(AuditLog.INDEX_HEADER.size + 2 * AuditLog.INDEX_ENTRY.size,
+                         os.path.getsize(label_index))
+
+    def test_record_appends_to_current_index(self):
+        self.audit_log.record(problem('1'))
+        self.audit_log.build_index()
+
+        self.audit_log.record(recovery('1'))
+
+        label_index = self.audit_log.path + '.labels.idx'
+        with open(label_index, 'rb') as index_file:
+            indexed_size, sorted_count = AuditLog.INDEX_HEADER.unpack(
+                index_file.read(AuditLog.INDEX_HEADER.size))
+        self.assertEqual(os.path.getsize(self.audit_log.path), indexed_size)
+        self.assertEqual(1, sorted_count)
+        self.assertEqual(AuditLog.INDEX_HEADER.size + 2 * AuditLog.INDEX_ENTRY.size,
+                         os.path.getsize(label_index))
+        self.assertEqual(['PROBLEM', 'RECOVERY'],
+                         [entry['notification_type'] for entry in
+                          self.audit_log.find_by_label('ICI#1#myserver1')])
+
+    def test_stale_index_is_not_extended(self):
+        self.audit_log.record(problem('1'))
+        self.audit_log.build_index()
+        with open(self.audit_log.path, 'a') as log_file:
+            log_file.write('{"host": "otherserver", "labels": []}\n')
+
+        self.audit_log.record(recovery('1'))
+
+        self.assertEqual(AuditLog.INDEX_HEADER.size + AuditLog.INDEX_ENTRY.size,
+                         os.path.getsize(self.audit_log.path + '.labels.idx'))
+        self.assertEqual(2, len(self.audit_log.find_by_label('ICI#1#myserver1')))
+
+    def test_mttr_pairs_problems_with_recoveries(self):
+        self.now = 1000.0
+        self.audit_log.record(problem('1'), [IssueReference('MON-1')])
+        self.audit_log.record(problem('2', 'otherserver'), [IssueReference('MON-2')])
+        self.audit_log.record(problem('3'), outcome='error')
+        self.now = 1100.0
+        self.audit_log.record(recovery('1'), [IssueReference('MON-1')])
+        self.now = 1300.0
+        self.audit_log.record(recovery('2', 'otherserver'), [IssueReference('MON-2')])
+
+        self.assertEqual({'resolved': 2, 'open': 0, 'mean': 200.0, 'median': 300.0, 'max': 300.0},
+                         self.audit_log.mttr())
+        self.assertEqual(100.0, self.audit_log.mttr('myserver1')['mean'])
+
+    def test_partial_last_line_is_ignored(self):
+        self.audit_log.record(problem('1'))
+        with open(self.audit_log.path, 'a') as log_file:
+            log_file.write('{"host": "myser')
+
+        self.assertEqual(1, len(list(self.audit_log.entries())))
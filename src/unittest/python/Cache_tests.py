@@ -0,0 +1,168 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from icinga2jira import Cache, CacheRegistry
+
+
+class TestCache(unittest.TestCase):
+
+    def setUp(self):
+        self.now = 1000.0
+        self.temp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def create_cache(self, **settings):
+        return Cache('any', clock=lambda: self.now, **settings)
+
+    def test_get_counts_hits_and_misses(self):
+        cache = self.create_cache()
+        cache.set('key', 'value')
+
+        self.assertEqual('value', cache.get('key'))
+        self.assertEqual(None, cache.get('other'))
+        stats = cache.stats()
+        self.assertEqual((1, 1, 0.5), (stats['hits'], stats['misses'], stats['hit_rate']))
+
+    def test_least_recently_used_entry_is_evicted(self):
+        cache = self.create_cache(max_entries=2)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        cache.get('a')
+        cache.set('c', 3)
+
+        self.assertEqual(None, cache.get('b'))
+        self.assertEqual(1, cache.get('a'))
+        self.assertEqual(3, cache.get('c'))
+        self.assertEqual(1, cache.stats()['evictions'])
+
+    def test_entries_are_evicted_when_exceeding_max_bytes(self):
+        cache = self.create_cache(max_bytes=400)
+        for index in range(10):
+            cache.set('key%d' % index, 'x' * 50)
+
+        self.assertTrue(cache.stats()['bytes'] <= 400)
+        self.assertTrue(0 < len(cache) < 10)
+        self.assertEqual('x' * 50, cache.get('key9'))
+
+    def test_replacing_entry_keeps_byte_accounting(self):
+        cache = self.create_cache()
+        cache.set('key', 'x' * 100)
+        cache.set('key', 'y')
+
+        self.assertEqual(1, len(cache))
+        self.assertTrue(cache.stats()['bytes'] < 100)
+
+    def test_expired_entries_are_dropped(self):
+        cache = self.create_cache(ttl=10)
+        cache.set('key', 'value')
+        cache.set('forever', 'value', ttl=0)
+        self.now += 11
+
+        self.assertEqual(None, cache.get('key'))
+        self.assertEqual('value', cache.get('forever'))
+        self.assertEqual(1, cache.stats()['expirations'])
+
+    def test_get_or_load_loads_only_on_miss(self):
+        cache = self.create_cache()
+        loads = []
+
+        def loader():
+            loads.append(1)
+            return 'loaded'
+
+        self.assertEqual('loaded', cache.get_or_load('key', loader))
+        self.assertEqual('loaded', cache.get_or_load('key', loader))
+        self.assertEqual(1, len(loads))
+
+    def test_invalidate(self):
+        cache = self.create_cache()
+        cache.set('key', 'value')
+        cache.invalidate('key')
+        cache.invalidate('unknown')
+
+        self.assertEqual(None, cache.get('key'))
+        self.assertEqual(0, cache.stats()['bytes'])
+
+    def test_entries_and_counters_are_persisted(self):
+        persist_file = os.path.join(self.temp_dir, 'any.json')
+        cache = self.create_cache(ttl=10, persist_file=persist_file)
+        cache.set('key', ['MON-1'])
+        cache.set('expiring', 'value', ttl=1)
+        cache.get('key')
+        cache.save()
+        self.now += 5
+
+        restored = self.create_cache(ttl=10, persist_file=persist_file)
+
+        self.assertEqual(['MON-1'], restored.get('key'))
+        self.assertEqual(None, restored.get('expiring'))
+        self.assertEqual(2, restored.stats()['hits'])
+        self.now += 6
+        self.assertEqual(None, restored.get('key'))
+
+    def test_corrupt_persist_file_is_ignored(self):
+        persist_file = os.path.join(self.temp_dir, 'any.json')
+        with open(persist_file, 'w') as file_pointer:
+            file_pointer.write('[1, 2')
+
+        self.assertEqual(0, len(self.create_cache(persist_file=persist_file)))
+
+    def test_format_stats(self):
+        cache = self.create_cache()
+        cache.get('key')
+
+        self.assertTrue(cache.format_stats().startswith(
+            'any: 0 entries, 0 bytes, 0 hits, 1 misses'))
+
+
+class TestCacheRegistry(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.registry = CacheRegistry()
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def test_get_returns_same_cache_per_name(self):
+        self.assertTrue(self.registry.get('labels') is self.registry.get('labels'))
+
+    def test_get_uses_configured_limits_and_cache_dir(self):
+        self.registry.configure(self.temp_dir, max_entries=5, max_bytes=100)
+
+        persisted = self.registry.get('labels', ttl=30, persist=True)
+        transient = self.registry.get('templates')
+
+        self.assertEqual((5, 100, 30), (persisted.max_entries, persisted.max_bytes, persisted.ttl))
+        self.assertEqual(os.path.join(self.temp_dir, 'labels.json'), persisted.persist_file)
+        self.assertEqual(os.path.join(self.temp_dir, 'templates.json'), transient.persist_file)
+        self.assertFalse(transient.persist_entries)
+
+    def test_transient_caches_persist_only_statistics(self):
+        self.registry.configure(self.temp_dir)
+        templates = self.registry.get('templates')
+        templates.set('key', 'value')
+        templates.get('key')
+        self.registry.save_all()
+
+        restored = CacheRegistry()
+        restored.configure(self.temp_dir)
+        templates = restored.get('templates')
+
+        self.assertEqual(0, len(templates))
+        self.assertEqual(1, templates.stats()['hits'])
+
+    def test_save_all_and_format_stats(self):
+        self.registry.configure(self.temp_dir)
+        self.registry.get('labels', persist=True).set('key', 'value')
+        self.registry.get('templates').get('key')
+
+        self.registry.save_all()
+
+        self.assertTrue(os.path.exists(os.path.join(self.temp_dir, 'labels.json')))
+        self.assertEqual(['labels', 'templates'],
+                         [line.split(':')[0] for line in self.registry.format_stats()])
@@ -3,7 +3,7 @@ import unittest
 from mock import Mock, patch
 from jira.exceptions import JIRAError
 
-from icinga2jira import CloseIssue, CantCloseTicketException
+from icinga2jira import CloseIssue, CantCloseTicketException, TicketIndex, IssueReference, CACHES
 
 ANY_ISSUE = {'id': 'any id'}
 ANY_TRANSITIONS = [{'name': 'Close', 'id': 45},
@@ -26,9 +26,19 @@ class TestCloseIssue(unittest.TestCase):
         self.close_issue = CloseIssue(self.jira_mock, self.icinga_environment)
         self.print_patcher = patch('__builtin__.print')
         self.print_patcher.start()
+        CACHES.clear()
 
     def tearDown(self):
         self.print_patcher.stop()
+        CACHES.clear()
+
+    def create_workflow_issue_mock(self, key):
+        issue = Mock()
+        issue.key = key
+        issue.fields.project.key = 'MON'
+        issue.fields.issuetype.name = 'Technical task'
+        issue.fields.status.name = 'Open'
+        return issue
 
     def test_find_jira_issue_by_label(self):
         self.jira_mock.search_issues.return_value = 'found issue'
@@ -39,6 +49,24 @@ class TestCloseIssue(unittest.TestCase):
         self.ticket.get_jira_recovery_label.assert_called()
         self.jira_mock.search_issues.assert_called_with("labels='ICI#123'")
 
+    def test_find_jira_issues_by_label_uses_ticket_index(self):
+        ticket_index = TicketIndex(':memory:')
+        ticket_index.add('ICI#123', 'myserver1', 'MON-1')
+        self.jira_mock.issue.return_value = 'indexed issue'
+
+        result = CloseIssue(self.jira_mock, self.icinga_environment,
+                            ticket_index)._find_jira_issues_by_label()
+
+        self.assertEqual(['indexed issue'], result)
+        self.jira_mock.issue.assert_called_with('MON-1', fields='labels,project,issuetype,status')
+        self.assertEqual(0, self.jira_mock.search_issues.call_count)
+
+    def test_find_jira_issues_by_label_searches_when_index_misses(self):
+        CloseIssue(self.jira_mock, self.icinga_environment,
+                   TicketIndex(':memory:'))._find_jira_issues_by_label()
+
+        self.jira_mock.search_issues.assert_called_with("labels='ICI#123'")
+
     def test_set_comment(self):
         with patch.object(CloseIssue, 'create_description', return_value='comment') as create_mock:
             close_issue = CloseIssue(self.jira_mock, self.icinga_environment)
@@ -62,6 +90,41 @@ class TestCloseIssue(unittest.TestCase):
 
         self.assertEqual(45, actual_transition_id)
 
+    def test_get_close_transition_caches_transitions_per_workflow(self):
+        self.jira_mock.transitions.return_value = ANY_TRANSITIONS
+
+        self.close_issue._get_close_transition(self.create_workflow_issue_mock('MON-1'))
+        transition_id = self.close_issue._get_close_transition(
+            self.create_workflow_issue_mock('MON-2'))
+
+        self.assertEqual(45, transition_id)
+        self.assertEqual(1, self.jira_mock.transitions.call_count)
+
+    def test_transitions_are_cached_per_jira_instance(self):
+        self.jira_mock.transitions.return_value = ANY_TRANSITIONS
+        other_jira_mock = Mock()
+        other_jira_mock.transitions.return_value = [{'name': 'Close', 'id': 71}]
+
+        CloseIssue(self.jira_mock, self.icinga_environment,
+                   cache_namespace='https://jira.example.com') \
+            ._get_close_transition(self.create_workflow_issue_mock('MON-1'))
+        transition_id = CloseIssue(other_jira_mock, self.icinga_environment,
+                                   cache_namespace='https://jira.dba.example.com') \
+            ._get_close_transition(self.create_workflow_issue_mock('MON-2'))
+
+        self.assertEqual(71, transition_id)
+
+    def test_failed_transition_invalidates_cached_transitions(self):
+        self.jira_mock.transitions.return_value = ANY_TRANSITIONS
+        self.jira_mock.transition_issue.side_effect = JIRAError
+
+        self.assertRaises(CantCloseTicketException, self.close_issue._close,
+                          self.create_workflow_issue_mock('MON-1'))
+        self.assertRaises(CantCloseTicketException, self.close_issue._close,
+                          self.create_workflow_issue_mock('MON-2'))
+
+        self.assertEqual(2, self.jira_mock.transitions.call_count)
+
     def test_get_close_transition_raises_exception_when_no_close_transition_has_been_found(self):
         transitions = [{'name': 'Start Work', 'id': 11}]
         self.jira_mock.transitions.return_value = transitions
@@ -115,6 +178,109 @@ class TestCloseIssue(unittest.TestCase):
             comment_mock.assert_called_twice_with(comment_str='comment')
             self.assertEqual(['issue1', 'issue2'], result)
 
+    def test_execute_removes_closed_issues_from_ticket_index(self):
+        ticket_index = Mock()
+
+        with patch.multiple(CloseIssue,
+                            _find_jira_issues_by_label=Mock(return_value=[create_issue_mock('a')]),
+                            _close=Mock(),
+                            _set_comment=Mock()):
+            issue = CloseIssue(self.jira_mock, self.icinga_environment, ticket_index).execute()[0]
+
+        ticket_index.remove_issue.assert_called_with(issue.key)
+
+    def test_execute_cascades_host_recovery_to_indexed_host_tickets(self):
+        ticket_index = TicketIndex(':memory:')
+        ticket_index.add('ICI#1#myserver1', 'myserver1', 'MON-1', is_host=True)
+        ticket_index.add('ICI#2#myserver1', 'myserver1', 'MON-2')
+        ticket_index.add('ICI#3#myserver1', 'myserver1', 'MON-3')
+        ticket_index.add('ICI#4#other', 'other', 'MON-4')
+        self.icinga_environment.host_name = 'myserver1'
+        self.icinga_environment.is_host_issue.return_value = True
+        close_mock = Mock()
+
+        with patch.multiple(CloseIssue,
+                            _find_jira_issues_by_label=Mock(return_value=[IssueReference('MON-1')]),
+                            _close=close_mock,
+                            _set_comment=Mock()):
+            close_issue = CloseIssue(self.jira_mock, self.icinga_environment, ticket_index,
+                                     cascade=True, concurrency=2)
+            result = close_issue.execute()
+
+        self.assertEqual(3, len(result))
+        self.assertEqual(3, close_mock.call_count)
+        self.assertEqual(['MON-2', 'MON-3'], sorted(str(issue.key) for issue in result[1:]))
+        self.assertEqual([], ticket_index.find_by_host('myserver1'))
+        self.assertEqual(['MON-4'], ticket_index.find_by_host('other'))
+
+    def test_cascade_leaves_storm_summary_of_other_hosts_open(self):
+        ticket_index = TicketIndex(':memory:')
+        ticket_index.add('ICI#1#myserver1', 'myserver1', 'MON-1', is_host=True)
+        ticket_index.add('ICI#5#myserver1', 'myserver1', 'MON-9', storm=True)
+        ticket_index.add('ICI#6#other', 'other', 'MON-9', storm=True)
+        self.icinga_environment.host_name = 'myserver1'
+        self.icinga_environment.is_host_issue.return_value = True
+        close_mock = Mock()
+
+        with patch.multiple(CloseIssue,
+                            _find_jira_issues_by_label=Mock(return_value=[IssueReference('MON-1')]),
+                            _close=close_mock,
+                            _set_comment=Mock()):
+            result = CloseIssue(self.jira_mock, self.icinga_environment, ticket_index,
+                                cascade=True).execute()
+
+        self.assertEqual(['MON-1'], [str(issue.key) for issue in result])
+        self.assertEqual(['MON-9'], ticket_index.find('ICI#6#other'))
+
+    def test_execute_does_not_cascade_service_recovery(self):
+        self.icinga_environment.is_host_issue.return_value = False
+        find_host_mock = Mock()
+
+        with patch.multiple(CloseIssue,
+                            _find_jira_issues_by_label=Mock(return_value=[]),
+                            _find_open_host_issues=find_host_mock):
+            CloseIssue(self.jira_mock, self.icinga_environment, cascade=True).execute()
+
+        self.assertEqual(0, find_host_mock.call_count)
+
+    def test_find_open_host_issues_without_index_uses_projected_search(self):
+        self.icinga_environment.host_name = 'myserver1'
+        matching, foreign = Mock(), Mock()
+        matching.key, matching.fields.labels = 'MON-1', ['ICI#7#myserver1']
+        foreign.key, foreign.fields.labels = 'MON-2', ['ICI#8#myserver10']
+        self.jira_mock.search_issues.return_value = [matching, foreign]
+
+        result = self.close_issue._find_open_host_issues()
+
+        self.assertEqual(['MON-1'], [issue.key for issue in result])
+        self.jira_mock.search_issues.assert_called_with(
+            'summary ~ "\\"myserver1\\"" AND resolution = Unresolved AND labels is not EMPTY',
+            maxResults=1000, fields='labels')
+
+    def test_recovery_detaches_label_from_storm_summary_with_open_problems(self):
+        summary = Mock()
+        summary.key = 'MON-1'
+        summary.fields.labels = ['ICINGA-STORM', 'ICI#123', 'ICI#124#myserver1']
+        close_mock = Mock()
+
+        with patch.object(CloseIssue, '_close', close_mock):
+            result = self.close_issue.close_issues([summary])
+
+        self.assertEqual([summary], result)
+        summary.update.assert_called_with(update={'labels': [{'remove': 'ICI#123'}]})
+        self.assertEqual(0, close_mock.call_count)
+
+    def test_last_recovery_closes_storm_summary(self):
+        summary = Mock()
+        summary.key = 'MON-1'
+        summary.fields.labels = ['ICINGA-STORM', 'ICI#123']
+
+        with patch.multiple(CloseIssue, _close=Mock(), _set_comment=Mock()):
+            self.close_issue.close_issues([summary])
+            self.assertEqual(1, CloseIssue._close.call_count)
+
+        self.assertEqual(0, summary.update.call_count)
+
     def test_execute_skips_issues_causing_CantCloseTicketException(self):
         find_mock = Mock(return_value=[create_issue_mock('a'), create_issue_mock('b')])
         close_mock = Mock(side_effect=CantCloseTicketException())
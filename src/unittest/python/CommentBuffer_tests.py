@@ -0,0 +1,106 @@
+import unittest
+
+from mock import Mock, patch
+from jira.exceptions import JIRAError
+
+from icinga2jira import CommentBuffer
+
+
+class TestCommentBuffer(unittest.TestCase):
+
+    def setUp(self):
+        self.now = 1000.0
+        self.jira_mock = Mock()
+        self.sleep_mock = Mock()
+        self.comment_buffer = CommentBuffer(':memory:', 5, sleep=self.sleep_mock)
+        self.print_patcher = patch('__builtin__.print')
+        self.print_patcher.start()
+
+    def tearDown(self):
+        self.print_patcher.stop()
+
+    def create_scheduled_buffer(self):
+        return CommentBuffer(':memory:', 5, sleep=self.sleep_mock, scheduled=True,
+                             clock=lambda: self.now)
+
+    def test_append_waits_and_writes_single_comment(self):
+        result = self.comment_buffer.append(self.jira_mock, 'MON-1', '* line', 'header')
+
+        self.assertTrue(result)
+        self.sleep_mock.assert_called_with(5)
+        self.jira_mock.add_comment.assert_called_with('MON-1', 'header\n* line')
+
+    def test_append_batches_lines_buffered_during_delay(self):
+        def buffer_more_lines(delay):
+            if self.sleep_mock.call_count == 1:
+                self.comment_buffer.append(self.jira_mock, 'MON-2', 'other issue')
+                self.comment_buffer.connection.execute(
+                    "INSERT INTO pending_comments (issue_key, header, line) "
+                    "VALUES ('MON-1', 'header', '* second')")
+        self.sleep_mock.side_effect = buffer_more_lines
+
+        self.comment_buffer.append(self.jira_mock, 'MON-1', '* first', 'header')
+
+        self.jira_mock.add_comment.assert_any_call('MON-1', 'header\n* first\n* second')
+        self.jira_mock.add_comment.assert_any_call('MON-2', 'other issue')
+        self.assertEqual(2, self.jira_mock.add_comment.call_count)
+
+    def test_flush_without_pending_lines_writes_nothing(self):
+        self.assertFalse(self.comment_buffer.flush(self.jira_mock, 'MON-1'))
+        self.assertEqual(0, self.jira_mock.add_comment.call_count)
+
+    def test_failed_comment_keeps_lines_pending(self):
+        self.jira_mock.add_comment.side_effect = JIRAError()
+
+        self.assertRaises(JIRAError, self.comment_buffer.append, self.jira_mock, 'MON-1', '* line')
+
+        self.jira_mock.add_comment.side_effect = None
+        self.assertTrue(self.comment_buffer.flush(self.jira_mock, 'MON-1'))
+        self.jira_mock.add_comment.assert_called_with('MON-1', '* line')
+
+    def test_scheduled_append_neither_waits_nor_comments(self):
+        comment_buffer = self.create_scheduled_buffer()
+
+        self.assertFalse(comment_buffer.append(self.jira_mock, 'MON-1', '* line'))
+
+        self.assertEqual(0, self.sleep_mock.call_count)
+        self.assertEqual(0, self.jira_mock.add_comment.call_count)
+
+    def test_flush_pending_writes_comments_after_delay(self):
+        comment_buffer = self.create_scheduled_buffer()
+        comment_buffer.append(self.jira_mock, 'MON-1', '* first', 'header')
+        self.now += 4
+        comment_buffer.append(self.jira_mock, 'MON-1', '* second', 'header')
+
+        self.assertEqual(0, comment_buffer.flush_pending(self.jira_mock))
+        self.now += 1
+        self.assertEqual(1, comment_buffer.flush_pending(self.jira_mock))
+
+        self.jira_mock.add_comment.assert_called_with('MON-1', 'header\n* first\n* second')
+        self.assertEqual(0, comment_buffer.flush_pending(self.jira_mock))
+
+    def test_flush_pending_retries_failed_comments(self):
+        comment_buffer = self.create_scheduled_buffer()
+        comment_buffer.append(self.jira_mock, 'MON-1', '* line')
+        self.now += 5
+        self.jira_mock.add_comment.side_effect = JIRAError()
+
+        self.assertEqual(0, comment_buffer.flush_pending(self.jira_mock))
+
+        self.jira_mock.add_comment.side_effect = None
+        self.now += 5
+        self.assertEqual(1, comment_buffer.flush_pending(self.jira_mock))
+        self.jira_mock.add_comment.assert_called_with('MON-1', '* line')
+
+    def test_targets_keep_their_comments_apart(self):
+        other_buffer = CommentBuffer(':memory:', 5, sleep=self.sleep_mock, target='dba')
+        other_buffer.connection = self.comment_buffer.connection
+        self.comment_buffer.connection.execute(
+            "INSERT INTO pending_comments (issue_key, header, line) "
+            "VALUES ('OPS-5', '', '* default')")
+
+        other_buffer.append(self.jira_mock, 'OPS-5', '* dba')
+
+        self.jira_mock.add_comment.assert_called_with('OPS-5', '* dba')
+        self.assertTrue(self.comment_buffer.flush(self.jira_mock, 'OPS-5'))
+        self.jira_mock.add_comment.assert_called_with('OPS-5', '* default')
@@ -0,0 +1,109 @@
+import unittest
+
+from mock import Mock, patch
+
+from icinga2jira import CACHES, CommentIssue, TicketIndex
+
+ANY_LABEL = 'ICI#12345#myserver1'
+
+
+def create_icinga_environment_mock(notification_type='ACKNOWLEDGEMENT'):
+    environment = Mock()
+    environment.notification_type = notification_type
+    environment.host_name = 'myserver1'
+    environment.service_problem_id = '12345'
+    environment.short_date_time = '11-26-2013 15:42:05'
+    environment.notification_author = 'operator'
+    environment.notification_comment = 'looking into it'
+    environment.create_labels_list.return_value = [ANY_LABEL]
+    return environment
+
+
+class TestCommentIssue(unittest.TestCase):
+
+    def setUp(self):
+        self.jira_mock = Mock()
+        self.ticket_index = TicketIndex(':memory:')
+        self.comment_buffer = Mock()
+        self.print_patcher = patch('__builtin__.print')
+        self.print_patcher.start()
+
+    def tearDown(self):
+        self.print_patcher.stop()
+        CACHES.clear()
+
+    def test_comment_line_contains_author_and_comment(self):
+        issue = CommentIssue(self.jira_mock, create_icinga_environment_mock())
+
+        self.assertEqual('* 11-26-2013 15:42:05 ACKNOWLEDGEMENT by operator: looking into it',
+                         issue._create_comment_line())
+
+    def test_comment_line_without_author(self):
+        environment = create_icinga_environment_mock('FLAPPINGSTART')
+        environment.notification_author = environment.notification_comment = None
+
+        self.assertEqual('* 11-26-2013 15:42:05 FLAPPINGSTART',
+                         CommentIssue(self.jira_mock, environment)._create_comment_line())
+
+    def test_execute_buffers_comment_for_indexed_issue(self):
+        self.ticket_index.add(ANY_LABEL, 'myserver1', 'MON-1')
+
+        result = CommentIssue(self.jira_mock, create_icinga_environment_mock(),
+                              self.ticket_index, self.comment_buffer).execute()
+
+        self.assertEqual(['MON-1'], [issue.key for issue in result])
+        self.comment_buffer.append.assert_called_with(
+            self.jira_mock, 'MON-1',
+            '* 11-26-2013 15:42:05 ACKNOWLEDGEMENT by operator: looking into it',
+            CommentIssue.COMMENT_HEADER)
+        self.assertEqual(0, self.jira_mock.search_issues.call_count)
+
+    def test_execute_comments_correlated_parent(self):
+        self.ticket_index.add(ANY_LABEL, 'myserver1', 'MON-7', correlated=True)
+
+        result = CommentIssue(self.jira_mock, create_icinga_environment_mock(),
+                              self.ticket_index, self.comment_buffer).execute()
+
+        self.assertEqual(['MON-7'], [issue.key for issue in result])
+
+    def test_execute_without_buffer_searches_and_comments_directly(self):
+        found = Mock()
+        found.key = 'MON-2'
+        self.jira_mock.search_issues.return_value = [found]
+
+        CommentIssue(self.jira_mock, create_icinga_environment_mock()).execute()
+
+        self.jira_mock.search_issues.assert_called_with(
+            "labels='%s' AND resolution = Unresolved" % ANY_LABEL, fields='labels')
+        self.jira_mock.add_comment.assert_called_with(
+            'MON-2', '%s\n* 11-26-2013 15:42:05 ACKNOWLEDGEMENT by operator: looking into it' %
+            CommentIssue.COMMENT_HEADER)
+
+    def test_execute_without_problem_id_does_nothing(self):
+        environment = create_icinga_environment_mock('DOWNTIMESTART')
+        environment.service_problem_id = environment.host_problem_id = None
+
+        self.assertEqual([], CommentIssue(self.jira_mock, environment, self.ticket_index,
+                                          self.comment_buffer).execute())
+        self.assertEqual(0, self.jira_mock.search_issues.call_count)
+        self.assertEqual(0, self.comment_buffer.append.call_count)
+
+    def test_execute_does_not_remember_missing_issues(self):
+        self.jira_mock.search_issues.return_value = []
+
+        CommentIssue(self.jira_mock, create_icinga_environment_mock()).execute()
+        CommentIssue(self.jira_mock, create_icinga_environment_mock()).execute()
+
+        self.assertEqual(2, self.jira_mock.search_issues.call_count)
+        self.assertEqual(None, CACHES.get('labels').get(ANY_LABEL))
+
+    def test_execute_does_not_use_issues_remembered_for_other_jira_instance(self):
+        CACHES.get('labels').set('https://jira.example.com|%s' % ANY_LABEL, ['MON-1'])
+        found = Mock()
+        found.key = 'DBA-1'
+        self.jira_mock.search_issues.return_value = [found]
+
+        result = CommentIssue(self.jira_mock, create_icinga_environment_mock(),
+                              cache_namespace='https://jira.dba.example.com').execute()
+
+        self.assertEqual(['DBA-1'], [issue.key for issue in result])
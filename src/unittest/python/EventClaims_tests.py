@@ -0,0 +1,127 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from mock import Mock
+
+from icinga2jira import EventClaims, SqliteClaimStore, MemoryClaimStore, create_claim_store
+
+ANY_KEY = 'PROBLEM ICI#1#myserver1'
+
+
+class ClaimStoreContract(object):
+
+    def test_first_node_acquires_claim(self):
+        self.assertTrue(self.store.acquire(ANY_KEY, 'node1', 60))
+        self.assertFalse(self.store.acquire(ANY_KEY, 'node2', 60))
+
+    def test_completed_claim_blocks_both_nodes_until_retention_expires(self):
+        self.store.acquire(ANY_KEY, 'node1', 60)
+        self.store.complete(ANY_KEY, 'node1', 3600)
+        self.now += 120
+
+        self.assertFalse(self.store.acquire(ANY_KEY, 'node1', 60))
+        self.assertFalse(self.store.acquire(ANY_KEY, 'node2', 60))
+
+        self.now += 3600
+        self.assertTrue(self.store.acquire(ANY_KEY, 'node2', 60))
+
+    def test_expired_lease_can_be_taken_over(self):
+        self.store.acquire(ANY_KEY, 'node1', 60)
+        self.now += 61
+
+        self.assertTrue(self.store.acquire(ANY_KEY, 'node2', 60))
+
+    def test_released_claim_can_be_acquired_again(self):
+        self.store.acquire(ANY_KEY, 'node1', 60)
+        self.store.release(ANY_KEY, 'node1')
+
+        self.assertTrue(self.store.acquire(ANY_KEY, 'node2', 60))
+
+    def test_release_by_other_node_is_ignored(self):
+        self.store.acquire(ANY_KEY, 'node1', 60)
+        self.store.release(ANY_KEY, 'node2')
+
+        self.assertFalse(self.store.acquire(ANY_KEY, 'node2', 60))
+
+
+class TestSqliteClaimStore(ClaimStoreContract, unittest.TestCase):
+
+    def setUp(self):
+        self.now = 1000.0
+        self.temp_dir = tempfile.mkdtemp()
+        self.store = SqliteClaimStore(os.path.join(self.temp_dir, 'claims.db'),
+                                      clock=lambda: self.now)
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def test_claims_are_shared_between_connections(self):
+        other_node_store = SqliteClaimStore(os.path.join(self.temp_dir, 'claims.db'),
+                                            clock=lambda: self.now)
+
+        self.assertTrue(self.store.acquire(ANY_KEY, 'node1', 60))
+        self.assertFalse(other_node_store.acquire(ANY_KEY, 'node2', 60))
+
+
+class TestMemoryClaimStore(ClaimStoreContract, unittest.TestCase):
+
+    def setUp(self):
+        self.now = 1000.0
+        self.store = MemoryClaimStore(clock=lambda: self.now)
+
+
+class TestEventClaims(unittest.TestCase):
+
+    def create_environment(self, notification_type):
+        environment = Mock()
+        environment.notification_type = notification_type
+        environment.has_new_problem.return_value = notification_type == 'PROBLEM'
+        environment.is_recovered.return_value = notification_type == 'RECOVERY'
+        environment.short_date_time = '2013-11-26 15:42:05'
+        environment.notification_author = 'admin'
+        environment.notification_comment = 'on it'
+        environment.create_labels_list.return_value = ['ICI#1#myserver1']
+        environment.get_jira_recovery_label.return_value = 'ICI#1#myserver1'
+        return environment
+
+    def test_claim_key_contains_notification_type_and_label(self):
+        claims = EventClaims(Mock(), 'node1')
+
+        self.assertEqual(ANY_KEY, claims.claim_key(self.create_environment('PROBLEM')))
+        self.assertEqual('RECOVERY ICI#1#myserver1',
+                         claims.claim_key(self.create_environment('RECOVERY')))
+
+    def test_claim_key_of_comment_notification_tells_repeated_notifications_apart(self):
+        claims = EventClaims(Mock(), 'node1')
+        first = self.create_environment('ACKNOWLEDGEMENT')
+        second = self.create_environment('ACKNOWLEDGEMENT')
+        second.short_date_time = '2013-11-26 16:10:00'
+
+        self.assertEqual('ACKNOWLEDGEMENT ICI#1#myserver1 2013-11-26 15:42:05 admin on it',
+                         claims.claim_key(first))
+        self.assertNotEqual(claims.claim_key(first), claims.claim_key(second))
+
+    def test_second_flapping_cycle_is_claimed_again(self):
+        store = MemoryClaimStore()
+        first = self.create_environment('FLAPPINGSTART')
+        second = self.create_environment('FLAPPINGSTART')
+        second.short_date_time = '2013-11-26 17:00:00'
+
+        EventClaims(store, 'node1').claim(first)
+        EventClaims(store, 'node1').complete(first)
+
+        self.assertTrue(EventClaims(store, 'node2').claim(second))
+
+    def test_only_one_node_claims_an_event(self):
+        store = MemoryClaimStore()
+        environment = self.create_environment('PROBLEM')
+
+        self.assertTrue(EventClaims(store, 'node1').claim(environment))
+        self.assertFalse(EventClaims(store, 'node2').claim(environment))
+
+    def test_create_claim_store(self):
+        self.assertTrue(isinstance(create_claim_store('memory:'), MemoryClaimStore))
+        self.assertTrue(isinstance(create_claim_store('sqlite::memory:'), SqliteClaimStore))
+        self.assertRaises(ValueError, create_claim_store, 'redis://localhost')
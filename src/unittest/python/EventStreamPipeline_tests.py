@@ -0,0 +1,193 @@
+import json
+import threading
+import unittest
+from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+
+from mock import Mock, patch
+
+from icinga2jira import EventStreamPipeline, Icinga2EventMapper, Icinga2EventStream
+
+EVENTS = [{'type': 'StateChange', 'host': 'host1', 'service': 'disk', 'state': 2.0,
+           'state_type': 1.0, 'timestamp': 1000.0},
+          {'type': 'Notification', 'host': 'host1', 'service': 'disk',
+           'notification_type': 'PROBLEM', 'timestamp': 1001.0,
+           'check_result': {'state': 2.0, 'output': 'DISK CRITICAL'}},
+          {'type': 'Notification', 'host': 'host2', 'notification_type': 'RECOVERY',
+           'timestamp': 1002.0, 'check_result': {'state': 0.0, 'output': 'PING OK'}},
+          {'type': 'Notification', 'host': 'host1', 'service': 'disk',
+           'notification_type': 'RECOVERY', 'timestamp': 1003.0,
+           'check_result': {'state': 0.0, 'output': 'DISK OK'}}]
+
+
+class FakeEventStreamHandler(BaseHTTPRequestHandler):
+    requests = []
+
+    def do_POST(self):
+        self.requests.append((self.path, self.headers.get('Authorization')))
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.end_headers()
+        for event in EVENTS:
+            self.wfile.write(json.dumps(event) + '\n')
+
+    def log_message(self, *args):
+        pass
+
+
+class TestEventStreamPipeline(unittest.TestCase):
+
+    def setUp(self):
+        FakeEventStreamHandler.requests = []
+        self.server = HTTPServer(('127.0.0.1', 0), FakeEventStreamHandler)
+        self.server_thread = threading.Thread(target=self.server.serve_forever)
+        self.server_thread.daemon = True
+        self.server_thread.start()
+        self.url = 'http://127.0.0.1:%d/' % self.server.server_port
+        self.print_patcher = patch('__builtin__.print')
+        self.print_patcher.start()
+
+    def tearDown(self):
+        self.print_patcher.stop()
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_stream_reads_events_from_icinga_api(self):
+        events = list(Icinga2EventStream(self.url, 'root', 'icinga').events())
+
+        self.assertEqual(EVENTS, events)
+        path, authorization = FakeEventStreamHandler.requests[0]
+        self.assertTrue(path.startswith('/v1/events?'))
+        self.assertTrue('queue=icinga2jira' in path)
+        self.assertTrue('types=Notification' in path and 'types=StateChange' in path)
+        self.assertTrue(authorization.startswith('Basic '))
+
+    def test_pipeline_feeds_notifications_to_handler(self):
+        handler = Mock()
+        handled = []
+        handler.handle.side_effect = lambda environment: handled.append(environment) or []
+        pipeline = EventStreamPipeline(Icinga2EventStream(self.url, 'root', 'icinga'),
+                                       Icinga2EventMapper(), handler, workers=1)
+        pipeline.sleep = lambda delay: pipeline.stop()
+
+        pipeline.run()
+
+        self.assertEqual(['PROBLEM', 'RECOVERY'],
+                         [environment.notification_type for environment in handled])
+        self.assertEqual({'handled': 2, 'duplicate': 0, 'failed': 0, 'skipped': 1},
+                         pipeline.stats())
+
+    def test_pipeline_reconnects_after_stream_errors(self):
+        stream = Mock()
+        stream.events.side_effect = [IOError('connection reset'), iter([])]
+        pipeline = EventStreamPipeline(stream, Icinga2EventMapper(), Mock(), workers=1)
+        delays = []
+
+        def sleep(delay):
+            delays.append(delay)
+            if len(delays) == 2:
+                pipeline.stop()
+        pipeline.sleep = sleep
+
+        pipeline.run()
+
+        self.assertEqual(2, stream.events.call_count)
+        self.assertEqual([5, 5], delays)
+
+    def test_handler_errors_are_counted(self):
+        handler = Mock()
+        handler.handle.side_effect = Exception('JIRA is down')
+        pipeline = EventStreamPipeline(Mock(), Icinga2EventMapper(), handler, workers=2)
+        pipeline.start()
+
+        pipeline.submit(EVENTS[1])
+        pipeline.stop()
+
+        self.assertEqual(1, pipeline.stats()['failed'])
+
+    def test_full_queue_blocks_submitter(self):
+        release = threading.Event()
+        handler = Mock()
+        handler.handle.side_effect = lambda environment: release.wait()
+        pipeline = EventStreamPipeline(Mock(), Icinga2EventMapper(), handler, workers=1,
+                                       queue_size=1)
+        pipeline.start()
+        pipeline.submit(EVENTS[1])
+        pipeline.submit(EVENTS[1])
+        submitter = threading.Thread(target=pipeline.submit, args=(EVENTS[1],))
+        submitter.start()
+
+        submitter.join(0.5)
+        blocked = submitter.is_alive()
+        release.set()
+        submitter.join()
+        pipeline.stop()
+
+        self.assertTrue(blocked)
+        self.assertEqual(3, handler.handle.call_count)
+
+    def test_slow_target_does_not_hold_up_other_targets(self):
+        release = threading.Event()
+        slow, fast = Mock(), Mock()
+        slow.handle.side_effect = lambda environment: release.wait()
+        fast.handle.return_value = []
+        pipeline = EventStreamPipeline(Mock(), Icinga2EventMapper(), {'slow': slow, 'fast': fast},
+                                       workers=1,
+                                       target_for=lambda environment: environment.host_name)
+        pipeline.start()
+
+        pipeline.submit(dict(EVENTS[1], host='slow'))
+        pipeline.submit(dict(EVENTS[1], host='fast'))
+        for _ in range(50):
+            if fast.handle.call_count:
+                break
+            threading.Event().wait(0.02)
+        handled_while_slow_blocked = fast.handle.call_count
+        release.set()
+        pipeline.stop()
+
+        self.assertEqual(1, handled_while_slow_blocked)
+        self.assertEqual(2, pipeline.stats()['handled'])
+
+    def test_events_of_same_service_are_not_handled_concurrently(self):
+        release = threading.Event()
+        handled = []
+        handler = Mock()
+
+        def handle(environment):
+            handled.append((environment.host_name, environment.notification_type))
+            if environment.host_name == 'host1' and environment.notification_type == 'PROBLEM':
+                release.wait()
+            return []
+        handler.handle.side_effect = handle
+        pipeline = EventStreamPipeline(Mock(), Icinga2EventMapper(), handler, workers=2)
+        pipeline.start()
+
+        pipeline.submit(EVENTS[1])
+        pipeline.submit(EVENTS[3])
+        pipeline.submit(dict(EVENTS[1], host='host3'))
+        for _ in range(50):
+            if len(handled) == 2:
+                break
+            threading.Event().wait(0.02)
+        handled_while_problem_blocked = list(handled)
+        release.set()
+        pipeline.stop()
+
+        self.assertEqual([('host1', 'PROBLEM'), ('host3', 'PROBLEM')],
+                         sorted(handled_while_problem_blocked))
+        self.assertEqual(('host1', 'RECOVERY'), handled[-1])
+        self.assertEqual({}, pipeline.in_flight)
+
+    def test_scheduled_flushes_run_on_a_timer(self):
+        flushed = threading.Event()
+        handler = Mock()
+        handler.flush_scheduled.side_effect = lambda: flushed.set()
+        pipeline = EventStreamPipeline(Mock(), Icinga2EventMapper(), handler, workers=1,
+                                       flush_interval=0.01)
+        pipeline.start()
+
+        flushed.wait(1)
+        pipeline.stop()
+
+        self.assertTrue(flushed.is_set())
+        self.assertFalse(pipeline.flusher.is_alive())
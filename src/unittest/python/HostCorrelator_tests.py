@@ -0,0 +1,101 @@
+import unittest
+
+from mock import Mock
+
+from icinga2jira import HostCorrelator, CorrelatedIssue, TicketIndex
+
+ANY_HOSTNAME = 'myserver1'
+ANY_SERVICE_LABEL = 'ICI#200#myserver1'
+
+
+def create_icinga_environment_mock(notification_type='PROBLEM', host_state='DOWN',
+                                   is_service_issue=True):
+    environment = Mock()
+    environment.notification_type = notification_type
+    environment.has_new_problem.return_value = notification_type == 'PROBLEM'
+    environment.is_recovered.return_value = notification_type == 'RECOVERY'
+    environment.is_service_issue.return_value = is_service_issue
+    environment.host_name = ANY_HOSTNAME
+    environment.host_state = host_state
+    environment.service_description = 'disk'
+    environment.service_state = 'CRITICAL'
+    environment.service_output = 'no space left'
+    environment.short_date_time = '11-26-2013 15:42:05'
+    environment.create_labels_list.return_value = [ANY_SERVICE_LABEL]
+    environment.get_jira_recovery_label.return_value = ANY_SERVICE_LABEL
+    return environment
+
+
+class TestHostCorrelator(unittest.TestCase):
+
+    def setUp(self):
+        self.now = 100.0
+        self.ticket_index = TicketIndex(':memory:')
+        self.sleep_mock = Mock(side_effect=self.advance_clock)
+        self.correlator = HostCorrelator(self.ticket_index, Mock(), 10,
+                                         clock=lambda: self.now, sleep=self.sleep_mock)
+
+    def advance_clock(self, seconds):
+        self.now += seconds
+
+    def test_returns_open_host_issue_for_service_problem_on_down_host(self):
+        self.ticket_index.add('ICI#1#myserver1', ANY_HOSTNAME, 'MON-1', is_host=True)
+
+        self.assertEqual('MON-1',
+                         self.correlator.find_parent_issue(create_icinga_environment_mock()))
+        self.assertEqual(0, self.sleep_mock.call_count)
+
+    def test_waits_for_host_issue_until_delay_expires(self):
+        self.assertEqual(None, self.correlator.find_parent_issue(create_icinga_environment_mock()))
+        self.assertEqual(10, self.sleep_mock.call_count)
+
+    def test_does_not_wait_when_host_is_up(self):
+        environment = create_icinga_environment_mock(host_state='UP')
+
+        self.assertEqual(None, self.correlator.find_parent_issue(environment))
+        self.assertEqual(0, self.sleep_mock.call_count)
+
+    def test_does_not_correlate_host_problems(self):
+        environment = create_icinga_environment_mock(is_service_issue=False)
+
+        self.assertEqual(None, self.correlator.find_parent_issue(environment))
+
+    def test_returns_parent_of_correlated_recovery(self):
+        self.ticket_index.add(ANY_SERVICE_LABEL, ANY_HOSTNAME, 'MON-1', correlated=True)
+
+        environment = create_icinga_environment_mock(notification_type='RECOVERY')
+
+        self.assertEqual('MON-1', self.correlator.find_parent_issue(environment))
+
+
+class TestCorrelatedIssue(unittest.TestCase):
+
+    def setUp(self):
+        self.jira_mock = Mock()
+        self.correlator = Mock()
+        self.correlator.ticket_index = TicketIndex(':memory:')
+        self.correlator.COMMENT_HEADER = HostCorrelator.COMMENT_HEADER
+
+    def test_problem_is_recorded_and_appended_to_parent(self):
+        issue = CorrelatedIssue(self.jira_mock, create_icinga_environment_mock(), self.correlator,
+                                'MON-1')
+
+        result = issue.execute()
+
+        self.assertEqual(['MON-1'], [handled.key for handled in result])
+        self.assertEqual('MON-1', self.correlator.ticket_index.find_correlated(ANY_SERVICE_LABEL))
+        self.correlator.comment_buffer.append.assert_called_with(
+            self.jira_mock, 'MON-1',
+            '* 11-26-2013 15:42:05 PROBLEM: disk is CRITICAL - no space left',
+            HostCorrelator.COMMENT_HEADER)
+        self.assertEqual(0, self.jira_mock.create_issue.call_count)
+
+    def test_recovery_is_removed_and_appended_to_parent(self):
+        self.correlator.ticket_index.add(ANY_SERVICE_LABEL, ANY_HOSTNAME, 'MON-1', correlated=True)
+        environment = create_icinga_environment_mock(notification_type='RECOVERY')
+
+        CorrelatedIssue(self.jira_mock, environment, self.correlator, 'MON-1').execute()
+
+        self.assertEqual(None, self.correlator.ticket_index.find_correlated(ANY_SERVICE_LABEL))
+        self.assertEqual(1, self.correlator.comment_buffer.append.call_count)
+        self.assertEqual(0, self.jira_mock.transition_issue.call_count)
@@ -0,0 +1,142 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from icinga2jira import Icinga2EventMapper, StreamProblems
+
+
+def notification(notification_type, host='host1', service='disk', state=2, timestamp=1000.0,
+                 **kwargs):
+    event = {'type': 'Notification', 'host': host, 'notification_type': notification_type,
+             'timestamp': timestamp, 'check_result': {'state': state, 'output': 'DISK CRITICAL'}}
+    if service:
+        event['service'] = service
+    event.update(kwargs)
+    return event
+
+
+def state_change(host='host1', service='disk', state=2, state_type=1, timestamp=990.0):
+    event = {'type': 'StateChange', 'host': host, 'state': state, 'state_type': state_type,
+             'timestamp': timestamp}
+    if service:
+        event['service'] = service
+    return event
+
+
+class TestIcinga2EventMapper(unittest.TestCase):
+
+    def setUp(self):
+        self.mapper = Icinga2EventMapper(clock=lambda: 2000.0)
+
+    def test_service_problem_is_mapped_onto_environment(self):
+        environment = self.mapper.map(notification('PROBLEM'))
+
+        self.assertTrue(environment.has_new_problem())
+        self.assertTrue(environment.is_service_issue())
+        self.assertEqual('host1', environment.host_name)
+        self.assertEqual('disk', environment.service_description)
+        self.assertEqual('CRITICAL', environment.service_state)
+        self.assertEqual('DISK CRITICAL', environment.service_output)
+        self.assertEqual('UP', environment.host_state)
+        self.assertEqual('1000000', environment.service_problem_id)
+
+    def test_host_problem_uses_host_state(self):
+        environment = self.mapper.map(notification('PROBLEM', service=None, state=2))
+
+        self.assertTrue(environment.is_host_issue())
+        self.assertEqual('DOWN', environment.host_state)
+        self.assertEqual('1000000', environment.host_problem_id)
+
+    def test_host_check_states_are_mapped_onto_host_states(self):
+        self.assertEqual(['UP', 'UP', 'DOWN', 'DOWN'],
+                         [self.mapper.map(notification('PROBLEM', service=None,
+                                                       state=state)).host_state
+                          for state in range(4)])
+
+    def test_hard_state_change_assigns_problem_id(self):
+        self.assertEqual(None, self.mapper.map(state_change()))
+
+        environment = self.mapper.map(notification('PROBLEM'))
+
+        self.assertEqual('990000', environment.service_problem_id)
+
+    def test_soft_state_change_is_ignored(self):
+        self.mapper.map(state_change(state_type=0))
+
+        self.assertEqual('1000000', self.mapper.map(notification('PROBLEM')).service_problem_id)
+
+    def test_problems_in_the_same_millisecond_get_distinct_ids(self):
+        first = self.mapper.map(notification('PROBLEM', service='disk'))
+        second = self.mapper.map(notification('PROBLEM', service='load'))
+
+        self.assertNotEqual(first.create_labels_list(), second.create_labels_list())
+
+    def test_recovery_uses_problem_id_as_last_problem_id(self):
+        problem = self.mapper.map(notification('PROBLEM'))
+        recovery = self.mapper.map(notification('RECOVERY', state=0, timestamp=1100.0))
+
+        self.assertTrue(recovery.is_recovered())
+        self.assertEqual(problem.create_labels_list(), [recovery.get_jira_recovery_label()])
+
+    def test_recovery_without_known_problem_raises(self):
+        self.assertRaises(ValueError, self.mapper.map, notification('RECOVERY', state=0))
+
+    def test_problem_ids_survive_a_restart(self):
+        temp_dir = tempfile.mkdtemp()
+        try:
+            state_db = os.path.join(temp_dir, 'state.db')
+            problem = Icinga2EventMapper(problems=StreamProblems(state_db)).map(
+                notification('PROBLEM'))
+            recovery = Icinga2EventMapper(problems=StreamProblems(state_db)).map(
+                notification('RECOVERY', state=0, timestamp=1100.0))
+
+            self.assertEqual(problem.create_labels_list(), [recovery.get_jira_recovery_label()])
+        finally:
+            shutil.rmtree(temp_dir)
+
+    def test_next_problem_gets_a_new_id_after_recovery(self):
+        first = self.mapper.map(notification('PROBLEM'))
+        self.mapper.map(state_change(state=0, timestamp=1000.0))
+        self.mapper.map(notification('RECOVERY', state=0, timestamp=1000.0))
+        second = self.mapper.map(notification('PROBLEM', timestamp=1000.0))
+
+        self.assertNotEqual(first.service_problem_id, second.service_problem_id)
+
+    def test_host_state_is_tracked_for_service_notifications(self):
+        self.mapper.map(state_change(service=None, state=1))
+
+        self.assertEqual('DOWN', self.mapper.map(notification('PROBLEM')).host_state)
+
+    def test_host_state_is_taken_from_check_result_without_state(self):
+        event = state_change(service=None)
+        del event['state']
+        event['check_result'] = {'state': 2.0}
+
+        self.mapper.map(event)
+
+        self.assertEqual('DOWN', self.mapper.map(notification('PROBLEM')).host_state)
+
+    def test_comment_notification_carries_open_problem_id(self):
+        problem = self.mapper.map(notification('PROBLEM'))
+        acknowledgement = self.mapper.map(notification('ACKNOWLEDGEMENT', author='admin',
+                                                       text='on it'))
+
+        self.assertTrue(acknowledgement.is_comment_notification())
+        self.assertEqual(problem.service_problem_id, acknowledgement.service_problem_id)
+        self.assertEqual('admin', acknowledgement.notification_author)
+        self.assertEqual('on it', acknowledgement.notification_comment)
+
+    def test_icinga2_notification_types_are_translated(self):
+        self.assertEqual('FLAPPINGSTOP',
+                         self.mapper.map(notification('FLAPPINGEND')).notification_type)
+        self.assertEqual('DOWNTIMECANCELLED',
+                         self.mapper.map(notification('DowntimeRemoved')).notification_type)
+
+    def test_unicode_values_are_encoded(self):
+        environment = self.mapper.map(notification('PROBLEM', host=u'h\xf6st'))
+
+        self.assertEqual('h\xc3\xb6st', environment.host_name)
+
+    def test_other_event_types_are_ignored(self):
+        self.assertEqual(None, self.mapper.map({'type': 'CheckResult', 'host': 'host1'}))
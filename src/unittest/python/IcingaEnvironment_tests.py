@@ -167,6 +167,16 @@ class IcingaEnvironmentTest(unittest.TestCase):
         environment = IcingaEnvironment(test_dict)
         self.assertTrue(environment.is_recovered())
 
+    def test_acknowledgement_is_comment_notification(self):
+        test_dict = create_valid_environment_dict_for_service_problem()
+        test_dict['ICINGA_NOTIFICATIONTYPE'] = 'ACKNOWLEDGEMENT'
+        environment = IcingaEnvironment(test_dict)
+        self.assertTrue(environment.is_comment_notification())
+
+    def test_problem_is_no_comment_notification(self):
+        environment = IcingaEnvironment(create_valid_environment_dict_for_service_problem())
+        self.assertFalse(environment.is_comment_notification())
+
     def test_when_is_service_issue_is_true_then_is_host_issue_is_false(self):
         environment = IcingaEnvironment(create_valid_environment_dict_for_service_problem())
         self.assertTrue(environment.is_service_issue())
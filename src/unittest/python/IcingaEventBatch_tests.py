@@ -0,0 +1,104 @@
+import itertools
+import unittest
+
+from mock import Mock
+
+from icinga2jira import CACHES, CloseIssue, IcingaEnvironment, IcingaEventBatch, OpenIssue
+
+ANY_HOSTNAME = 'myserver1'
+ANY_SERVICE_DESCRIPTION = 'foo application services'
+
+VALIDATED_KEYS = ['ICINGA_HOSTNAME', 'ICINGA_SERVICESTATE', 'ICINGA_SERVICEPROBLEMID',
+                  'ICINGA_HOSTSTATE', 'ICINGA_HOSTPROBLEMID', 'ICINGA_LASTSERVICEPROBLEMID',
+                  'ICINGA_LASTHOSTPROBLEMID']
+
+
+def service_problem(problem_id='12345'):
+    return {'ICINGA_NOTIFICATIONTYPE': 'PROBLEM', 'ICINGA_HOSTNAME': ANY_HOSTNAME,
+            'ICINGA_SERVICEDESC': ANY_SERVICE_DESCRIPTION, 'ICINGA_SERVICESTATE': 'CRITICAL',
+            'ICINGA_SERVICEOUTPUT': 'DISK CRITICAL', 'ICINGA_SERVICEPROBLEMID': problem_id,
+            'ICINGA_SHORTDATETIME': '11-26-2013 15:42:05'}
+
+
+def service_recovery(problem_id='12345'):
+    return {'ICINGA_NOTIFICATIONTYPE': 'RECOVERY', 'ICINGA_HOSTNAME': ANY_HOSTNAME,
+            'ICINGA_SERVICEDESC': ANY_SERVICE_DESCRIPTION, 'ICINGA_SERVICESTATE': 'OK',
+            'ICINGA_LASTSERVICEPROBLEMID': problem_id}
+
+
+def validation_error(environment):
+    try:
+        IcingaEnvironment(environment)
+    except ValueError as e:
+        return str(e)
+    return None
+
+
+class TestIcingaEventBatch(unittest.TestCase):
+
+    def setUp(self):
+        CACHES.clear()
+
+    def tearDown(self):
+        CACHES.clear()
+
+    def test_validation_matches_icinga_environment_for_every_combination(self):
+        environments = []
+        for notification_type in ['PROBLEM', 'RECOVERY', 'ACKNOWLEDGEMENT', '']:
+            for present in itertools.product([True, False], repeat=len(VALIDATED_KEYS)):
+                environment = {'ICINGA_NOTIFICATIONTYPE': notification_type}
+                for key, is_present in zip(VALIDATED_KEYS, present):
+                    environment[key] = 'value' if is_present else ''
+                environments.append(environment)
+
+        errors = IcingaEventBatch(environments).validate()
+
+        expected = dict((index, validation_error(environment))
+                        for index, environment in enumerate(environments)
+                        if validation_error(environment) is not None)
+        self.assertEqual(expected, errors)
+
+    def test_rows_skip_invalid_events(self):
+        batch = IcingaEventBatch([service_problem(), {'ICINGA_HOSTNAME': ANY_HOSTNAME},
+                                  service_recovery()])
+
+        self.assertEqual([0, 2], [row.index for row in batch.rows()])
+        self.assertEqual({1: 'Environment is missing ICINGA_NOTIFICATIONTYPE'}, batch.validate())
+
+    def test_row_exposes_environment_fields_and_predicates(self):
+        row = IcingaEventBatch([service_problem()]).row(0)
+        environment = IcingaEnvironment(service_problem())
+
+        self.assertEqual(environment.__dict__, row.__dict__)
+        self.assertTrue(row.has_new_problem())
+        self.assertTrue(row.is_service_issue())
+        self.assertEqual(None, row.host_problem_id)
+        self.assertEqual(environment.create_labels_list(), row.create_labels_list())
+        self.assertRaises(AttributeError, getattr, row, 'no_such_field')
+
+    def test_values_are_stored_once(self):
+        batch = IcingaEventBatch([service_problem(str(problem_id)) for problem_id in range(100)])
+
+        self.assertEqual(107, len(batch.values))
+        self.assertEqual(100, len(batch.columns['service_problem_id']))
+
+    def test_open_issue_accepts_row(self):
+        jira = Mock()
+        row = IcingaEventBatch([service_problem()]).row(0)
+
+        OpenIssue(jira, {'jira_project_key': 'MON', 'jira_issue_type': 'Bug'}, row).execute()
+
+        fields = jira.create_issue.call_args[1]['fields']
+        self.assertEqual('ICINGA: %s on %s is CRITICAL' % (ANY_SERVICE_DESCRIPTION, ANY_HOSTNAME),
+                         fields['summary'])
+        self.assertEqual(['ICI#12345#myserver1'], fields['labels'])
+        self.assertTrue('DISK CRITICAL' in fields['description'])
+
+    def test_close_issue_accepts_row(self):
+        jira = Mock()
+        jira.search_issues.return_value = []
+        row = IcingaEventBatch([service_recovery()]).row(0)
+
+        CloseIssue(jira, row).execute()
+
+        jira.search_issues.assert_called_with("labels='ICI#12345#myserver1'")
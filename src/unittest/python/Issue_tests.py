@@ -2,7 +2,7 @@ import unittest
 import textwrap
 from mock import Mock
 
-from icinga2jira import Issue
+from icinga2jira import Issue, IcingaEnvironment, CACHES
 
 
 NOTIFICATION_TYPE_PROBLEM = "PROBLEM"
@@ -119,3 +119,19 @@ class TestIssue(unittest.TestCase):
         actual_description = self.issue.create_description()
 
         self.assertEqual(actual_description, self.EXPECTED_RECOVERY_DESCRIPTION_WITH_SERVICE)
+
+    def test_description_template_is_compiled_once(self):
+        CACHES.clear()
+        environment = IcingaEnvironment({'ICINGA_NOTIFICATIONTYPE': 'RECOVERY',
+                                         'ICINGA_HOSTNAME': 'myserver1',
+                                         'ICINGA_LASTHOSTPROBLEMID': '1',
+                                         'ICINGA_SHORTDATETIME': '2013-11-26 15:42:05'})
+
+        first = IssueDummy(environment).create_description()
+        environment.short_date_time = '2013-11-26 16:10:00'
+        second = IssueDummy(environment).create_description()
+
+        self.assertTrue('15:42:05' in first)
+        self.assertTrue('16:10:00' in second)
+        self.assertEqual(1, CACHES.get('templates').stats()['hits'])
+        CACHES.clear()
@@ -0,0 +1,97 @@
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from mock import Mock, patch
+
+from icinga2jira import JiraMetadataCache
+
+ANY_PROJECT_KEY = 'MON'
+ANY_ISSUE_TYPE = 'Technical task'
+ANY_CREATEMETA = {'projects': [
+    {'id': '10100', 'key': ANY_PROJECT_KEY,
+     'issuetypes': [{'id': '7', 'name': 'Bug', 'fields': {}},
+                    {'id': '12', 'name': ANY_ISSUE_TYPE,
+                     'fields': {'priority': {'allowedValues': [{'id': '1', 'name': 'Blocker'},
+                                                               {'id': '3', 'name': 'Major'}]}}}]}]}
+
+
+class TestJiraMetadataCache(unittest.TestCase):
+
+    def setUp(self):
+        self.jira_mock = Mock()
+        self.jira_mock.createmeta.return_value = ANY_CREATEMETA
+        self.now = 1000.0
+        self.temp_dir = tempfile.mkdtemp()
+        self.cache_file = os.path.join(self.temp_dir, 'metadata.json')
+        self.print_patcher = patch('__builtin__.print')
+        self.print_patcher.start()
+
+    def tearDown(self):
+        self.print_patcher.stop()
+        shutil.rmtree(self.temp_dir)
+
+    def create_cache(self, cache_file=None, ttl=60):
+        return JiraMetadataCache(self.jira_mock, cache_file, ttl, clock=lambda: self.now)
+
+    def test_resolve_returns_ids_from_createmeta(self):
+        resolved = self.create_cache().resolve(ANY_PROJECT_KEY, ANY_ISSUE_TYPE)
+
+        self.assertEqual('10100', resolved['project_id'])
+        self.assertEqual('12', resolved['issuetype_id'])
+        self.assertEqual(['1', '3'], resolved['priority_ids'])
+        self.jira_mock.createmeta.assert_called_with(projectKeys=ANY_PROJECT_KEY,
+                                                     issuetypeNames=ANY_ISSUE_TYPE,
+                                                     expand='projects.issuetypes.fields')
+
+    def test_resolve_uses_cached_entry_within_ttl(self):
+        cache = self.create_cache()
+        cache.resolve(ANY_PROJECT_KEY, ANY_ISSUE_TYPE)
+        self.now += 59
+        cache.resolve(ANY_PROJECT_KEY, ANY_ISSUE_TYPE)
+
+        self.assertEqual(1, self.jira_mock.createmeta.call_count)
+
+    def test_resolve_refetches_expired_entry(self):
+        cache = self.create_cache()
+        cache.resolve(ANY_PROJECT_KEY, ANY_ISSUE_TYPE)
+        self.now += 61
+        cache.resolve(ANY_PROJECT_KEY, ANY_ISSUE_TYPE)
+
+        self.assertEqual(2, self.jira_mock.createmeta.call_count)
+
+    def test_resolve_persists_entries_across_instances(self):
+        self.create_cache(self.cache_file).resolve(ANY_PROJECT_KEY, ANY_ISSUE_TYPE)
+        resolved = self.create_cache(self.cache_file).resolve(ANY_PROJECT_KEY, ANY_ISSUE_TYPE)
+
+        self.assertEqual('12', resolved['issuetype_id'])
+        self.assertEqual(1, self.jira_mock.createmeta.call_count)
+
+    def test_entries_of_other_jira_instances_are_not_used(self):
+        JiraMetadataCache(self.jira_mock, self.cache_file, namespace='https://jira.example.com') \
+            .resolve(ANY_PROJECT_KEY, ANY_ISSUE_TYPE)
+        JiraMetadataCache(self.jira_mock, self.cache_file,
+                          namespace='https://jira.dba.example.com') \
+            .resolve(ANY_PROJECT_KEY, ANY_ISSUE_TYPE)
+
+        self.assertEqual(2, self.jira_mock.createmeta.call_count)
+
+    def test_corrupt_cache_file_is_ignored(self):
+        with open(self.cache_file, 'w') as file_pointer:
+            file_pointer.write('{not json')
+
+        self.create_cache(self.cache_file).resolve(ANY_PROJECT_KEY, ANY_ISSUE_TYPE)
+
+        with open(self.cache_file) as file_pointer:
+            cached_keys = [entry[0] for entry in json.load(file_pointer)['entries']]
+        self.assertEqual(['%s/%s' % (ANY_PROJECT_KEY, ANY_ISSUE_TYPE)], cached_keys)
+
+    def test_resolve_raises_error_for_unknown_issue_type(self):
+        self.assertRaises(ValueError, self.create_cache().resolve, ANY_PROJECT_KEY, 'Epic')
+
+    def test_resolve_raises_error_for_unknown_project(self):
+        self.jira_mock.createmeta.return_value = {'projects': []}
+
+        self.assertRaises(ValueError, self.create_cache().resolve, 'NOPE', ANY_ISSUE_TYPE)
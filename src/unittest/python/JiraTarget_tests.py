@@ -0,0 +1,144 @@
+import unittest
+
+import requests
+from mock import Mock, patch
+
+from icinga2jira import (CACHES, DEFAULT_JIRA_TARGET, OPTIONAL_CONFIG_DEFAULTS, JiraTarget,
+                         JiraTargetAdapter, JiraTargets, JiraTargetUnavailable, Route, Router)
+
+
+def target_config(**kwargs):
+    config = dict(OPTIONAL_CONFIG_DEFAULTS)
+    config.update({'url': 'https://jira.example.com', 'username': 'god', 'password': 'h3aven',
+                   'jira_project_key': 'MON', 'jira_issue_type': 'Bug'})
+    config.update(kwargs)
+    return config
+
+
+def environment(host_name, service_description=None):
+    icinga_environment = Mock()
+    icinga_environment.host_name = host_name
+    icinga_environment.service_description = service_description
+    return icinga_environment
+
+
+class TestJiraTarget(unittest.TestCase):
+
+    def setUp(self):
+        CACHES.clear()
+        self.now = 1000.0
+        self.sleeps = []
+        self.target = JiraTarget('ops', target_config(jira_rate_limit='2', jira_max_failures='2',
+                                                      jira_failure_cooldown='30'),
+                                 clock=lambda: self.now, sleep=self.sleeps.append)
+
+    def tearDown(self):
+        CACHES.clear()
+
+    def test_rate_limit_spaces_requests(self):
+        for _ in range(3):
+            self.target.before_request()
+
+        self.assertEqual([0.5, 1.0], self.sleeps)
+
+    def test_target_is_unavailable_after_consecutive_failures(self):
+        self.target.record_failure()
+        self.target.before_request()
+        self.target.record_failure()
+
+        self.assertFalse(self.target.is_available())
+        self.assertRaises(JiraTargetUnavailable, self.target.before_request)
+
+    def test_success_resets_failure_count(self):
+        self.target.record_failure()
+        self.target.record_success()
+        self.target.record_failure()
+
+        self.assertTrue(self.target.is_available())
+
+    def test_single_failure_after_cooldown_makes_target_unavailable_again(self):
+        self.target.record_failure()
+        self.target.record_failure()
+        self.now += 31
+        self.assertTrue(self.target.is_available())
+
+        self.target.record_failure()
+
+        self.assertFalse(self.target.is_available())
+
+    def test_session_mounts_target_adapter_once(self):
+        with patch('icinga2jira.open_jira_session') as open_jira_session:
+            session = self.target.session()
+            self.assertTrue(session is self.target.session())
+
+        self.assertEqual(1, open_jira_session.call_count)
+        adapter = session._session.mount.call_args[0][1]
+        self.assertTrue(isinstance(adapter, JiraTargetAdapter))
+        self.assertTrue(adapter.target is self.target)
+
+    def test_targets_with_same_credentials_get_their_own_session(self):
+        other_target = JiraTarget('other', self.target.config)
+
+        with patch('icinga2jira.open_jira_session', side_effect=lambda *args: Mock()):
+            self.assertFalse(self.target.session() is other_target.session())
+
+
+class TestJiraTargetAdapter(unittest.TestCase):
+
+    def setUp(self):
+        self.target = Mock()
+        self.adapter = JiraTargetAdapter(self.target, pool_maxsize=3)
+
+    def test_server_errors_are_recorded_as_failures(self):
+        with patch('requests.adapters.HTTPAdapter.send') as send:
+            send.return_value = Mock(status_code=503)
+            self.adapter.send(Mock())
+
+        self.target.before_request.assert_called_with()
+        self.assertEqual(1, self.target.record_failure.call_count)
+
+    def test_connection_errors_are_recorded_and_reraised(self):
+        with patch('requests.adapters.HTTPAdapter.send') as send:
+            send.side_effect = requests.ConnectionError('refused')
+            self.assertRaises(requests.ConnectionError, self.adapter.send, Mock())
+
+        self.assertEqual(1, self.target.record_failure.call_count)
+
+    def test_unavailable_target_does_not_send(self):
+        self.target.before_request.side_effect = JiraTargetUnavailable()
+        with patch('requests.adapters.HTTPAdapter.send') as send:
+            self.assertRaises(JiraTargetUnavailable, self.adapter.send, Mock())
+
+        self.assertEqual(0, send.call_count)
+
+    def test_successful_response_is_recorded(self):
+        with patch('requests.adapters.HTTPAdapter.send') as send:
+            send.return_value = Mock(status_code=404)
+            self.adapter.send(Mock())
+
+        self.assertEqual(1, self.target.record_success.call_count)
+
+
+class TestJiraTargets(unittest.TestCase):
+
+    def setUp(self):
+        self.router = Router([Route('db', 'db*', project_key='DBA', target='dba'),
+                              Route('web', 'web*', project_key='WEB')])
+        self.targets = JiraTargets([JiraTarget(DEFAULT_JIRA_TARGET, target_config()),
+                                    JiraTarget('dba', target_config(jira_project_key='DBOPS'))],
+                                    self.router)
+
+    def test_events_are_routed_to_route_target(self):
+        self.assertEqual('dba', self.targets.target_for(environment('db01', 'mysql')))
+        self.assertEqual(DEFAULT_JIRA_TARGET, self.targets.target_for(environment('web01')))
+        self.assertEqual(DEFAULT_JIRA_TARGET, self.targets.target_for(environment('mail01')))
+
+    def test_project_keys_per_target(self):
+        self.assertEqual(['MON', 'WEB'], self.targets.project_keys(DEFAULT_JIRA_TARGET))
+        self.assertEqual(['DBOPS', 'DBA'], self.targets.project_keys('dba'))
+
+    def test_unknown_route_target_is_rejected(self):
+        router = Router([Route('db', 'db*', target='missing')])
+
+        self.assertRaises(ValueError, JiraTargets,
+                          [JiraTarget(DEFAULT_JIRA_TARGET, target_config())], router)
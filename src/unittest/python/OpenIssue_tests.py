@@ -2,7 +2,7 @@ import unittest
 
 from mock import Mock, patch
 
-from icinga2jira import OpenIssue
+from icinga2jira import CACHES, OpenIssue, Route
 
 
 ANY_PROJECT_KEY = 'MON'
@@ -32,8 +32,20 @@ class TestOpenIssue(unittest.TestCase):
         self.config = {'jira_project_key': ANY_PROJECT_KEY, 'jira_issue_type': ANY_ISSUE_TYPE}
         self.open_issue = OpenIssue(self.jira_mock, self.config, self.icinga_environment)
 
+    def tearDown(self):
+        CACHES.clear()
+
+    def test_execute_remembers_created_issue_for_its_labels(self):
+        self.jira_mock.create_issue.return_value.key = 'MON-7'
+
+        self.open_issue.execute()
+
+        self.assertEqual(['MON-7'],
+                         CACHES.get('labels').get('ICI#%s#%s' % (ANY_SERVICE_PROBLEM_ID,
+                                                                 ANY_HOSTNAME)))
+
     def test_execute_is_called_properly_and_returns_list_of_handled_issues(self):
-        self.jira_mock.create_issue.return_value = 'new issue'
+        new_issue = self.jira_mock.create_issue.return_value
 
         with patch.object(OpenIssue, '_create_issue_dict', return_value='issue_dict') as mock_create:
             open_issue = OpenIssue(self.jira_mock, self.config, self.icinga_environment)
@@ -41,7 +53,18 @@ class TestOpenIssue(unittest.TestCase):
 
             self.jira_mock.create_issue.assert_called_with(fields='issue_dict')
             mock_create.assert_called()
-            self.assertEqual(['new issue'], result)
+            self.assertEqual([new_issue], result)
+
+    def test_execute_records_created_issue_in_ticket_index(self):
+        ticket_index = Mock()
+        self.jira_mock.create_issue.return_value.key = 'MON-1'
+        self.icinga_environment.create_labels_list.return_value = ['ICI#1#myserver1']
+        self.icinga_environment.is_host_issue.return_value = True
+
+        OpenIssue(self.jira_mock, self.config, self.icinga_environment,
+                  ticket_index=ticket_index).execute()
+
+        ticket_index.add.assert_called_with('ICI#1#myserver1', ANY_HOSTNAME, 'MON-1', is_host=True)
 
     def test_ticket_init(self):
         self.assertTrue(self.open_issue.jira)
@@ -62,6 +85,66 @@ class TestOpenIssue(unittest.TestCase):
         self.assertTrue(actual_issue['description'])
         self.assertEqual(actual_issue['labels'][0], "ICI#" + ANY_SERVICE_PROBLEM_ID)
 
+    def test_create_issue_dict_should_use_icinga_priority(self):
+        actual_issue = self.open_issue._create_issue_dict()
+
+        self.assertEqual({'id': ANY_PRIORITY_ID}, actual_issue['priority'])
+
+    def test_create_issue_dict_without_priority(self):
+        self.icinga_environment.service_priority_id = None
+
+        actual_issue = self.open_issue._create_issue_dict()
+
+        self.assertFalse('priority' in actual_issue)
+
+    def test_create_issue_dict_should_use_resolved_metadata_ids(self):
+        metadata = Mock()
+        metadata.resolve.return_value = {'project_id': '10100', 'issuetype_id': '12',
+                                         'priority_ids': [ANY_PRIORITY_ID]}
+
+        open_issue = OpenIssue(self.jira_mock, self.config, self.icinga_environment, metadata)
+        actual_issue = open_issue._create_issue_dict()
+
+        metadata.resolve.assert_called_with(ANY_PROJECT_KEY, ANY_ISSUE_TYPE)
+        self.assertEqual({'id': '10100'}, actual_issue['project'])
+        self.assertEqual({'id': '12'}, actual_issue['issuetype'])
+        self.assertEqual({'id': ANY_PRIORITY_ID}, actual_issue['priority'])
+
+    def test_create_issue_dict_should_skip_priority_not_allowed_by_metadata(self):
+        metadata = Mock()
+        metadata.resolve.return_value = {'project_id': '10100', 'issuetype_id': '12',
+                                         'priority_ids': ['1']}
+
+        with patch('__builtin__.print'):
+            open_issue = OpenIssue(self.jira_mock, self.config, self.icinga_environment, metadata)
+            actual_issue = open_issue._create_issue_dict()
+
+        self.assertFalse('priority' in actual_issue)
+
+    def test_route_overrides_project_issue_type_and_labels(self):
+        self.icinga_environment.create_labels_list.return_value = ['ICI#1#host']
+        router = Mock()
+        router.route.return_value = Route('db', 'db*', project_key='DBA', issue_type='Incident',
+                                          labels=['database'], template='custom {{host_state}}')
+
+        open_issue = OpenIssue(self.jira_mock, self.config, self.icinga_environment, router=router)
+        actual_issue = open_issue._create_issue_dict()
+
+        router.route.assert_called_with(ANY_HOSTNAME, ANY_SERVICE_DESCRIPTION)
+        self.assertEqual({'key': 'DBA'}, actual_issue['project'])
+        self.assertEqual({'name': 'Incident'}, actual_issue['issuetype'])
+        self.assertEqual(['ICI#1#host', 'database'], actual_issue['labels'])
+        self.assertEqual('custom %s' % ANY_HOST_STATE, actual_issue['description'])
+
+    def test_unmatched_route_keeps_configured_defaults(self):
+        router = Mock()
+        router.route.return_value = None
+
+        open_issue = OpenIssue(self.jira_mock, self.config, self.icinga_environment, router=router)
+
+        self.assertEqual(ANY_PROJECT_KEY, open_issue.project_key)
+        self.assertEqual(ANY_ISSUE_TYPE, open_issue.issue_type)
+
     def test_summary_with_service_description(self):
         self.icinga_environment.is_service_issue.return_value = True
 
@@ -95,4 +178,7 @@ class TestOpenIssue(unittest.TestCase):
         environment.notification_author = ANY_NOTIFICATION_AUTHOR
         environment.notification_comment = ANY_COMMENT
         environment.service_problem_id = ANY_SERVICE_PROBLEM_ID
+        environment.service_priority_id = ANY_PRIORITY_ID
+        environment.create_labels_list.return_value = ['ICI#%s#%s' % (ANY_SERVICE_PROBLEM_ID,
+                                                                      ANY_HOSTNAME)]
         return environment
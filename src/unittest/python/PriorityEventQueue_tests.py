@@ -0,0 +1,118 @@
+import threading
+import unittest
+from Queue import Empty, Full
+
+from mock import Mock
+
+from icinga2jira import PriorityEventQueue
+
+
+def create_environment(notification_type='PROBLEM', service_state='CRITICAL', priority_id=None,
+                       name=None, host_name=None, service_description=None):
+    environment = Mock()
+    environment.name = name or '%s %s' % (notification_type, service_state)
+    environment.host_name = host_name or environment.name
+    environment.service_description = service_description
+    environment.has_new_problem.return_value = notification_type == 'PROBLEM'
+    environment.is_recovered.return_value = notification_type == 'RECOVERY'
+    environment.is_service_issue.return_value = True
+    environment.service_state = service_state
+    environment.service_priority_id = priority_id
+    return environment
+
+
+class TestPriorityEventQueue(unittest.TestCase):
+
+    def setUp(self):
+        self.now = 1000.0
+        self.queue = PriorityEventQueue(aging_rate=0.05, clock=lambda: self.now)
+
+    def test_priority_classes(self):
+        self.assertEqual(('critical', 0), self.queue.priority_class(create_environment()))
+        self.assertEqual(('warning', 1),
+                         self.queue.priority_class(create_environment(service_state='WARNING')))
+        self.assertEqual(('recovery', 3),
+                         self.queue.priority_class(create_environment('RECOVERY', 'OK')))
+        self.assertEqual(('other', 4),
+                         self.queue.priority_class(create_environment('ACKNOWLEDGEMENT')))
+
+    def test_jira_priority_adjusts_rank_within_class(self):
+        name, rank = self.queue.priority_class(create_environment(priority_id='1'))
+
+        self.assertEqual('critical', name)
+        self.assertAlmostEqual(-0.2, rank)
+
+    def test_critical_problem_jumps_recoveries(self):
+        for _ in range(3):
+            self.queue.put(create_environment('RECOVERY', 'OK'))
+        critical = create_environment()
+        self.queue.put(critical)
+
+        self.assertEqual(critical, self.queue.get())
+
+    def test_same_class_keeps_arrival_order(self):
+        first, second = create_environment(name='first'), create_environment(name='second')
+        self.queue.put(first)
+        self.queue.put(second)
+
+        self.assertEqual([first, second], [self.queue.get(), self.queue.get()])
+
+    def test_events_of_same_service_keep_arrival_order(self):
+        recovery = create_environment('RECOVERY', 'OK', host_name='myserver1',
+                                      service_description='disk')
+        problem = create_environment(host_name='myserver1', service_description='disk')
+        other = create_environment(host_name='myserver2', service_description='disk')
+        self.queue.put(recovery)
+        self.queue.put(problem)
+        self.queue.put(other)
+
+        self.assertEqual([other, recovery, problem],
+                         [self.queue.get(), self.queue.get(), self.queue.get()])
+        self.assertEqual({}, self.queue.pending_keys)
+
+    def test_aging_prevents_starvation(self):
+        recovery = create_environment('RECOVERY', 'OK')
+        self.queue.put(recovery)
+        self.now += 61
+        self.queue.put(create_environment())
+
+        self.assertEqual(recovery, self.queue.get())
+
+    def test_get_records_wait_per_class(self):
+        self.queue.put(create_environment())
+        self.queue.put(create_environment('RECOVERY', 'OK'))
+        self.now += 2
+        self.queue.get()
+        self.now += 3
+        self.queue.get()
+
+        stats = self.queue.stats()
+        self.assertEqual({'count': 1, 'total_wait': 2.0, 'max_wait': 2.0}, stats['critical'])
+        self.assertEqual({'count': 1, 'total_wait': 5.0, 'max_wait': 5.0}, stats['recovery'])
+        self.assertEqual(['critical: 1 events, queue wait avg 2.000s max 2.000s',
+                          'recovery: 1 events, queue wait avg 5.000s max 5.000s'],
+                         self.queue.format_stats())
+
+    def test_put_custom_item(self):
+        self.queue.put(create_environment(), 'work item')
+
+        self.assertEqual('work item', self.queue.get())
+
+    def test_empty_queue(self):
+        self.assertRaises(Empty, self.queue.get, False)
+
+    def test_bounded_queue_raises_full_without_blocking(self):
+        queue = PriorityEventQueue(maxsize=1)
+        queue.put(create_environment())
+
+        self.assertRaises(Full, queue.put, create_environment(), None, False)
+
+    def test_bounded_queue_blocks_producer_until_consumed(self):
+        queue = PriorityEventQueue(maxsize=1)
+        queue.put(create_environment(name='first'))
+        producer = threading.Thread(target=queue.put, args=(create_environment(name='second'),))
+        producer.start()
+
+        self.assertEqual('first', queue.get(timeout=1).name)
+        producer.join(1)
+        self.assertEqual('second', queue.get(timeout=1).name)
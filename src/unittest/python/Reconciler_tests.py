@@ -0,0 +1,115 @@
+import unittest
+import textwrap
+from StringIO import StringIO
+
+from mock import Mock, patch
+
+from icinga2jira import Reconciler, CloseIssue, read_icinga_status, read_icinga_status_labels
+
+STATUS_FILE = textwrap.dedent("""
+    info {
+    \tcreated=1385476925
+    \t}
+
+    hoststatus {
+    \thost_name=myserver1
+    \tcurrent_state=1
+    \tcurrent_problem_id=100
+    \t}
+
+    hoststatus {
+    \thost_name=myserver2
+    \tcurrent_state=0
+    \tcurrent_problem_id=0
+    \t}
+
+    servicestatus {
+    \thost_name=myserver2
+    \tservice_description=disk
+    \tcurrent_problem_id=200
+    \t}
+""")
+
+
+def create_issue_mock(key, labels):
+    issue = Mock()
+    issue.key = key
+    issue.fields.labels = labels
+    return issue
+
+
+class TestReadIcingaStatusLabels(unittest.TestCase):
+
+    def test_returns_labels_of_current_problems(self):
+        self.assertEqual(set(['ICI#100#myserver1', 'ICI#200#myserver2']),
+                         read_icinga_status_labels(StringIO(STATUS_FILE)))
+
+    def test_returns_hosts_and_services_with_problems(self):
+        self.assertEqual(set([('myserver1', None), ('myserver2', 'disk')]),
+                         read_icinga_status(StringIO(STATUS_FILE))[1])
+
+    def test_refuses_empty_or_foreign_status_file(self):
+        self.assertRaises(ValueError, read_icinga_status_labels, StringIO(''))
+        self.assertRaises(ValueError, read_icinga_status_labels,
+                          StringIO("define host {\n\thost_name\tmyserver1\n\t}\n"))
+        self.assertRaises(ValueError, read_icinga_status_labels,
+                          StringIO("info {\n\tcreated=1\n\t}\n"))
+
+    def test_refuses_truncated_status_file(self):
+        truncated = STATUS_FILE[:STATUS_FILE.index('current_problem_id=100')]
+
+        self.assertRaises(ValueError, read_icinga_status_labels, StringIO(truncated))
+
+
+class TestReconciler(unittest.TestCase):
+
+    def setUp(self):
+        self.jira_mock = Mock()
+        self.close_mock = Mock(side_effect=lambda issues: issues)
+        self.close_patcher = patch.object(CloseIssue, 'close_issues', self.close_mock)
+        self.close_patcher.start()
+
+    def tearDown(self):
+        self.close_patcher.stop()
+
+    def create_reconciler(self, page_size=2):
+        return Reconciler(self.jira_mock, set(['ICI#100#myserver1']), ['MON', 'DBA', 'MON'],
+                          page_size=page_size, concurrency=1)
+
+    def test_closes_only_stale_icinga_issues(self):
+        active = create_issue_mock('MON-1', ['ICI#100#myserver1'])
+        stale = create_issue_mock('MON-2', ['ICI#101#myserver1', 'database'])
+        foreign = create_issue_mock('MON-3', ['database'])
+        self.jira_mock.search_issues.return_value = [active, stale, foreign]
+
+        seen, closed = self.create_reconciler(page_size=10).run()
+
+        self.assertEqual((3, 1), (seen, closed))
+        self.close_mock.assert_called_with([stale])
+        self.jira_mock.search_issues.assert_called_with(
+            'project in ("DBA", "MON") AND resolution = Unresolved AND labels is not EMPTY '
+            'ORDER BY key ASC',
+            startAt=0, maxResults=10, fields='labels')
+
+    def test_pages_skip_over_kept_issues_only(self):
+        pages = [[create_issue_mock('MON-1', ['ICI#100#myserver1']),
+                  create_issue_mock('MON-2', ['ICI#1#a'])],
+                 [create_issue_mock('MON-3', ['ICI#2#a']), create_issue_mock('MON-4', ['ICI#3#a'])],
+                 []]
+        self.jira_mock.search_issues.side_effect = pages
+
+        seen, closed = self.create_reconciler().run()
+
+        self.assertEqual((4, 3), (seen, closed))
+        start_ats = [call[1]['startAt'] for call in self.jira_mock.search_issues.call_args_list]
+        self.assertEqual([0, 1, 1], start_ats)
+
+    def test_close_creates_recovery_environment_from_label(self):
+        issue = create_issue_mock('MON-2', ['ICI#101#myserver1'])
+
+        with patch('icinga2jira.CloseIssue') as close_issue_class:
+            close_issue_class.return_value.close_issues.return_value = [issue]
+            self.assertEqual(issue, self.create_reconciler()._close(issue))
+
+        environment = close_issue_class.call_args[0][1]
+        self.assertEqual('ICI#101#myserver1', environment.get_jira_recovery_label())
@@ -0,0 +1,92 @@
+import unittest
+
+from icinga2jira import Route, Router
+
+
+def route(name, host, service=None):
+    return Route(name, host, service, project_key=name.upper())
+
+
+class TestRoute(unittest.TestCase):
+
+    def test_exact_host_pattern(self):
+        self.assertTrue(Route('any', 'db01').is_exact_host())
+        self.assertFalse(Route('any', 'db*').is_exact_host())
+        self.assertFalse(Route('any', 're:db01').is_exact_host())
+
+    def test_host_prefix_pattern(self):
+        self.assertTrue(Route('any', 'db*').is_host_prefix())
+        self.assertTrue(Route('any', '*').is_host_prefix())
+        self.assertFalse(Route('any', 'db?*').is_host_prefix())
+        self.assertFalse(Route('any', 'db01').is_host_prefix())
+
+    def test_matches_service_glob(self):
+        rule = Route('any', '*', 'http*')
+
+        self.assertTrue(rule.matches_service('https certificate'))
+        self.assertFalse(rule.matches_service('ssh'))
+        self.assertFalse(rule.matches_service(None))
+
+    def test_route_without_service_matches_host_problems(self):
+        self.assertTrue(Route('any', '*').matches_service(None))
+
+
+class TestRouter(unittest.TestCase):
+
+    def test_route_returns_none_without_matching_rule(self):
+        router = Router([route('db', 'db01')])
+
+        self.assertEqual(None, router.route('web01', 'http'))
+
+    def test_route_by_exact_host(self):
+        router = Router([route('db', 'db01')])
+
+        self.assertEqual('db', router.route('db01', 'mysql').name)
+
+    def test_route_by_host_prefix(self):
+        router = Router([route('web', 'web*')])
+
+        self.assertEqual('web', router.route('web17', None).name)
+        self.assertEqual(None, router.route('we', None))
+
+    def test_route_by_glob_and_regex(self):
+        router = Router([route('glob', 'web??.dc1'), route('regex', r're:db\d+\.dc2')])
+
+        self.assertEqual('glob', router.route('web01.dc1', None).name)
+        self.assertEqual('regex', router.route('db42.dc2', None).name)
+        self.assertEqual(None, router.route('db42.dc2x', None))
+
+    def test_route_by_anchored_host_regex(self):
+        router = Router([route('db', r're:^db\d+$'), route('disk', 're:web.*', r're:^disk$')])
+
+        self.assertEqual('db', router.route('db1', None).name)
+        self.assertEqual('db', router.route('db1', 'mysql').name)
+        self.assertEqual(None, router.route('db1x', None))
+        self.assertEqual('disk', router.route('web1', 'disk').name)
+        self.assertEqual(None, router.route('web1', 'disk2'))
+
+    def test_route_checks_service_pattern(self):
+        router = Router([route('http', 'web*', 'http*'), route('web', 'web*')])
+
+        self.assertEqual('http', router.route('web01', 'https').name)
+        self.assertEqual('web', router.route('web01', 'ssh').name)
+
+    def test_first_declared_rule_wins_across_indexes(self):
+        router = Router([route('regex', 're:web0[0-9]'), route('prefix', 'web*'),
+                         route('exact', 'web01')])
+
+        self.assertEqual('regex', router.route('web01', None).name)
+        self.assertEqual('prefix', router.route('web10', None).name)
+
+    def test_regex_rule_with_service_does_not_hide_later_regex_rule(self):
+        router = Router([route('mysql', 'db?', 'mysql'), route('db', 'db?')])
+
+        self.assertEqual('db', router.route('db1', 'disk').name)
+
+    def test_route_with_many_regex_rules(self):
+        routes = [route('r%d' % index, 're:host%d-[a-z]+' % index) for index in range(250)]
+        router = Router(routes)
+
+        self.assertEqual('r0', router.route('host0-abc', None).name)
+        self.assertEqual('r199', router.route('host199-x', None).name)
+        self.assertEqual(None, router.route('host250-x', None))
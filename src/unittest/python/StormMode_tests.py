@@ -0,0 +1,222 @@
+import os
+import shutil
+import sqlite3
+import tempfile
+import unittest
+
+from mock import Mock
+from jira.exceptions import JIRAError
+
+from icinga2jira import Route, StormMode, StormIssue, TicketIndex
+
+ANY_CONFIG = {'jira_project_key': 'MON', 'jira_issue_type': 'Technical task'}
+
+
+def create_icinga_environment_mock(problem_id='1', host_name='myserver1'):
+    environment = Mock()
+    environment.host_name = host_name
+    environment.service_description = 'disk'
+    environment.service_state = 'CRITICAL'
+    environment.short_date_time = '11-26-2013 15:42:05'
+    environment.is_service_issue.return_value = True
+    environment.create_labels_list.return_value = ['ICI#%s#%s' % (problem_id, host_name)]
+    return environment
+
+
+class TestStormMode(unittest.TestCase):
+
+    def setUp(self):
+        self.now = 1000.0
+        self.storm = StormMode(':memory:', 3, window=60, flush_interval=30,
+                               clock=lambda: self.now, sleep=Mock())
+
+    def test_storm_starts_when_threshold_is_reached_within_window(self):
+        self.assertEqual([False, False, True], [self.storm.record_problem() for _ in range(3)])
+
+    def test_events_outside_window_are_forgotten(self):
+        self.storm.record_problem()
+        self.storm.record_problem()
+        self.now += 61
+
+        self.assertFalse(self.storm.record_problem())
+
+    def test_summary_issue_is_created_once(self):
+        create_mock = Mock(return_value='MON-1')
+
+        self.assertEqual('MON-1', self.storm.summary_issue_key(create_mock))
+        self.assertEqual('MON-1', self.storm.summary_issue_key(create_mock))
+        self.assertEqual(1, create_mock.call_count)
+
+    def test_first_pending_member_leads_the_flush(self):
+        self.assertTrue(self.storm.add_member('ICI#1#a', 'a', 'disk', 'CRITICAL'))
+        self.assertFalse(self.storm.add_member('ICI#2#b', 'b', None, 'DOWN'))
+
+    def test_flush_adds_labels_and_lists_members_in_one_update(self):
+        jira_mock = Mock()
+        self.storm.add_member('ICI#1#a', 'a', 'disk', 'CRITICAL')
+        self.storm.add_member('ICI#2#b', 'b', None, 'DOWN')
+
+        self.assertTrue(self.storm.flush(jira_mock, 'MON-1'))
+
+        jira_mock.issue.assert_called_with('MON-1', fields='labels')
+        update_kwargs = jira_mock.issue.return_value.update.call_args[1]
+        self.assertEqual({'labels': [{'add': 'ICI#1#a'}, {'add': 'ICI#2#b'}]},
+                         update_kwargs['update'])
+        self.assertTrue('* disk on a is CRITICAL\n* b is DOWN' in
+                        update_kwargs['fields']['description'])
+        self.assertFalse(self.storm.flush(jira_mock, 'MON-1'))
+
+    def test_member_after_flush_leads_the_next_flush(self):
+        self.storm.add_member('ICI#1#a', 'a', 'disk', 'CRITICAL')
+        self.storm.flush(Mock(), 'MON-1')
+
+        self.assertTrue(self.storm.add_member('ICI#2#b', 'b', None, 'DOWN'))
+
+    def test_failed_flush_keeps_members_pending(self):
+        jira_mock = Mock()
+        jira_mock.issue.return_value.update.side_effect = JIRAError()
+        self.storm.add_member('ICI#1#a', 'a', 'disk', 'CRITICAL')
+
+        self.assertRaises(JIRAError, self.storm.flush, jira_mock, 'MON-1')
+
+        jira_mock.issue.return_value.update.side_effect = None
+        self.assertTrue(self.storm.add_member('ICI#2#b', 'b', None, 'DOWN'))
+        self.storm.flush(jira_mock, 'MON-1')
+        self.assertEqual({'labels': [{'add': 'ICI#1#a'}, {'add': 'ICI#2#b'}]},
+                         jira_mock.issue.return_value.update.call_args[1]['update'])
+
+    def test_pending_members_of_a_dead_leader_are_taken_over(self):
+        jira_mock = Mock()
+        self.storm.summary_issue_key(lambda: 'MON-1')
+        self.storm.add_member('ICI#1#a', 'a', 'disk', 'CRITICAL')
+        self.assertFalse(self.storm.flush_overdue(jira_mock))
+        self.assertFalse(self.storm.add_member('ICI#2#b', 'b', None, 'DOWN'))
+
+        self.now += 61
+
+        self.assertTrue(self.storm.flush_overdue(jira_mock))
+        jira_mock.issue.assert_called_with('MON-1', fields='labels')
+        self.assertFalse(self.storm.flush_overdue(jira_mock))
+
+    def test_storm_ends_after_overdue_flush(self):
+        self.storm.summary_issue_key(lambda: 'MON-1')
+        self.storm.add_member('ICI#1#a', 'a', 'disk', 'CRITICAL')
+        self.now += 61
+
+        self.storm.flush_overdue(Mock())
+        self.storm.record_problem()
+
+        self.assertEqual('MON-2', self.storm.summary_issue_key(lambda: 'MON-2'))
+
+    def test_flush_due_waits_for_flush_interval(self):
+        jira_mock = Mock()
+        self.storm.summary_issue_key(lambda: 'MON-1')
+        self.storm.add_member('ICI#1#a', 'a', 'disk', 'CRITICAL')
+        self.now += 29
+
+        self.assertFalse(self.storm.flush_due(jira_mock))
+
+        self.now += 1
+        self.assertTrue(self.storm.flush_due(jira_mock))
+        self.assertFalse(self.storm.flush_due(jira_mock))
+        self.assertEqual(1, jira_mock.issue.return_value.update.call_count)
+
+    def test_scopes_keep_their_storms_apart(self):
+        other_storm = StormMode(':memory:', 3, window=60, flush_interval=30, clock=lambda: self.now,
+                                scope='dba')
+        other_storm.connection = self.storm.connection
+        self.storm.summary_issue_key(lambda: 'MON-1')
+        self.storm.add_member('ICI#1#a', 'a', 'disk', 'CRITICAL')
+
+        self.assertEqual('DBA-1', other_storm.summary_issue_key(lambda: 'DBA-1'))
+        self.assertTrue(other_storm.add_member('ICI#2#b', 'b', None, 'DOWN'))
+        jira_mock = Mock()
+        other_storm.flush(jira_mock, 'DBA-1')
+        jira_mock.issue.assert_called_with('DBA-1', fields='labels')
+        self.assertEqual({'labels': [{'add': 'ICI#2#b'}]},
+                         jira_mock.issue.return_value.update.call_args[1]['update'])
+        self.assertFalse(other_storm.record_problem())
+        self.assertEqual('MON-1', self.storm.summary_issue_key(lambda: 'MON-2'))
+
+    def test_route_storms_share_the_connection_and_are_found_for_flushing(self):
+        route_storm = self.storm.for_route(Route('dba', 'db*'))
+        route_storm.summary_issue_key(lambda: 'DBA-1')
+        route_storm.add_member('ICI#2#b', 'b', None, 'DOWN')
+
+        self.assertTrue(self.storm.for_route(None) is self.storm)
+        self.assertTrue(route_storm.connection is self.storm.connection)
+        self.assertEqual(['default', 'default/dba'],
+                         [storm.scope for storm in self.storm.route_storms()])
+        self.assertEqual('MON-1', self.storm.summary_issue_key(lambda: 'MON-1'))
+
+    def test_unscoped_storm_state_is_migrated_to_default_scope(self):
+        temp_dir = tempfile.mkdtemp()
+        try:
+            path = os.path.join(temp_dir, 'state.db')
+            connection = sqlite3.connect(path)
+            connection.execute("CREATE TABLE storm_state (name TEXT PRIMARY KEY, value TEXT)")
+            connection.execute("INSERT INTO storm_state VALUES ('summary_key', 'MON-1')")
+            connection.commit()
+            connection.close()
+
+            self.assertEqual('MON-1', StormMode(path, 3).summary_issue_key(lambda: 'MON-2'))
+        finally:
+            shutil.rmtree(temp_dir)
+
+    def test_storm_end_forgets_summary_issue(self):
+        self.storm.summary_issue_key(lambda: 'MON-1')
+        self.now += 61
+
+        self.storm.record_problem()
+
+        self.assertEqual('MON-2', self.storm.summary_issue_key(lambda: 'MON-2'))
+
+
+class TestStormIssue(unittest.TestCase):
+
+    def setUp(self):
+        self.jira_mock = Mock()
+        self.jira_mock.create_issue.return_value.key = 'MON-1'
+        self.storm = StormMode(':memory:', 1, flush_interval=30, sleep=Mock())
+        self.ticket_index = TicketIndex(':memory:')
+
+    def test_execute_creates_summary_and_flushes_as_leader(self):
+        result = StormIssue(self.jira_mock, ANY_CONFIG, create_icinga_environment_mock(),
+                            self.storm, self.ticket_index).execute()
+
+        self.assertEqual(['MON-1'], [issue.key for issue in result])
+        self.assertEqual([StormMode.STORM_LABEL],
+                         self.jira_mock.create_issue.call_args[1]['fields']['labels'])
+        self.storm.sleep.assert_called_with(30)
+        self.assertEqual(1, self.jira_mock.issue.return_value.update.call_count)
+        self.assertEqual(['MON-1'], self.ticket_index.find('ICI#1#myserver1'))
+
+    def test_summary_uses_project_issue_type_and_labels_of_route(self):
+        route = Mock(project_key='DBA', issue_type=None, labels=['database'])
+
+        StormIssue(self.jira_mock, ANY_CONFIG, create_icinga_environment_mock(), self.storm,
+                   route=route).execute()
+
+        fields = self.jira_mock.create_issue.call_args[1]['fields']
+        self.assertEqual({'key': 'DBA'}, fields['project'])
+        self.assertEqual({'name': 'Technical task'}, fields['issuetype'])
+        self.assertEqual([StormMode.STORM_LABEL, 'database'], fields['labels'])
+
+    def test_followers_only_record_their_labels(self):
+        self.storm.add_member('ICI#0#other', 'other', None, 'DOWN')
+
+        StormIssue(self.jira_mock, ANY_CONFIG, create_icinga_environment_mock(),
+                   self.storm).execute()
+
+        self.assertEqual(1, self.jira_mock.create_issue.call_count)
+        self.assertEqual(0, self.storm.sleep.call_count)
+        self.assertEqual(0, self.jira_mock.issue.call_count)
+
+    def test_scheduled_leader_leaves_the_flush_to_the_timer(self):
+        self.storm.scheduled = True
+
+        StormIssue(self.jira_mock, ANY_CONFIG, create_icinga_environment_mock(),
+                   self.storm).execute()
+
+        self.assertEqual(0, self.storm.sleep.call_count)
+        self.assertEqual(0, self.jira_mock.issue.call_count)
@@ -0,0 +1,49 @@
+import unittest
+
+from icinga2jira import StreamProblems
+
+
+class TestStreamProblems(unittest.TestCase):
+
+    def setUp(self):
+        self.now = 10000.0
+        self.problems = StreamProblems(':memory:', clock=lambda: self.now)
+
+    def test_open_problem_keeps_its_id(self):
+        problem_id = self.problems.open('host1', 'disk', 1000.0)
+
+        self.assertEqual('1000000', problem_id)
+        self.assertEqual(problem_id, self.problems.open('host1', 'disk', 1005.0))
+        self.assertEqual(problem_id, self.problems.get('host1', 'disk'))
+
+    def test_close_forgets_problem(self):
+        problem_id = self.problems.open('host1', None, 1000.0)
+
+        self.assertEqual(problem_id, self.problems.close('host1', None))
+        self.assertEqual(None, self.problems.close('host1', None))
+
+    def test_recovered_problems_are_pruned_after_retention(self):
+        self.problems.open('host1', 'disk', 1000.0)
+        self.problems.recover('host1', 'disk')
+        self.now += StreamProblems.RECOVERED_RETENTION + 1
+        self.problems.recover('host2', 'load')
+
+        self.assertEqual(None, self.problems.get('host1', 'disk'))
+
+    def test_active_labels_cover_problems_known_to_icinga_and_recent_ones(self):
+        self.problems.open('host1', 'disk', 1000.0)
+        self.problems.open('host2', None, 1001.0)
+        self.now += StreamProblems.STALE_AFTER + 1
+        self.problems.open('host3', 'load', 1002.0)
+
+        self.assertEqual(set(['ICI#1000000#host1', 'ICI#1002000#host3']),
+                         self.problems.active_labels(set([('host1', 'disk')])))
+
+    def test_forget_stale_drops_old_problems_unknown_to_icinga(self):
+        self.problems.open('host1', 'disk', 1000.0)
+        self.problems.open('host2', None, 1001.0)
+        self.now += StreamProblems.STALE_AFTER + 1
+
+        self.assertEqual(1, self.problems.forget_stale(set([('host1', 'disk')])))
+        self.assertEqual(None, self.problems.get('host2', None))
+        self.assertEqual('1000000', self.problems.get('host1', 'disk'))
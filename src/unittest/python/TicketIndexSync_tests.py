@@ -0,0 +1,129 @@
+import unittest
+
+from mock import Mock
+
+from icinga2jira import TicketIndexSync, TicketIndex, iter_issues
+
+
+def create_issue_mock(key, labels, summary='', resolution=None):
+    issue = Mock()
+    issue.key = key
+    issue.fields.labels = labels
+    issue.fields.summary = summary
+    issue.fields.resolution = resolution
+    return issue
+
+
+class TestIterIssues(unittest.TestCase):
+
+    def test_streams_all_pages(self):
+        jira_mock = Mock()
+        jira_mock.search_issues.side_effect = [['a', 'b'], ['c']]
+
+        self.assertEqual(['a', 'b', 'c'], list(iter_issues(jira_mock, 'jql', 2)))
+        self.assertEqual(0, jira_mock.search_issues.call_args_list[0][1]['startAt'])
+        self.assertEqual(2, jira_mock.search_issues.call_args_list[1][1]['startAt'])
+
+    def test_is_lazy(self):
+        jira_mock = Mock()
+        jira_mock.search_issues.return_value = ['a', 'b']
+
+        next(iter_issues(jira_mock, 'jql', 2))
+
+        self.assertEqual(1, jira_mock.search_issues.call_count)
+
+
+class TestTicketIndexSync(unittest.TestCase):
+
+    def setUp(self):
+        self.now = 100000.0
+        self.jira_mock = Mock()
+        self.ticket_index = TicketIndex(':memory:')
+        self.sync = TicketIndexSync(self.jira_mock, self.ticket_index, ['MON'], page_size=10,
+                                    clock=lambda: self.now)
+
+    def test_warm_up_without_checkpoint_runs_full_sync(self):
+        self.jira_mock.search_issues.return_value = [
+            create_issue_mock('MON-1', ['ICI#1#myserver1'], 'ICINGA: myserver1 is DOWN'),
+            create_issue_mock('MON-2', ['ICI#2#myserver1', 'other'],
+                              'ICINGA: disk on myserver1 is CRITICAL')]
+
+        self.assertEqual(2, self.sync.warm_up())
+
+        self.assertEqual('MON-1', self.ticket_index.find_open_host_issue('myserver1'))
+        self.assertEqual(['MON-2'], self.ticket_index.find('ICI#2#myserver1'))
+        self.assertEqual(self.now, self.sync.last_sync())
+        self.jira_mock.search_issues.assert_called_with(
+            'project in ("MON") AND resolution = Unresolved AND labels is not EMPTY '
+            'ORDER BY key ASC',
+            startAt=0, maxResults=10, fields='labels,summary')
+
+    def test_storm_summary_is_not_indexed_as_host_ticket(self):
+        self.jira_mock.search_issues.return_value = [
+            create_issue_mock('MON-5', ['ICINGA-STORM', 'ICI#1#myserver1', 'ICI#2#myserver2'],
+                              'ICINGA: alert storm since 11-26-2013 15:42:05')]
+
+        self.assertEqual(2, self.sync.full_sync())
+
+        self.assertEqual(['MON-5'], self.ticket_index.find('ICI#1#myserver1'))
+        self.assertEqual(None, self.ticket_index.find_open_host_issue('myserver1'))
+        self.assertEqual([], self.ticket_index.find_by_host('myserver2'))
+
+    def test_renamed_ticket_is_not_a_host_ticket(self):
+        self.jira_mock.search_issues.return_value = [
+            create_issue_mock('MON-6', ['ICI#3#myserver1'], 'Disk of myserver1 runs full')]
+
+        self.sync.full_sync()
+
+        self.assertEqual(['MON-6'], self.ticket_index.find('ICI#3#myserver1'))
+        self.assertEqual(None, self.ticket_index.find_open_host_issue('myserver1'))
+
+    def test_warm_up_with_checkpoint_polls_updated_issues_only(self):
+        self.ticket_index.add('ICI#1#myserver1', 'myserver1', 'MON-1')
+        self.jira_mock.search_issues.return_value = []
+        self.sync.full_sync()
+        self.now += 300
+        self.jira_mock.search_issues.return_value = [
+            create_issue_mock('MON-1', ['ICI#1#myserver1'], resolution='Fixed'),
+            create_issue_mock('MON-3', ['ICI#3#myserver2'])]
+
+        self.assertEqual(1, self.sync.warm_up())
+
+        self.jira_mock.search_issues.assert_called_with(
+            'project in ("MON") AND updated >= -7m ORDER BY updated ASC',
+            startAt=0, maxResults=10, fields='labels,summary,resolution')
+        self.assertEqual([], self.ticket_index.find('ICI#1#myserver1'))
+        self.assertEqual(['MON-3'], self.ticket_index.find('ICI#3#myserver2'))
+
+    def test_checkpoint_survives_restart(self):
+        self.jira_mock.search_issues.return_value = []
+        self.sync.full_sync()
+
+        restarted = TicketIndexSync(self.jira_mock, self.ticket_index, ['MON'])
+
+        self.assertEqual(self.now, restarted.last_sync())
+
+    def test_each_target_keeps_its_own_checkpoint(self):
+        self.jira_mock.search_issues.return_value = []
+        self.sync.full_sync()
+        self.now += 60
+
+        other_sync = TicketIndexSync(self.jira_mock, self.ticket_index.for_target('dba'), ['DBA'],
+                                     page_size=10, clock=lambda: self.now)
+        other_sync.warm_up()
+
+        self.jira_mock.search_issues.assert_called_with(
+            'project in ("DBA") AND resolution = Unresolved AND labels is not EMPTY '
+            'ORDER BY key ASC',
+            startAt=0, maxResults=10, fields='labels,summary')
+        self.assertEqual(self.now - 60, self.sync.last_sync())
+        self.assertEqual(self.now, other_sync.last_sync())
+
+    def test_background_sync_can_be_stopped(self):
+        self.jira_mock.search_issues.return_value = []
+        self.sync.full_sync()
+
+        self.sync.start(0.01)
+        self.sync.stop()
+
+        self.assertFalse(self.sync.thread.is_alive())
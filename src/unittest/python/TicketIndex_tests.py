@@ -0,0 +1,89 @@
+import os
+import shutil
+import sqlite3
+import tempfile
+import unittest
+
+from icinga2jira import TicketIndex
+
+ANY_HOSTNAME = 'myserver1'
+ANY_HOST_LABEL = 'ICI#100#myserver1'
+ANY_SERVICE_LABEL = 'ICI#200#myserver1'
+
+
+class TestTicketIndex(unittest.TestCase):
+
+    def setUp(self):
+        self.ticket_index = TicketIndex(':memory:')
+
+    def test_find_returns_indexed_issue_keys(self):
+        self.ticket_index.add(ANY_SERVICE_LABEL, ANY_HOSTNAME, 'MON-2')
+
+        self.assertEqual(['MON-2'], self.ticket_index.find(ANY_SERVICE_LABEL))
+        self.assertEqual([], self.ticket_index.find('ICI#1#other'))
+
+    def test_find_ignores_correlated_labels(self):
+        self.ticket_index.add(ANY_SERVICE_LABEL, ANY_HOSTNAME, 'MON-1', correlated=True)
+
+        self.assertEqual([], self.ticket_index.find(ANY_SERVICE_LABEL))
+        self.assertEqual('MON-1', self.ticket_index.find_correlated(ANY_SERVICE_LABEL))
+
+    def test_find_open_host_issue_returns_latest_host_ticket(self):
+        self.ticket_index.add('ICI#1#myserver1', ANY_HOSTNAME, 'MON-1', is_host=True, opened_at=1)
+        self.ticket_index.add(ANY_HOST_LABEL, ANY_HOSTNAME, 'MON-3', is_host=True, opened_at=3)
+        self.ticket_index.add(ANY_SERVICE_LABEL, ANY_HOSTNAME, 'MON-4', opened_at=4)
+
+        self.assertEqual('MON-3', self.ticket_index.find_open_host_issue(ANY_HOSTNAME))
+        self.assertEqual(None, self.ticket_index.find_open_host_issue('other'))
+
+    def test_remove_issue_drops_all_labels_of_issue(self):
+        self.ticket_index.add(ANY_HOST_LABEL, ANY_HOSTNAME, 'MON-1', is_host=True)
+        self.ticket_index.add(ANY_SERVICE_LABEL, ANY_HOSTNAME, 'MON-1', correlated=True)
+
+        self.ticket_index.remove_issue('MON-1')
+
+        self.assertEqual(None, self.ticket_index.find_open_host_issue(ANY_HOSTNAME))
+        self.assertEqual(None, self.ticket_index.find_correlated(ANY_SERVICE_LABEL))
+
+    def test_remove_label(self):
+        self.ticket_index.add(ANY_SERVICE_LABEL, ANY_HOSTNAME, 'MON-2')
+
+        self.ticket_index.remove(ANY_SERVICE_LABEL)
+
+        self.assertEqual([], self.ticket_index.find(ANY_SERVICE_LABEL))
+
+    def test_storm_members_are_not_host_tickets(self):
+        self.ticket_index.add(ANY_SERVICE_LABEL, ANY_HOSTNAME, 'MON-9', storm=True)
+
+        self.assertEqual(['MON-9'], self.ticket_index.find(ANY_SERVICE_LABEL))
+        self.assertEqual([], self.ticket_index.find_by_host(ANY_HOSTNAME))
+        self.assertEqual(None, self.ticket_index.find_open_host_issue(ANY_HOSTNAME))
+
+    def test_index_of_older_version_is_migrated_to_default_target(self):
+        temp_dir = tempfile.mkdtemp()
+        try:
+            path = os.path.join(temp_dir, 'state.db')
+            connection = sqlite3.connect(path)
+            connection.execute("CREATE TABLE tickets (label TEXT PRIMARY KEY, host TEXT, "
+                               "issue_key TEXT, is_host INTEGER, correlated INTEGER, "
+                               "opened_at REAL)")
+            connection.execute("INSERT INTO tickets VALUES (?, ?, 'MON-1', 1, 0, 1)",
+                               (ANY_HOST_LABEL, ANY_HOSTNAME))
+            connection.commit()
+            connection.close()
+
+            self.assertEqual(['MON-1'], TicketIndex(path).find_by_host(ANY_HOSTNAME))
+        finally:
+            shutil.rmtree(temp_dir)
+
+    def test_targets_keep_their_tickets_apart(self):
+        other_target = self.ticket_index.for_target('dba')
+        self.ticket_index.add(ANY_HOST_LABEL, ANY_HOSTNAME, 'OPS-5', is_host=True)
+        other_target.add(ANY_SERVICE_LABEL, ANY_HOSTNAME, 'OPS-5')
+
+        other_target.remove_issue('OPS-5')
+
+        self.assertEqual(['OPS-5'], self.ticket_index.find(ANY_HOST_LABEL))
+        self.assertEqual([], other_target.find(ANY_SERVICE_LABEL))
+        self.assertEqual(None, other_target.find_open_host_issue(ANY_HOSTNAME))
+        self.assertEqual([], other_target.find_by_host(ANY_HOSTNAME))
@@ -64,6 +64,52 @@ class TestReadConfig(unittest.TestCase):
         self.assertEqual(config_dict['jira_issue_type'], ANY_ISSUE_TYPE)
 
 
+class TestReadRoutingRules(unittest.TestCase):
+
+    def test_parse_routing_rules_compiles_route_sections_in_order(self):
+        config = StringIO(TEMPLATE + textwrap.dedent("""
+            [route:database]
+            host = db*
+            service = mysql*
+            project = DBA
+            issue_type = Incident
+            labels = database, storage
+
+            [route:web]
+            host = re:web[0-9]+
+            project = WEB
+        """))
+
+        router = i2j.parse_routing_rules(config)
+
+        self.assertEqual(['database', 'web'], [route.name for route in router.routes])
+        database = router.route('db01', 'mysql replication')
+        self.assertEqual('DBA', database.project_key)
+        self.assertEqual('Incident', database.issue_type)
+        self.assertEqual(['database', 'storage'], database.labels)
+        self.assertEqual('web', router.route('web12', None).name)
+
+    def test_parse_routing_rules_reads_jira_target(self):
+        config = StringIO(TEMPLATE + "\n[route:database]\nhost = db*\ntarget = dba\n")
+
+        router = i2j.parse_routing_rules(config)
+
+        self.assertEqual('dba', router.routes[0].target)
+
+    def test_parse_routing_rules_without_routes(self):
+        self.assertEqual([], i2j.parse_routing_rules(StringIO(TEMPLATE)).routes)
+
+    def test_parse_routing_rules_throws_error_when_host_is_missing(self):
+        config = StringIO(TEMPLATE + "\n[route:broken]\nproject = X\n")
+
+        self.assertRaises(ValueError, i2j.parse_routing_rules, config)
+
+    def test_parse_routing_rules_throws_error_for_invalid_regex(self):
+        config = StringIO(TEMPLATE + "\n[route:broken]\nhost = re:web(\n")
+
+        self.assertRaises(ValueError, i2j.parse_routing_rules, config)
+
+
 class TestParseOptions(unittest.TestCase):
 
     def test_parse_mandatory_parameter_config_and_c(self):
@@ -75,11 +121,296 @@ class TestParseOptions(unittest.TestCase):
         actualOptions = i2j.parse_arguments(argv)
         self.assertEqual(actualOptions['--config'], ANY_CONFIG_PATH)
 
+    def test_parse_reconcile_command(self):
+        actualOptions = i2j.parse_arguments(['reconcile', '-c', ANY_CONFIG_PATH, '--status-file',
+                                             'status.dat'])
+
+        self.assertTrue(actualOptions['reconcile'])
+        self.assertEqual(actualOptions['--status-file'], 'status.dat')
+
+    def test_parse_sync_command(self):
+        self.assertTrue(i2j.parse_arguments(['sync', '-c', ANY_CONFIG_PATH])['sync'])
+
+    def test_parse_stream_command(self):
+        self.assertTrue(i2j.parse_arguments(['stream', '-c', ANY_CONFIG_PATH])['stream'])
+
+    def test_parse_audit_commands(self):
+        self.assertEqual('ICI#1#host', i2j.parse_arguments(['audit', '-c', ANY_CONFIG_PATH,
+                                                            '--label', 'ICI#1#host'])['--label'])
+        self.assertTrue(i2j.parse_arguments(['audit', '-c', ANY_CONFIG_PATH, '--mttr'])['--mttr'])
+        self.assertRaises(DocoptExit, i2j.parse_arguments, ['audit', '-c', ANY_CONFIG_PATH])
+
+    def test_parse_stats_command(self):
+        self.assertTrue(i2j.parse_arguments(['stats', '-c', ANY_CONFIG_PATH])['stats'])
+
     def test_when_unallowed_options_are_set_an_error_is_thrown(self):
         self.assertRaises(DocoptExit, i2j.parse_arguments, ["--foo", "bar"])
         self.assertRaises(DocoptExit, i2j.parse_arguments, ["open", "--foo"])
 
 
+class TestIssueFactory(unittest.TestCase):
+
+    def setUp(self):
+        self.config = i2j.parse_and_validate_config_file(StringIO(TEMPLATE))
+
+    def create_environment(self, notification_type):
+        environment = create_icinga_environment_mock(notification_type)
+        environment.has_new_problem.return_value = notification_type == NOTIFICATION_TYPE_PROBLEM
+        environment.is_recovered.return_value = notification_type == 'RECOVERY'
+        environment.is_comment_notification.return_value = \
+            notification_type in i2j.IcingaEnvironment.COMMENT_NOTIFICATION_TYPES
+        return environment
+
+    def test_problem_creates_open_issue(self):
+        issue = i2j.issue_factory(Mock(), self.create_environment(NOTIFICATION_TYPE_PROBLEM),
+                                  self.config)
+
+        self.assertTrue(isinstance(issue, i2j.OpenIssue))
+
+    def test_recovery_creates_close_issue(self):
+        issue = i2j.issue_factory(Mock(), self.create_environment('RECOVERY'), self.config)
+
+        self.assertTrue(isinstance(issue, i2j.CloseIssue))
+
+    def test_acknowledgement_creates_comment_issue(self):
+        comment_buffer = Mock()
+
+        issue = i2j.issue_factory(Mock(), self.create_environment('ACKNOWLEDGEMENT'), self.config,
+                                  comment_buffer=comment_buffer)
+
+        self.assertTrue(isinstance(issue, i2j.CommentIssue))
+        self.assertEqual(comment_buffer, issue.comment_buffer)
+
+    def test_unknown_notification_type_raises_exception(self):
+        self.assertRaises(i2j.UnknownIssueException, i2j.issue_factory,
+                          Mock(), self.create_environment('CUSTOM'), self.config)
+
+    def test_correlated_problem_creates_correlated_issue(self):
+        correlator = Mock()
+        correlator.find_parent_issue.return_value = 'MON-1'
+
+        issue = i2j.issue_factory(Mock(), self.create_environment(NOTIFICATION_TYPE_PROBLEM),
+                                  self.config, correlator=correlator)
+
+        self.assertTrue(isinstance(issue, i2j.CorrelatedIssue))
+        self.assertEqual('MON-1', issue.parent_issue_key)
+
+    def test_problem_during_storm_creates_storm_issue(self):
+        storm = Mock()
+        storm.for_route.return_value.record_problem.return_value = True
+
+        issue = i2j.issue_factory(Mock(), self.create_environment(NOTIFICATION_TYPE_PROBLEM),
+                                  self.config, storm=storm)
+
+        self.assertTrue(isinstance(issue, i2j.StormIssue))
+        storm.for_route.assert_called_with(None)
+
+    def test_storm_is_kept_per_route(self):
+        storm = Mock()
+        storm.for_route.return_value.record_problem.return_value = True
+        route = i2j.Route('dba', 'myserver*', project_key='DBA', labels=['database'])
+        router = Mock()
+        router.route.return_value = route
+
+        issue = i2j.issue_factory(Mock(), self.create_environment(NOTIFICATION_TYPE_PROBLEM),
+                                  self.config, router=router, storm=storm)
+
+        storm.for_route.assert_called_with(route)
+        self.assertTrue(issue.storm is storm.for_route.return_value)
+        self.assertEqual('DBA', issue.project_key)
+        self.assertEqual(['database'], issue.extra_labels)
+
+    def test_uncorrelated_problem_creates_open_issue(self):
+        correlator = Mock()
+        correlator.find_parent_issue.return_value = None
+
+        issue = i2j.issue_factory(Mock(), self.create_environment(NOTIFICATION_TYPE_PROBLEM),
+                                  self.config, correlator=correlator)
+
+        self.assertTrue(isinstance(issue, i2j.OpenIssue))
+
+
+class TestRunConcurrently(unittest.TestCase):
+
+    def test_results_keep_item_order(self):
+        self.assertEqual([2, 4, 6, 8], i2j.run_concurrently(lambda item: item * 2, [1, 2, 3, 4], 3))
+
+    def test_sequential_without_concurrency(self):
+        self.assertEqual([1], i2j.run_concurrently(lambda item: item, [1], 1))
+
+    def test_reraises_worker_errors(self):
+        def fail(item):
+            raise JIRAError()
+
+        self.assertRaises(JIRAError, i2j.run_concurrently, fail, [1, 2], 2)
+
+
+class TestParseJiraTargets(unittest.TestCase):
+
+    def setUp(self):
+        self.config = i2j.parse_and_validate_config_file(StringIO(TEMPLATE))
+
+    def test_settings_are_the_default_target(self):
+        targets = i2j.parse_jira_targets(StringIO(TEMPLATE), self.config)
+
+        self.assertEqual([i2j.DEFAULT_JIRA_TARGET], [target.name for target in targets])
+        self.assertEqual(ANY_URL, targets[0].config['url'])
+
+    def test_jira_sections_override_settings(self):
+        config_file = TEMPLATE + textwrap.dedent("""
+            [jira:dba]
+            url = https://jira.dba.example.com
+            username = dba
+            password = secret
+            jira_rate_limit = 5
+        """)
+
+        targets = i2j.parse_jira_targets(StringIO(config_file), self.config)
+
+        dba = targets[1]
+        self.assertEqual('dba', dba.name)
+        self.assertEqual('https://jira.dba.example.com', dba.config['url'])
+        self.assertEqual(ANY_PROJECT_KEY, dba.config['jira_project_key'])
+        self.assertEqual(5.0, dba.rate_limit)
+        self.assertEqual(0.0, targets[0].rate_limit)
+
+    def test_jira_sections_get_their_own_metadata_cache_file(self):
+        self.config['metadata_cache_file'] = '/var/cache/icinga/metadata.json'
+        config_file = TEMPLATE + textwrap.dedent("""
+            [jira:dba]
+            url = https://jira.dba.example.com
+            username = dba
+            password = secret
+
+            [jira:ops]
+            url = https://jira.ops.example.com
+            username = ops
+            password = secret
+            metadata_cache_file = /tmp/ops.json
+        """)
+
+        targets = i2j.parse_jira_targets(StringIO(config_file), self.config)
+
+        self.assertEqual(['/var/cache/icinga/metadata.json', '/var/cache/icinga/metadata.dba.json',
+                          '/tmp/ops.json'],
+                         [target.config['metadata_cache_file'] for target in targets])
+
+    def test_jira_section_without_credentials_is_rejected(self):
+        config_file = TEMPLATE + "[jira:dba]\nurl = https://jira.dba.example.com\n"
+
+        self.assertRaises(ValueError, i2j.parse_jira_targets, StringIO(config_file), self.config)
+
+
+class TestHandleEvent(unittest.TestCase):
+
+    def setUp(self):
+        self.config = i2j.parse_and_validate_config_file(StringIO(TEMPLATE))
+        self.environment = create_icinga_environment_mock()
+        self.print_patcher = patch('__builtin__.print')
+        self.print_patcher.start()
+
+    def tearDown(self):
+        self.print_patcher.stop()
+
+    def test_event_claimed_by_other_node_is_skipped(self):
+        claims = Mock()
+        claims.claim.return_value = False
+
+        with patch('icinga2jira.issue_factory') as factory:
+            i2j.handle_event(Mock(), self.config, i2j.Router([]), None, self.environment, claims)
+
+        self.assertEqual(0, factory.call_count)
+
+    def test_claim_is_completed_after_handling(self):
+        claims = Mock()
+        claims.claim.return_value = True
+
+        with patch('icinga2jira.issue_factory') as factory:
+            factory.return_value.execute.return_value = []
+            i2j.handle_event(Mock(), self.config, i2j.Router([]), None, self.environment, claims)
+
+        claims.complete.assert_called_with(self.environment)
+        self.assertEqual(0, claims.release.call_count)
+
+    def test_claim_is_released_when_handling_fails(self):
+        claims = Mock()
+        claims.claim.return_value = True
+
+        with patch('icinga2jira.issue_factory') as factory:
+            factory.return_value.execute.side_effect = JIRAError()
+            self.assertRaises(SystemExit, i2j.handle_event,
+                              Mock(), self.config, i2j.Router([]), None, self.environment, claims)
+
+        claims.release.assert_called_with(self.environment)
+
+    def test_event_handler_returns_none_for_claimed_event(self):
+        claims = Mock()
+        claims.claim.return_value = False
+        handler = i2j.EventHandler(Mock(), self.config, i2j.Router([]), None, claims)
+
+        self.assertEqual(None, handler.handle(self.environment))
+
+    def test_event_handler_records_audit_log(self):
+        handler = i2j.EventHandler(Mock(), self.config, i2j.Router([]), None)
+        handler.audit_log = Mock()
+
+        with patch('icinga2jira.issue_factory') as factory:
+            factory.return_value.execute.return_value = ['issue']
+            handler.handle(self.environment)
+
+        args = handler.audit_log.record.call_args[0]
+        self.assertEqual((self.environment, ['issue']), args[:2])
+        self.assertEqual('ok', args[3])
+
+    def test_event_handler_takes_over_overdue_storm_flush(self):
+        jira = Mock()
+        handler = i2j.EventHandler(jira, self.config, i2j.Router([]), None)
+        handler.storm = Mock()
+        handler.storm.route_storms.return_value = [handler.storm]
+        handler.storm.flush_overdue.side_effect = JIRAError()
+
+        with patch('icinga2jira.issue_factory') as factory:
+            factory.return_value.execute.return_value = []
+            self.assertEqual([], handler.handle(self.environment))
+
+        handler.storm.flush_overdue.assert_called_with(jira)
+
+    def test_scheduled_event_handler_does_not_wait_in_workers(self):
+        config = dict(self.config, state_db=':memory:', host_correlation='true',
+                      storm_threshold='5')
+
+        handler = i2j.EventHandler(Mock(), config, i2j.Router([]), i2j.TicketIndex(':memory:'),
+                                   scheduled=True)
+
+        self.assertTrue(handler.comment_buffer.scheduled)
+        self.assertTrue(handler.storm.scheduled)
+        self.assertEqual(0, handler.correlator.delay)
+
+    def test_event_handler_flushes_scheduled_comments_and_storm_summary(self):
+        jira = Mock()
+        handler = i2j.EventHandler(jira, self.config, i2j.Router([]), None, scheduled=True)
+        handler.comment_buffer = Mock()
+        handler.storm = Mock()
+        handler.storm.route_storms.return_value = [handler.storm]
+        handler.storm.flush_due.side_effect = JIRAError()
+
+        handler.flush_scheduled()
+
+        handler.comment_buffer.flush_pending.assert_called_with(jira)
+        handler.storm.flush_due.assert_called_with(jira)
+
+    def test_event_handler_reraises_after_releasing_claim(self):
+        claims = Mock()
+        claims.claim.return_value = True
+        handler = i2j.EventHandler(Mock(), self.config, i2j.Router([]), None, claims)
+
+        with patch('icinga2jira.issue_factory') as factory:
+            factory.return_value.execute.side_effect = JIRAError()
+            self.assertRaises(JIRAError, handler.handle, self.environment)
+
+        claims.release.assert_called_with(self.environment)
+
+
 class TestJIRAUsage(unittest.TestCase):
 
     def setUp(self):